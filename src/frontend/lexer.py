@@ -1,4 +1,6 @@
 from enum import Enum, auto
+from typing import Iterator
+import re
 
 
 class TokenType(Enum):
@@ -44,97 +46,94 @@ KEYWORDS = {
 
 
 class Token:
-    def __init__(self, type, value):
+    def __init__(self, type, value, line: int = 0, column: int = 0):
         self.type = type
         self.value = value
+        self.line = line
+        self.column = column
 
     def __str__(self):
         return f'{self.type.name}: {self.value}'
 
     def __repr__(self):
-        return f'<Token: type = {self.type.name}, value = {self.value}>'
+        return f'<Token: type = {self.type.name}, value = {self.value}, ' \
+            f'line = {self.line}, column = {self.column}>'
+
+
+SINGLE_CHAR_TOKENS = {
+    '\n': TokenType.EOL,
+    ';': TokenType.EOL,
+    '=': TokenType.Equals,
+    '(': TokenType.OpenParen,
+    ')': TokenType.CloseParen,
+    ',': TokenType.Comma,
+    '+': TokenType.BinaryOperator,
+    '-': TokenType.BinaryOperator,
+    '*': TokenType.BinaryOperator,
+    '/': TokenType.BinaryOperator,
+}
+
+TOKEN_PATTERN = re.compile(r"""
+    [ \t\r]*
+    (?:
+        (?P<number>\d+)
+      | (?P<comment>(?i:rem)(?![^\W_])[^\n;]*(?P<comment_end>[\n;]|\Z))
+      | (?P<identifier>[^\W\d_][^\W_]*)
+      | (?P<single>[\n;=(),+\-*/])
+      | (?P<unknown>.)
+      | \Z
+    )
+""", re.VERBOSE | re.DOTALL)
 
 
 class Lexer:
     def __init__(self, text: str):
         self.text = text
-        self.pos = -1
-        self.ch = ''
-        self.next_char()
-
-    def next_char(self):
-        self.pos += 1
-        self.ch = self.text[self.pos] if self.pos < len(self.text) else ''
-
-    def eat_whitespace(self):
-        while self.ch != '':
-            if self.ch in [' ', '\t', '\r']:
-                self.next_char()
-            else:
-                break
-
-    def get_next_token(self):
-        while self.ch != '':
-            self.eat_whitespace()
-
-            SINGLE_CHAR_TOKENS = {
-                TokenType.EOL: ['\n'],
-                TokenType.Equals: ['='],
-                TokenType.OpenParen: ['('],
-                TokenType.CloseParen: [')'],
-                TokenType.Comma: [','],
-                TokenType.BinaryOperator: ['+', '-', '*', '/'],
-            }
-
-            for token_type, chars in SINGLE_CHAR_TOKENS.items():
-                if self.ch in chars:
-                    token = Token(token_type, self.ch)
-                    self.next_char()
-                    return token
-
-            if self.ch.isdigit():
-                return Token(TokenType.Number, self.get_number())
-
-            if self.ch.isalpha():
-                identifier = self.get_identifier()
-
-                if identifier == 'rem':
-                    while self.ch != '\n':
-                        self.next_char()
-                    self.next_char()
-                    continue
-
-                if identifier in KEYWORDS:
-                    return Token(KEYWORDS[identifier], identifier)
-
-                return Token(TokenType.Identifier, identifier)
-
-            raise Exception(f'Unknown token: {self.ch}')
-
-        return Token(TokenType.EOF, '')
-
-    def get_number(self):
-        result = ''
-        while self.ch.isdigit():
-            result += self.ch
-            self.next_char()
-        return int(result)
-
-    def get_identifier(self):
-        result = ''
-        while self.ch.isalnum():
-            result += self.ch
-            self.next_char()
-        return result.lower()
-
-    def tokenize(self):
-        tokens = []
-
-        self.text = self.text.replace(';', '\n')
-
-        while True:
-            token = self.get_next_token()
-            tokens.append(token)
-            if token.type == TokenType.EOF:
-                break
-        return tokens
+
+    def tokens(self) -> Iterator[Token]:
+        """
+        Lazily yields tokens of the source text, finishing with an EOF token.
+        Semicolons are treated as line separators and REM comments run up to
+        and including the end of line.
+        """
+        line = 1
+        line_start = 0
+
+        for m in TOKEN_PATTERN.finditer(self.text):
+            kind = m.lastgroup
+
+            if kind == 'single':
+                value = m.group(kind)
+                start = m.start(kind)
+                if value == '\n':
+                    yield Token(TokenType.EOL, value, line,
+                                start - line_start + 1)
+                    line += 1
+                    line_start = start + 1
+                else:
+                    yield Token(SINGLE_CHAR_TOKENS[value],
+                                '\n' if value == ';' else value, line,
+                                start - line_start + 1)
+
+            elif kind == 'identifier':
+                identifier = m.group(kind).lower()
+                yield Token(KEYWORDS.get(identifier, TokenType.Identifier),
+                            identifier, line, m.start(kind) - line_start + 1)
+
+            elif kind == 'number':
+                yield Token(TokenType.Number, int(m.group(kind)), line,
+                            m.start(kind) - line_start + 1)
+
+            elif kind == 'comment':
+                if m.group('comment_end') == '\n':
+                    line += 1
+                    line_start = m.end()
+
+            elif kind == 'unknown':
+                raise Exception(f'Unknown token: {m.group(kind)} (line {line}, '
+                                f'column {m.start(kind) - line_start + 1})')
+
+        yield Token(TokenType.EOF, '', line, len(self.text) - line_start + 1)
+
+    def tokenize(self) -> list[Token]:
+        return list(self.tokens())
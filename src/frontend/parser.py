@@ -10,6 +10,7 @@ from frontend.tpv_ast import CallProcedure, IntDeclaration, Program, \
 class Parser:
     def __init__(self, source: str):
         self.tokens = Lexer(source).tokenize()
+        self.pos = 0
         self.program = Program()
 
     def parse(self) -> Program:
@@ -20,32 +21,45 @@ class Parser:
 
     def eat(self, token_type: Optional[TokenType] = None,
             error_message: Optional[str] = None) -> Token:
-        if not self.tokens:
+        if self.pos >= len(self.tokens):
             raise Exception('Unexpected end of input')
 
-        token = self.tokens.pop(0)
+        token = self.tokens[self.pos]
+        self.pos += 1
 
         if token_type and token.type != token_type:
-            raise Exception(error_message or f'Unexpected token: {token}')
+            raise Exception(self.error_at(
+                token, error_message or f'Unexpected token: {token}'))
 
         return token
 
     def at(self) -> Token:
-        if not self.tokens:
+        if self.pos >= len(self.tokens):
             raise Exception('Unexpected end of input')
 
-        return self.tokens[0]
+        return self.tokens[self.pos]
 
     def peek(self, i: int) -> Optional[Token]:
-        return self.tokens[i] if len(self.tokens) > i else None
+        pos = self.pos + i
+        return self.tokens[pos] if pos < len(self.tokens) else None
+
+    def has_tokens(self) -> bool:
+        return self.pos < len(self.tokens)
+
+    def error_at(self, token: Token, message: str) -> str:
+        return f'{message} (line {token.line}, column {token.column})'
 
     def parse_statement(self) -> Statement:
+        start = self.at()
         statement = self.parse_statement_internal()
+        statement.line = start.line
+        statement.column = start.column
 
         if self.at().type == TokenType.EOL:
             self.eat()
         elif self.at().type != TokenType.EOF:
-            raise Exception(f'Unexpected token: {self.at()}')
+            raise Exception(self.error_at(
+                self.at(), f'Unexpected token: {self.at()}'))
 
         return statement
 
@@ -203,7 +217,7 @@ class Parser:
     def parse_additive_expression(self) -> Expression:
         left = self.parse_multiplicative_expression()
 
-        while self.tokens and self.at().value in ('+', '-'):
+        while self.has_tokens() and self.at().value in ('+', '-'):
             operator = self.eat().value
             right = self.parse_multiplicative_expression()
             left = BinaryExpression(operator, left, right)
@@ -213,7 +227,7 @@ class Parser:
     def parse_multiplicative_expression(self) -> Expression:
         left = self.parse_call_member_expression()
 
-        while self.tokens and self.at().value in ('*', '/'):
+        while self.has_tokens() and self.at().value in ('*', '/'):
             operator = self.eat().value
             right = self.parse_call_member_expression()
             left = BinaryExpression(operator, left, right)
@@ -225,7 +239,8 @@ class Parser:
 
         if self.at().type == TokenType.OpenParen:
             if not isinstance(member, Identifier):
-                raise Exception(f'Unexpected "(" after {member}')
+                raise Exception(self.error_at(
+                    self.at(), f'Unexpected "(" after {member}'))
 
             return self.parse_call_expression(member)
 
@@ -255,7 +270,8 @@ class Parser:
         if self.at().type == TokenType.OpenParen:
             return self.parse_parenthesized_expression()
 
-        raise Exception(f'Unexpected token: {self.at()}')
+        raise Exception(self.error_at(
+            self.at(), f'Unexpected token: {self.at()}'))
 
     def parse_negation(self) -> Expression:
         self.eat()
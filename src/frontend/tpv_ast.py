@@ -1,13 +1,22 @@
 from abc import ABC, abstractmethod
 
 
+# source position attributes, not part of the tree's structure
+POSITION = ("line", "column")
+
+
 class Statement(ABC):
+    # position of the first token, set by the parser, 0 when unknown
+    line = 0
+    column = 0
+
     @abstractmethod
     def __init__(self):
         pass
 
     def __repr__(self):
-        items = ("%s = %r" % (k, v) for k, v in self.__dict__.items())
+        items = ("%s = %r" % (k, v) for k, v in self.__dict__.items()
+                 if k not in POSITION)
         return "<%s: {%s}>" % (self.__class__.__name__, ', '.join(items))
 
 
@@ -126,3 +135,86 @@ class PushStack(Statement):
 class PopStack(Statement):
     def __init__(self, vars: list[Identifier]):
         self.vars = vars
+
+
+def format_expression(expression: Expression) -> str:
+    """
+    Formats an expression in infix notation, parenthesizing every nested
+    operation so the tree structure stays visible.
+    """
+    if isinstance(expression, NumericLiteral):
+        return repr(expression.value)
+
+    if isinstance(expression, Identifier):
+        return expression.name
+
+    if isinstance(expression, BinaryExpression):
+        operands = []
+        for operand in (expression.left, expression.right):
+            text = format_expression(operand)
+            if isinstance(operand, (BinaryExpression, UnaryExpression)):
+                text = f"({text})"
+            operands.append(text)
+
+        return f" {expression.operator} ".join(operands)
+
+    if isinstance(expression, UnaryExpression):
+        return f"{expression.operator}({format_expression(expression.expression)})"
+
+    if isinstance(expression, CallFn):
+        return f"{expression.name}({', '.join(map(format_expression, expression.args))})"
+
+    return repr(expression)
+
+
+def dump(node: Statement, indent: int = 0) -> str:
+    """
+    Formats a program or statement as an indented tree, one statement per
+    line with its expressions in infix notation.
+    """
+    prefix = "  " * indent
+    name = node.__class__.__name__
+
+    def block(statements: list[Statement]) -> list[str]:
+        return [dump(statement, indent + 1) for statement in statements]
+
+    if isinstance(node, Program):
+        return "\n".join(dump(statement, indent)
+                         for statement in node.statements)
+
+    if isinstance(node, Expression):
+        return f"{prefix}{format_expression(node)}"
+
+    if isinstance(node, (IntDeclaration, PopStack)):
+        return f"{prefix}{name} {', '.join(map(str, node.vars))}"
+
+    if isinstance(node, PushStack):
+        return f"{prefix}{name} {', '.join(map(format_expression, node.args))}"
+
+    if isinstance(node, Command):
+        args = ', '.join(map(format_expression, node.args))
+        return f"{prefix}{name} {node.command} {args}".rstrip()
+
+    if isinstance(node, Assignment):
+        return f"{prefix}{name} {node.identifier} = " \
+            f"{format_expression(node.expression)}"
+
+    if isinstance(node, (CallProcedure, ProcedureDeclaration)):
+        lines = [f"{prefix}{name} {node.name}"]
+        if isinstance(node, ProcedureDeclaration):
+            lines += block(node.body)
+        return "\n".join(lines)
+
+    if isinstance(node, WhileBlock):
+        return "\n".join([f"{prefix}{name} {format_expression(node.condition)}"]
+                         + block(node.body))
+
+    if isinstance(node, IfBlock):
+        lines = [f"{prefix}{name} {format_expression(node.condition)}"]
+        lines += block(node.body)
+        if node.else_body:
+            lines.append(f"{prefix}else")
+            lines += block(node.else_body)
+        return "\n".join(lines)
+
+    return f"{prefix}{name}"
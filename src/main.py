@@ -1,7 +1,23 @@
 #!/usr/bin/env python3
 
 import os
-from runtime.interpreter import Interpreter
+import signal
+import sys
+import time
+from multiprocessing import Pool
+from typing import Optional
+from runtime.interpreter import Interpreter, ENGINES
+from runtime.enviroment import RASTERIZERS
+from frontend.tpv_ast import dump
+from runtime.tiled_canvas import DEFAULT_TILE_SIZE, TILED_FORMATS
+from runtime.program_cache import ProgramCache
+from runtime.memo import DEFAULT_MAX_ENTRIES
+from optimizer.inlining import DEFAULT_INLINE_SIZE
+from runtime.profiler import Profiler
+from runtime.exceptions import ValidationError
+from runtime.limits import Limits
+from output.writer import FORMATS, ImageWriter
+from output.manifest import RenderManifest
 
 
 def valid_path(string):
@@ -11,40 +27,413 @@ def valid_path(string):
         raise Exception(f'{string} is not a valid path')
 
 
+def positive_int(string):
+    value = int(string)
+    if value < 1:
+        raise Exception(f'{string} is not a positive number')
+
+    return value
+
+
+def process_file(filename: str, args, writer: ImageWriter,
+                 show: bool) -> Optional[str]:
+    """
+    Renders one program, returns the dumped AST instead with --dump-ast, or
+    the profile report with --profile. Images are queued on the writer,
+    except in batch mode where the worker process saves them itself and
+    when profiling, which times the encoding.
+    """
+    if args.no_cache or args.inline_report:
+        # the report is made while optimizing, which a cache hit skips
+        cache = False
+    elif args.cache_dir is not None:
+        cache = ProgramCache(args.cache_dir)
+    else:
+        cache = True
+
+    profiler = Profiler() if args.profile else None
+    limits = execution_limits(args)
+
+    with open(filename, 'r') as file:
+        source = file.read()
+        interpreter = Interpreter(source, args.engine, args.optimize,
+                                  record=args.record,
+                                  rasterizer=args.rasterizer,
+                                  palette=args.palette, cache=cache,
+                                  profiler=profiler, limits=limits,
+                                  memoize=args.memo_size if args.memoize
+                                  else False,
+                                  inline_size=args.inline_size,
+                                  fast=args.fast)
+
+    if args.dump_ast:
+        return dump(interpreter.ast)
+
+    if args.check:
+        problems = interpreter.validate()
+        if problems:
+            raise ValidationError(problems)
+        return 'No problems found'
+
+    if args.rasterizer == 'tiled':
+        # batch workers are daemons and cannot start tile workers
+        jobs = 1 if args.jobs is not None else args.tile_jobs
+        interpreter.render_tiled(writer.path(filename), args.format,
+                                 args.tile_size, jobs, args.compression)
+        return run_report(interpreter, profiler, filename, source,
+                          args.inline_report)
+
+    im = interpreter.run()
+
+    if profiler is not None:
+        with profiler.phase('encode'):
+            writer.save(im, writer.path(filename))
+    elif args.jobs is None:
+        writer.submit(im, writer.path(filename))
+    else:
+        writer.save(im, writer.path(filename))
+
+    if show:
+        try:
+            im.show()
+        except Exception:
+            pass
+
+    return run_report(interpreter, profiler, filename, source,
+                      args.inline_report)
+
+
+def execution_limits(args) -> Optional[Limits]:
+    limits = (args.max_statements, args.deadline, args.max_stack,
+              args.max_call_depth, args.max_primitives)
+    if all(limit is None for limit in limits):
+        return None
+
+    return Limits(*limits)
+
+
+def run_report(interpreter: Interpreter, profiler: Optional[Profiler],
+               filename: str, source: str,
+               inlining: bool = False) -> Optional[str]:
+    """
+    The inlined procedures with --inline-report, the memoization
+    statistics with --memoize and the profile with --profile.
+    """
+    reports = []
+
+    if inlining and interpreter.optimizer is not None:
+        reports.append(interpreter.optimizer.inlining.report())
+    if interpreter.memo is not None:
+        reports.append(interpreter.memo.report())
+
+    profile = profile_report(profiler, filename, source)
+    if profile is not None:
+        reports.append(profile)
+
+    return '\n\n'.join(reports) if reports else None
+
+
+def profile_report(profiler: Optional[Profiler], filename: str,
+                   source: str) -> Optional[str]:
+    """
+    Writes the collapsed stacks of the profile next to the program and
+    returns the text report.
+    """
+    if profiler is None:
+        return None
+
+    if not profiler.stacks:
+        return f'{profiler.report(source)}\n\nLines and procedures are ' \
+            f'only profiled by the tree engine'
+
+    stacks = os.path.splitext(filename)[0] + '.folded'
+    with open(stacks, 'w') as file:
+        file.write(profiler.collapsed())
+
+    return f'{profiler.report(source)}\n\nCollapsed stacks in {stacks}'
+
+
+def timeout_handler(signum, frame):
+    raise TimeoutError('timed out')
+
+
+def batch_worker(task: tuple) -> tuple[str, Optional[str], Optional[str],
+                                       float]:
+    """
+    Renders one file in a pool process. Returns the file name, the output
+    to print, the error message on failure and the time it took.
+    """
+    filename, args = task
+    start = time.perf_counter()
+    writer = ImageWriter(args.format, args.compression)
+
+    # the alarm interrupts the interpreter loop wherever it is
+    if args.timeout and hasattr(signal, 'setitimer'):
+        signal.signal(signal.SIGALRM, timeout_handler)
+        signal.setitimer(signal.ITIMER_REAL, args.timeout)
+
+    try:
+        output = process_file(filename, args, writer, show=False)
+        error = None
+    except TimeoutError:
+        output = None
+        error = f'timed out after {args.timeout:g}s'
+    except Exception as e:
+        output = None
+        error = str(e) or e.__class__.__name__
+    finally:
+        if args.timeout and hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    return filename, output, error, time.perf_counter() - start
+
+
+def render_options(args) -> dict:
+    """The options that change the rendered images, for the manifest."""
+    return {
+        'engine': args.engine,
+        'optimize': args.optimize,
+        'record': args.record,
+        'rasterizer': args.rasterizer,
+        'palette': args.palette,
+        'format': args.format,
+        'compression': args.compression,
+    }
+
+
+def stale_files(files: list[str], manifest: RenderManifest,
+                writer: ImageWriter, verify: bool) -> list[str]:
+    """Returns the files whose outputs are not up to date."""
+    stale = []
+
+    for filename in files:
+        try:
+            reason = manifest.check(filename, writer.path(filename), verify)
+        except OSError as e:
+            reason = str(e)
+
+        if reason is not None:
+            stale.append(filename)
+            if verify and reason.startswith('output'):
+                print(f'{filename}: {reason}')
+
+    print(f'{len(files) - len(stale)} of {len(files)} file(s) up to date, '
+          f'rendering {len(stale)}')
+    return stale
+
+
+def update_manifest(manifest: RenderManifest, writer: ImageWriter,
+                    rendered: list[str], failed: list[str]):
+    for filename in failed:
+        manifest.forget(filename)
+
+    for filename in rendered:
+        try:
+            manifest.record(filename, writer.path(filename))
+        except OSError:
+            manifest.forget(filename)
+
+    try:
+        manifest.save()
+    except OSError as e:
+        print(f'Could not write {manifest.path}: {e}')
+
+
+def run_batch(files: list[str], args,
+              manifest: Optional[RenderManifest] = None) -> int:
+    """
+    Renders the files in a pool of processes. Statuses are printed in the
+    order of the files as soon as they are known, viewers are never opened.
+    """
+    rendered = []
+    failures = []
+    start = time.perf_counter()
+    tasks = [(filename, args) for filename in files]
+
+    with Pool(min(args.jobs, max(len(files), 1))) as pool:
+        for filename, output, error, seconds in \
+                pool.imap(batch_worker, tasks, chunksize=1):
+            if error is None:
+                rendered.append(filename)
+                print(f'ok      {filename} ({seconds:.2f}s)')
+                if output is not None:
+                    print(output)
+            else:
+                failures.append(filename)
+                print(f'FAILED  {filename} ({seconds:.2f}s): {error}')
+
+            sys.stdout.flush()
+
+    if manifest is not None:
+        update_manifest(manifest, ImageWriter(args.format, args.compression),
+                        rendered, failures)
+
+    print(f'{len(rendered)} of {len(files)} file(s) processed, '
+          f'{len(failures)} failed in {time.perf_counter() - start:.2f}s')
+
+    return 1 if failures else 0
+
+
 def main():
     import argparse
 
     parser = argparse.ArgumentParser()
     parser.add_argument('path', type=valid_path,
                         help='Path to a file or directory')
+    parser.add_argument('--engine', choices=ENGINES, default='tree',
+                        help='Execution engine (default: tree)')
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help='Run the optimization passes before execution')
+    parser.add_argument('--inline-size', type=int,
+                        default=DEFAULT_INLINE_SIZE,
+                        help='With -O, inline procedures of at most this '
+                             'many statements, 0 disables inlining '
+                             f'(default: {DEFAULT_INLINE_SIZE})')
+    parser.add_argument('--inline-report', action='store_true',
+                        help='With -O, report the inlined procedures and '
+                             'why others were not, bypassing the cache')
+    parser.add_argument('--record', action='store_true',
+                        help='Collect primitives into a culled display list '
+                             'before drawing them')
+    parser.add_argument('--rasterizer', choices=RASTERIZERS, default='pillow',
+                        help='Drawing backend (default: pillow)')
+    parser.add_argument('--palette', action='store_true',
+                        help='Draw on a one byte per pixel palette canvas')
+    parser.add_argument('--check', action='store_true',
+                        help='Validate the program instead of rendering, '
+                             'reporting every unknown command, function, '
+                             'procedure and variable, wrong argument count '
+                             'and color used as a number')
+    parser.add_argument('--fast', action='store_true',
+                        help='Validate the program before running it and '
+                             'skip the checks it makes unnecessary')
+    parser.add_argument('--dump-ast', action='store_true',
+                        help='Print the (optimized) AST instead of rendering')
+    parser.add_argument('--profile', action='store_true',
+                        help='Report the time of every phase, command, '
+                             'procedure and line (lines and procedures with '
+                             'the tree engine) and write collapsed stacks '
+                             'for flame graphs')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always parse, bypassing the compiled program '
+                             'cache')
+    parser.add_argument('--cache-dir',
+                        help='Directory of the compiled program cache '
+                             '(default: $TPV_CACHE_DIR or '
+                             '~/.cache/tpv-interpreter)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only render the files of a directory that '
+                             'changed since the last incremental run')
+    parser.add_argument('--verify', action='store_true',
+                        help='With --incremental, hash the existing outputs '
+                             'and render again the ones that do not match')
+    parser.add_argument('--max-statements', type=positive_int,
+                        help='Stop programs after this many statements, '
+                             'counted per loop iteration and procedure call')
+    parser.add_argument('--deadline', type=float,
+                        help='Stop programs running longer than this many '
+                             'seconds')
+    parser.add_argument('--max-stack', type=positive_int,
+                        help='Maximum number of values on the PUSH stack')
+    parser.add_argument('--max-call-depth', type=positive_int,
+                        help='Maximum depth of procedure calls')
+    parser.add_argument('--max-primitives', type=positive_int,
+                        help='Maximum number of drawn lines, rects and ovals')
+    parser.add_argument('--memoize', action='store_true',
+                        help='Replay calls of side effect free procedures '
+                             'seen with the same inputs (tree engine only) '
+                             'and report the hit rate')
+    parser.add_argument('--memo-size', type=positive_int,
+                        default=DEFAULT_MAX_ENTRIES,
+                        help='Calls remembered by --memoize (default: '
+                             f'{DEFAULT_MAX_ENTRIES})')
+    parser.add_argument('-j', '--jobs', type=positive_int,
+                        help='Render in a pool of N processes, without '
+                             'opening viewers')
+    parser.add_argument('--timeout', type=float,
+                        help='Seconds one file may take with --jobs')
+    parser.add_argument('--format', choices=FORMATS, default='png',
+                        help='Output image format (default: png)')
+    parser.add_argument('--compression', type=int,
+                        help='Compression level, 0-9 for png (1 is fast), '
+                             '0-6 for lossless webp')
+    parser.add_argument('--writers', type=positive_int, default=1,
+                        help='Background threads encoding images (default: '
+                             '1)')
+    parser.add_argument('--tile-size', type=positive_int,
+                        default=DEFAULT_TILE_SIZE,
+                        help='Tiles of the tiled rasterizer hold about the '
+                             f'square of this many pixels (default: '
+                             f'{DEFAULT_TILE_SIZE})')
+    parser.add_argument('--tile-jobs', type=positive_int,
+                        default=os.cpu_count() or 1,
+                        help='Processes rasterizing tiles (default: number '
+                             'of CPUs)')
 
     args = parser.parse_args()
 
+    if args.inline_report and not args.optimize:
+        parser.error('--inline-report needs -O')
+
     files = []
 
     if os.path.isfile(args.path):
         files.append(args.path)
     elif os.path.isdir(args.path):
-        for filename in os.listdir(args.path):
+        for filename in sorted(os.listdir(args.path)):
             if filename.lower().endswith('.tpv'):
                 files.append(os.path.join(args.path, filename))
 
+    if args.rasterizer == 'tiled' and args.format not in TILED_FORMATS:
+        print(f'The tiled rasterizer writes only '
+              f'{", ".join(TILED_FORMATS)} images')
+        return 2
+
+    try:
+        writer = ImageWriter(args.format, args.compression, args.writers)
+    except Exception as e:
+        print(e)
+        return 2
+
+    manifest = None
+    if (args.incremental or args.verify) and os.path.isdir(args.path) \
+            and not args.dump_ast and not args.check:
+        manifest = RenderManifest(args.path, render_options(args))
+        files = stale_files(files, manifest, writer, args.verify)
+
+    if args.jobs is not None:
+        writer.close()
+        return run_batch(files, args, manifest)
+
+    rendered = []
+    invalid = []
+
     for filename in files:
-        with open(filename, 'r') as file:
-            print(f'Processing {filename}...')
-            try:
-                interpreter = Interpreter(file.read())
-                im = interpreter.run()
-
-                im.save(os.path.splitext(filename)[0] + '.png')
-                try:
-                    im.show()
-                except Exception:
-                    pass
-            except Exception as e:
-                print(f'Code for {filename} is invalid: {e}')
-            print(f'Done processing {filename}!')
+        print(f'Processing {filename}...')
+        try:
+            output = process_file(filename, args, writer, show=True)
+            if output is not None:
+                print(output)
+            rendered.append(filename)
+        except Exception as e:
+            invalid.append(filename)
+            print(f'Code for {filename} is invalid: {e}')
+        print(f'Done processing {filename}!')
+
+    failures = writer.close()
+    for path, error in failures:
+        print(f'Could not write {path}: {error}')
+
+    if manifest is not None:
+        unwritten = {path for path, _ in failures}
+        update_manifest(manifest, writer,
+                        [filename for filename in rendered
+                         if writer.path(filename) not in unwritten],
+                        invalid + [filename for filename in rendered
+                                   if writer.path(filename) in unwritten])
+
+    return 1 if failures else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,355 @@
+from typing import Iterator, Optional
+from frontend.tpv_ast import Assignment, BinaryExpression, CallFn, \
+    CallProcedure, Expression, Identifier, IfBlock, PopStack, \
+    ProcedureDeclaration, Program, PushStack, IntDeclaration, Return, \
+    Statement, Command, UnaryExpression, WhileBlock
+from runtime.limits import PRIMITIVE_COMMANDS
+
+# commands that never let execution continue past them
+TERMINATING_COMMANDS = {"stop"}
+
+
+def procedure_declarations(program: Program) -> dict[str, ProcedureDeclaration]:
+    """Procedures callable by CALL, later declarations win."""
+    procedures = {}
+
+    for statement in program.statements:
+        if isinstance(statement, ProcedureDeclaration):
+            procedures[statement.name.name] = statement
+
+    return procedures
+
+
+def walk_statements(statements: list[Statement]) -> Iterator[Statement]:
+    """
+    Yields the statements and, recursively, the bodies of their IF and
+    WHILE blocks. Procedure declarations are yielded but not entered.
+    """
+    for statement in statements:
+        yield statement
+
+        if isinstance(statement, IfBlock):
+            yield from walk_statements(statement.body)
+            yield from walk_statements(statement.else_body)
+        elif isinstance(statement, WhileBlock):
+            yield from walk_statements(statement.body)
+
+
+def terminates(statements: list[Statement]) -> bool:
+    """Whether running the block never reaches its end."""
+    for statement in statements:
+        if isinstance(statement, Return):
+            return True
+
+        if isinstance(statement, Command) and \
+                statement.command.name in TERMINATING_COMMANDS:
+            return True
+
+        if isinstance(statement, IfBlock) and \
+                terminates(statement.body) and \
+                terminates(statement.else_body):
+            return True
+
+    return False
+
+
+def statement_expressions(statement: Statement) -> list[Expression]:
+    """The expressions evaluated directly by a statement."""
+    if isinstance(statement, Expression):
+        return [statement]
+
+    if isinstance(statement, (Command, PushStack)):
+        return statement.args
+
+    if isinstance(statement, Assignment):
+        return [statement.expression]
+
+    if isinstance(statement, (IfBlock, WhileBlock)):
+        return [statement.condition]
+
+    return []
+
+
+def walk_expression(expression: Expression) -> Iterator[Expression]:
+    yield expression
+
+    if isinstance(expression, BinaryExpression):
+        yield from walk_expression(expression.left)
+        yield from walk_expression(expression.right)
+    elif isinstance(expression, UnaryExpression):
+        yield from walk_expression(expression.expression)
+    elif isinstance(expression, CallFn):
+        for arg in expression.args:
+            yield from walk_expression(arg)
+
+
+def read_variables(expression: Expression) -> set[str]:
+    return {node.name for node in walk_expression(expression)
+            if isinstance(node, Identifier)}
+
+
+def program_statements(program: Program) -> list[Statement]:
+    """The statements of the main program and of the callable procedures."""
+    statements = list(walk_statements(program.statements))
+    for procedure in procedure_declarations(program).values():
+        statements.extend(walk_statements(procedure.body))
+
+    return statements
+
+
+def string_variables(program: Program, vars: dict) -> set[str]:
+    """
+    Variables that may hold a color name instead of a number, starting from
+    those of `vars` that do. Colors only spread by assigning a variable to
+    another and through the stack, arithmetic on them fails.
+    """
+    strings = {name for name, value in vars.items()
+               if isinstance(value, str)}
+    statements = program_statements(program)
+
+    changed = True
+    while changed:
+        changed = False
+        stack_has_strings = any(
+            isinstance(arg, Identifier) and arg.name in strings
+            for statement in statements
+            if isinstance(statement, PushStack)
+            for arg in statement.args)
+
+        for statement in statements:
+            targets = []
+
+            if isinstance(statement, Assignment) and \
+                    isinstance(statement.expression, Identifier) and \
+                    statement.expression.name in strings:
+                targets = [statement.identifier.name]
+            elif isinstance(statement, PopStack) and stack_has_strings:
+                targets = [var.name for var in statement.vars]
+
+            for name in targets:
+                if name not in strings:
+                    strings.add(name)
+                    changed = True
+
+    return strings
+
+
+class Effects():
+    """What executing a piece of code may change."""
+
+    def __init__(self):
+        self.assigned = set()
+        self.declared = set()
+        self.uses_stack = False
+        self.calls = set()
+        # set when a called procedure does not exist
+        self.unknown_call = False
+
+    def update(self, other: "Effects"):
+        self.assigned |= other.assigned
+        self.declared |= other.declared
+        self.uses_stack |= other.uses_stack
+        self.calls |= other.calls
+        self.unknown_call |= other.unknown_call
+
+
+def block_effects(statements: list[Statement]) -> Effects:
+    """Direct effects of a block, not following CALLs."""
+    effects = Effects()
+
+    for statement in walk_statements(statements):
+        if isinstance(statement, Assignment):
+            effects.assigned.add(statement.identifier.name)
+        elif isinstance(statement, PopStack):
+            effects.assigned.update(var.name for var in statement.vars)
+            effects.uses_stack = True
+        elif isinstance(statement, PushStack):
+            effects.uses_stack = True
+        elif isinstance(statement, IntDeclaration):
+            effects.assigned.update(var.name for var in statement.vars)
+            effects.declared.update(var.name for var in statement.vars)
+        elif isinstance(statement, CallProcedure):
+            effects.calls.add(statement.name.name)
+
+    return effects
+
+
+def transitive_effects(statements: list[Statement],
+                       procedures: dict[str, ProcedureDeclaration]) -> Effects:
+    """Effects of a block including everything reachable through CALL."""
+    effects = block_effects(statements)
+    pending = list(effects.calls)
+    seen = set()
+
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+
+        if name not in procedures:
+            effects.unknown_call = True
+            continue
+
+        callee = block_effects(procedures[name].body)
+        pending.extend(callee.calls - seen)
+        effects.update(callee)
+
+    return effects
+
+
+def reachable_procedures(program: Program) -> set[str]:
+    """Names of procedures reachable through CALL from the main program."""
+    procedures = procedure_declarations(program)
+    main = [statement for statement in program.statements
+            if not isinstance(statement, ProcedureDeclaration)]
+
+    return transitive_effects(main, procedures).calls & procedures.keys()
+
+
+class ProcedureSummary():
+    """
+    What calling a procedure reads, changes and draws, including everything
+    the procedures it calls do.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.reads = set()
+        self.writes = set()
+        # written by every call, whatever path it takes through its own body
+        self.definite_writes = set()
+        self.declares = set()
+        # stack effect
+        self.pushes = False
+        self.pops = False
+        self.reads_top = False
+        # commands drawing a primitive, and any other commands
+        self.primitives = set()
+        self.commands = set()
+        self.functions = set()
+        self.calls = set()
+        self.unknown_call = False
+
+    def update(self, other: "ProcedureSummary"):
+        self.reads |= other.reads
+        self.writes |= other.writes
+        self.declares |= other.declares
+        self.pushes |= other.pushes
+        self.pops |= other.pops
+        self.reads_top |= other.reads_top
+        self.primitives |= other.primitives
+        self.commands |= other.commands
+        self.functions |= other.functions
+        self.calls |= other.calls
+        self.unknown_call |= other.unknown_call
+
+    def impurity(self, pure_functions: set[str]) -> Optional[str]:
+        """
+        Why the effect of a call may depend on more than the values of the
+        variables it reads, None when it cannot. Pushes are fine, the values
+        pushed depend on the variables too.
+        """
+        if self.declares:
+            return f"declares {', '.join(sorted(self.declares))}"
+        if self.pops or self.reads_top:
+            return "reads the stack"
+        if self.commands:
+            return f"runs {', '.join(sorted(self.commands))}"
+        if self.functions - pure_functions:
+            return f"calls {', '.join(sorted(self.functions - pure_functions))}"
+        if self.unknown_call:
+            return "calls a missing procedure"
+
+        return None
+
+
+def definite_writes(statements: list[Statement]) -> set[str]:
+    """
+    Variables every run of the block assigns before it may return. CALLs
+    are not followed.
+    """
+    written = set()
+
+    for statement in statements:
+        if isinstance(statement, Assignment):
+            written.add(statement.identifier.name)
+        elif isinstance(statement, PopStack):
+            written.update(var.name for var in statement.vars)
+        elif isinstance(statement, IfBlock):
+            written |= definite_writes(statement.body) & \
+                definite_writes(statement.else_body)
+
+        # what follows a RETURN may not run
+        if any(isinstance(nested, Return)
+               for nested in walk_statements([statement])):
+            break
+
+    return written
+
+
+def summarize_statements(name: str,
+                         statements: list[Statement]) -> ProcedureSummary:
+    """Direct effects of a procedure body, not following CALLs."""
+    summary = ProcedureSummary(name)
+
+    for statement in walk_statements(statements):
+        for expression in statement_expressions(statement):
+            for node in walk_expression(expression):
+                if isinstance(node, Identifier):
+                    if node.name == "top":
+                        summary.reads_top = True
+                    else:
+                        summary.reads.add(node.name)
+                elif isinstance(node, CallFn):
+                    summary.functions.add(node.name.name)
+
+        if isinstance(statement, Assignment):
+            summary.writes.add(statement.identifier.name)
+        elif isinstance(statement, PopStack):
+            summary.pops = True
+            summary.writes.update(var.name for var in statement.vars)
+        elif isinstance(statement, PushStack):
+            summary.pushes = True
+        elif isinstance(statement, IntDeclaration):
+            summary.declares.update(var.name for var in statement.vars)
+        elif isinstance(statement, CallProcedure):
+            summary.calls.add(statement.name.name)
+        elif isinstance(statement, Command):
+            if statement.command.name in PRIMITIVE_COMMANDS:
+                summary.primitives.add(statement.command.name)
+            else:
+                summary.commands.add(statement.command.name)
+
+    return summary
+
+
+def summarize_procedures(program: Program) -> dict[str, ProcedureSummary]:
+    """The summary of every procedure, including the procedures it calls."""
+    procedures = procedure_declarations(program)
+    direct = {name: summarize_statements(name, procedure.body)
+              for name, procedure in procedures.items()}
+    summaries = {}
+
+    for name in procedures:
+        summary = ProcedureSummary(name)
+        pending = [name]
+        seen = set()
+
+        while pending:
+            callee = pending.pop()
+            if callee in seen:
+                continue
+            seen.add(callee)
+
+            if callee not in direct:
+                summary.unknown_call = True
+                continue
+
+            summary.update(direct[callee])
+            pending.extend(direct[callee].calls - seen)
+
+        summary.definite_writes = definite_writes(procedures[name].body)
+        summaries[name] = summary
+
+    return summaries
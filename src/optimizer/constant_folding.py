@@ -0,0 +1,102 @@
+from runtime.enviroment import Enviroment
+from frontend.tpv_ast import Assignment, BinaryExpression, CallFn, \
+    Command, Expression, IfBlock, NumericLiteral, ProcedureDeclaration, \
+    Program, PushStack, Statement, UnaryExpression, WhileBlock
+import math
+import operator
+
+BINARY_OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+
+
+class ConstantFolding():
+    """
+    Replaces subexpressions whose operands are all literals by their value,
+    including calls of the enviroment's pure functions. Operations that would
+    fail, such as division by zero, are left for run time.
+    """
+
+    def __init__(self, enviroment: Enviroment):
+        self.enviroment = enviroment
+        self.folded = 0
+
+    def run(self, program: Program) -> Program:
+        self.fold_block(program.statements)
+        return program
+
+    def fold_block(self, statements: list[Statement]):
+        for statement in statements:
+            self.fold_statement(statement)
+
+    def fold_statement(self, statement: Statement):
+        if isinstance(statement, IfBlock):
+            statement.condition = self.fold(statement.condition)
+            self.fold_block(statement.body)
+            self.fold_block(statement.else_body)
+            return
+
+        if isinstance(statement, WhileBlock):
+            statement.condition = self.fold(statement.condition)
+            self.fold_block(statement.body)
+            return
+
+        if isinstance(statement, ProcedureDeclaration):
+            self.fold_block(statement.body)
+            return
+
+        if isinstance(statement, Assignment):
+            statement.expression = self.fold(statement.expression)
+            return
+
+        if isinstance(statement, (Command, PushStack)):
+            statement.args = [self.fold(arg) for arg in statement.args]
+
+    def fold(self, expression: Expression) -> Expression:
+        if isinstance(expression, BinaryExpression):
+            expression.left = self.fold(expression.left)
+            expression.right = self.fold(expression.right)
+
+            if isinstance(expression.left, NumericLiteral) and \
+                    isinstance(expression.right, NumericLiteral) and \
+                    expression.operator in BINARY_OPERATORS:
+                return self.evaluate(
+                    expression, BINARY_OPERATORS[expression.operator],
+                    expression.left.value, expression.right.value)
+
+        elif isinstance(expression, UnaryExpression):
+            expression.expression = self.fold(expression.expression)
+
+            if isinstance(expression.expression, NumericLiteral) and \
+                    expression.operator == "-":
+                return self.evaluate(expression, operator.neg,
+                                     expression.expression.value)
+
+        elif isinstance(expression, CallFn):
+            expression.args = [self.fold(arg) for arg in expression.args]
+            function = self.enviroment.functions.get(expression.name.name)
+
+            if function is not None and function.pure and \
+                    function.argc in (None, len(expression.args)) and \
+                    all(isinstance(arg, NumericLiteral)
+                        for arg in expression.args):
+                return self.evaluate(
+                    expression, function.method,
+                    *(arg.value for arg in expression.args))
+
+        return expression
+
+    def evaluate(self, expression: Expression, function, *args) -> Expression:
+        try:
+            value = function(*args)
+        except (ArithmeticError, ValueError):
+            return expression
+
+        if isinstance(value, float) and not math.isfinite(value):
+            return expression
+
+        self.folded += 1
+        return NumericLiteral(value)
@@ -0,0 +1,88 @@
+from frontend.tpv_ast import IfBlock, NoOp, NumericLiteral, \
+    ProcedureDeclaration, Program, Statement, WhileBlock
+from optimizer.analysis import reachable_procedures, terminates
+
+
+class DeadCodeElimination():
+    """
+    Removes statements that can never run: code after RETURN or STOP, the
+    untaken branch of an IF with a constant condition, WHILE loops whose
+    constant condition is never positive, procedures that are declared
+    inside blocks (only top level ones can be called) and procedures that
+    are never called.
+    """
+
+    def __init__(self):
+        self.removed = 0
+        self.removed_procedures = []
+
+    def run(self, program: Program) -> Program:
+        program.statements = self.eliminate_block(program.statements,
+                                                  top_level=True)
+
+        # drop declarations overridden by a later one of the same name
+        declarations = {}
+        for statement in program.statements:
+            if isinstance(statement, ProcedureDeclaration):
+                declarations[statement.name.name] = statement
+
+        reachable = reachable_procedures(program)
+        statements = []
+
+        for statement in program.statements:
+            if isinstance(statement, ProcedureDeclaration) and (
+                    statement.name.name not in reachable or
+                    declarations[statement.name.name] is not statement):
+                self.removed += 1
+                self.removed_procedures.append(statement.name.name)
+                continue
+
+            statements.append(statement)
+
+        program.statements = statements
+        return program
+
+    def eliminate_block(self, statements: list[Statement],
+                        top_level: bool = False) -> list[Statement]:
+        result = []
+        terminated = False
+
+        for statement in statements:
+            if isinstance(statement, ProcedureDeclaration):
+                if top_level:
+                    statement.body = self.eliminate_block(statement.body)
+                    result.append(statement)
+                else:
+                    self.removed += 1
+                continue
+
+            if terminated or isinstance(statement, NoOp):
+                self.removed += 1
+                continue
+
+            if isinstance(statement, IfBlock):
+                statement.body = self.eliminate_block(statement.body)
+                statement.else_body = self.eliminate_block(
+                    statement.else_body)
+
+                if isinstance(statement.condition, NumericLiteral):
+                    self.removed += 1
+                    branch = statement.body \
+                        if statement.condition.value > 0 \
+                        else statement.else_body
+                    result.extend(branch)
+                    terminated = terminates(branch)
+                    continue
+
+            elif isinstance(statement, WhileBlock):
+                if isinstance(statement.condition, NumericLiteral) and \
+                        not statement.condition.value > 0:
+                    self.removed += 1
+                    continue
+
+                statement.body = self.eliminate_block(statement.body)
+
+            result.append(statement)
+            terminated = terminates([statement])
+
+        return result
@@ -0,0 +1,253 @@
+import copy
+from typing import Optional
+from frontend.tpv_ast import Assignment, CallProcedure, Expression, \
+    Identifier, IfBlock, IntDeclaration, NumericLiteral, \
+    ProcedureDeclaration, Program, Return, Statement, WhileBlock
+from optimizer.analysis import block_effects, procedure_declarations, \
+    terminates, transitive_effects, walk_statements
+from optimizer.loop_invariants import TEMPORARY_PREFIX
+
+# statements a procedure body may hold to be inlined
+DEFAULT_INLINE_SIZE = 16
+
+
+def contains_return(statement: Statement) -> bool:
+    return any(isinstance(nested, Return)
+               for nested in walk_statements([statement]))
+
+
+def positioned(node: Statement, origin: Statement) -> Statement:
+    """`node` with the source position of the statement it stands for."""
+    node.line = origin.line
+    node.column = origin.column
+    return node
+
+
+class ProcedureInlining():
+    """
+    Replaces CALLs of small procedures by a copy of their body, saving the
+    procedure lookup and the frame of every call. Procedures that can call
+    themselves, directly or through others, are never inlined, their callees
+    are inlined into them first so sizes are measured after inlining.
+
+    RETURN is rewritten away. When the rest of the body can be moved into
+    the other branch of the IF holding the RETURN it is, otherwise the copy
+    tracks whether it returned in a temporary variable that guards the
+    statements after every block that may return, and loops holding a
+    RETURN test their condition only while it has not.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_INLINE_SIZE):
+        self.max_size = max_size
+        self.temporaries = []
+        # name: call sites inlined
+        self.inlined = {}
+        # name: why the procedure is not inlined
+        self.skipped = {}
+
+    def run(self, program: Program) -> Program:
+        if self.max_size <= 0:
+            return program
+
+        self.procedures = procedure_declarations(program)
+        # name: body without RETURN, None when not inlined
+        self.bodies = {}
+        self.sizes = {}
+
+        for name in self.procedures:
+            self.expand_procedure(name)
+
+        statements = []
+        for statement in program.statements:
+            if isinstance(statement, ProcedureDeclaration):
+                statements.append(statement)
+            else:
+                statements.extend(self.expand_block([statement]))
+
+        if self.temporaries:
+            statements.insert(0, IntDeclaration(
+                [Identifier(name) for name in self.temporaries]))
+
+        program.statements = statements
+        return program
+
+    def expand_procedure(self, name: str):
+        """Inlines into the procedure and decides whether to inline it."""
+        if name in self.bodies:
+            return
+        # a procedure reached again while being expanded is recursive
+        self.bodies[name] = None
+
+        procedure = self.procedures[name]
+        for callee in block_effects(procedure.body).calls:
+            if callee in self.procedures:
+                self.expand_procedure(callee)
+
+        procedure.body = self.expand_block(procedure.body)
+
+        if name in transitive_effects(procedure.body,
+                                      self.procedures).calls:
+            self.skipped[name] = "is recursive"
+            return
+
+        size = sum(1 for statement in walk_statements(procedure.body)
+                   if not isinstance(statement, (Return,
+                                                 ProcedureDeclaration)))
+        if size > self.max_size:
+            self.skipped[name] = f"has {size} statements, more than " \
+                f"{self.max_size}"
+            return
+
+        self.sizes[name] = size
+        self.bodies[name] = self.without_returns(name, procedure.body)
+
+    def expand_block(self, statements: list[Statement]) -> list[Statement]:
+        result = []
+
+        for statement in statements:
+            if isinstance(statement, CallProcedure) and \
+                    self.bodies.get(statement.name.name) is not None:
+                name = statement.name.name
+                self.inlined[name] = self.inlined.get(name, 0) + 1
+                result.extend(copy.deepcopy(self.bodies[name]))
+                continue
+
+            if isinstance(statement, IfBlock):
+                statement.body = self.expand_block(statement.body)
+                statement.else_body = self.expand_block(statement.else_body)
+            elif isinstance(statement, WhileBlock):
+                statement.body = self.expand_block(statement.body)
+
+            result.append(statement)
+
+        return result
+
+    def without_returns(self, name: str,
+                        body: list[Statement]) -> list[Statement]:
+        # declarations inside blocks cannot be called, nor can the copies
+        body = [statement for statement in body
+                if not isinstance(statement, ProcedureDeclaration)]
+
+        # both rewrites move statements around, the body stays as it is
+        statements = self.restructure(copy.deepcopy(body))
+        if statements is not None:
+            return statements
+
+        body = copy.deepcopy(body)
+
+        flag = f"{TEMPORARY_PREFIX}return_{name}"
+        self.temporaries.append(flag)
+        return [positioned(Assignment(Identifier(flag), NumericLiteral(1)),
+                           body[0])] + self.guard(body, flag)
+
+    def restructure(self, statements: list[Statement]) \
+            -> Optional[list[Statement]]:
+        """
+        The block without RETURN, moving what follows an IF into its branch
+        that does not return, None when a RETURN is not the end of a branch.
+        """
+        result = []
+
+        for index, statement in enumerate(statements):
+            if isinstance(statement, Return):
+                return result
+
+            if not contains_return(statement):
+                result.append(statement)
+                continue
+
+            if not isinstance(statement, IfBlock):
+                return None
+
+            rest = statements[index + 1:]
+            body, else_body = statement.body, statement.else_body
+            if terminates(body):
+                else_body = else_body + rest
+            elif terminates(else_body):
+                body = body + rest
+            else:
+                return None
+
+            body = self.restructure(body)
+            else_body = self.restructure(else_body)
+            if body is None or else_body is None:
+                return None
+
+            statement.body = body
+            statement.else_body = else_body
+            result.append(statement)
+            return result
+
+        return result
+
+    def guard(self, statements: list[Statement],
+              flag: str) -> list[Statement]:
+        """
+        The block with every RETURN clearing `flag` and the statements
+        after a block that may return only run while it is set.
+        """
+        result = []
+
+        for index, statement in enumerate(statements):
+            if isinstance(statement, Return):
+                result.append(positioned(
+                    Assignment(Identifier(flag), NumericLiteral(0)),
+                    statement))
+                return result
+
+            if not contains_return(statement):
+                result.append(statement)
+                continue
+
+            if isinstance(statement, IfBlock):
+                statement.body = self.guard(statement.body, flag)
+                statement.else_body = self.guard(statement.else_body, flag)
+                result.append(statement)
+            else:
+                result.extend(self.guard_loop(statement, flag))
+
+            rest = self.guard(statements[index + 1:], flag)
+            if rest:
+                result.append(positioned(
+                    IfBlock(Identifier(flag), rest, []), statement))
+            return result
+
+        return result
+
+    def guard_loop(self, loop: WhileBlock, flag: str) -> list[Statement]:
+        """
+        The loop running while its condition holds and `flag` is set, the
+        condition evaluated as often as the loop would.
+        """
+        running = f"{TEMPORARY_PREFIX}while_{len(self.temporaries)}"
+        self.temporaries.append(running)
+
+        def test(condition: Expression) -> Statement:
+            return positioned(IfBlock(
+                condition,
+                [positioned(Assignment(Identifier(running),
+                                       NumericLiteral(1)), loop)],
+                [positioned(Assignment(Identifier(running),
+                                       NumericLiteral(0)), loop)]), loop)
+
+        body = self.guard(loop.body, flag)
+        body.append(positioned(IfBlock(
+            Identifier(flag), [test(copy.deepcopy(loop.condition))],
+            [positioned(Assignment(Identifier(running), NumericLiteral(0)),
+                        loop)]), loop))
+
+        return [test(loop.condition),
+                positioned(WhileBlock(Identifier(running), body), loop)]
+
+    def report(self) -> str:
+        inlined = sum(self.inlined.values())
+        lines = [f"Inlined calls: {inlined} call(s) of "
+                 f"{len(self.inlined)} procedure(s)"]
+
+        for name, sites in sorted(self.inlined.items()):
+            lines.append(f"  {name} at {sites} site(s), "
+                         f"{self.sizes[name]} statement(s)")
+        for name, reason in sorted(self.skipped.items()):
+            lines.append(f"  {name} not inlined, it {reason}")
+
+        return "\n".join(lines)
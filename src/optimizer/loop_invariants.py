@@ -0,0 +1,154 @@
+from runtime.enviroment import Enviroment
+from frontend.tpv_ast import Assignment, BinaryExpression, CallFn, \
+    Command, Expression, Identifier, IfBlock, IntDeclaration, \
+    NumericLiteral, ProcedureDeclaration, Program, PushStack, Statement, \
+    UnaryExpression, WhileBlock
+from optimizer.analysis import procedure_declarations, read_variables, \
+    string_variables, transitive_effects, walk_statements
+
+# prefix of introduced variables, which the lexer can never produce
+TEMPORARY_PREFIX = "$"
+
+
+class LoopInvariantHoisting():
+    """
+    Moves expressions that give the same value on every iteration of a WHILE
+    loop into temporary variables assigned right before the loop.
+
+    Only expressions that cannot fail are hoisted, since the hoisted copy is
+    evaluated even when the loop body never runs: every operand must be
+    numeric and divisors must be non-zero literals.
+    """
+
+    def __init__(self, enviroment: Enviroment):
+        self.enviroment = enviroment
+        self.temporaries = []
+        self.hoisted = 0
+
+    def run(self, program: Program) -> Program:
+        self.procedures = procedure_declarations(program)
+        self.strings = string_variables(program, self.enviroment.vars)
+
+        statements = []
+        for statement in program.statements:
+            if isinstance(statement, ProcedureDeclaration):
+                statement.body = self.hoist_block(statement.body)
+                statements.append(statement)
+            else:
+                statements.extend(self.hoist_block([statement]))
+
+        if self.temporaries:
+            statements.insert(0, IntDeclaration(
+                [Identifier(name) for name in self.temporaries]))
+
+        program.statements = statements
+        return program
+
+    def hoist_block(self, statements: list[Statement]) -> list[Statement]:
+        result = []
+
+        for statement in statements:
+            if isinstance(statement, IfBlock):
+                statement.body = self.hoist_block(statement.body)
+                statement.else_body = self.hoist_block(statement.else_body)
+            elif isinstance(statement, WhileBlock):
+                statement.body = self.hoist_block(statement.body)
+                result.extend(self.hoist_loop(statement))
+
+            result.append(statement)
+
+        return result
+
+    def hoist_loop(self, whileblock: WhileBlock) -> list[Assignment]:
+        """
+        Replaces invariant expressions in the loop and returns the
+        assignments computing them.
+        """
+        effects = transitive_effects([whileblock], self.procedures)
+        if effects.unknown_call:
+            return []
+
+        self.clobbered = effects.assigned | effects.declared
+        self.uses_stack = effects.uses_stack
+        self.assignments = {}
+
+        whileblock.condition = self.hoist(whileblock.condition)
+        for statement in walk_statements(whileblock.body):
+            self.hoist_statement(statement)
+
+        for assignment in self.assignments.values():
+            assignment.line = whileblock.line
+            assignment.column = whileblock.column
+
+        return list(self.assignments.values())
+
+    def hoist_statement(self, statement: Statement):
+        if isinstance(statement, (IfBlock, WhileBlock)):
+            statement.condition = self.hoist(statement.condition)
+        elif isinstance(statement, Assignment):
+            statement.expression = self.hoist(statement.expression)
+        elif isinstance(statement, (Command, PushStack)):
+            statement.args = [self.hoist(arg) for arg in statement.args]
+
+    def hoist(self, expression: Expression) -> Expression:
+        if isinstance(expression, (NumericLiteral, Identifier)):
+            return expression
+
+        if self.is_invariant(expression) and self.is_safe(expression):
+            key = repr(expression)
+
+            if key not in self.assignments:
+                name = f"{TEMPORARY_PREFIX}{len(self.temporaries)}"
+                self.temporaries.append(name)
+                self.assignments[key] = Assignment(Identifier(name),
+                                                   expression)
+                self.hoisted += 1
+
+            return Identifier(self.assignments[key].identifier.name)
+
+        if isinstance(expression, BinaryExpression):
+            expression.left = self.hoist(expression.left)
+            expression.right = self.hoist(expression.right)
+        elif isinstance(expression, UnaryExpression):
+            expression.expression = self.hoist(expression.expression)
+        elif isinstance(expression, CallFn):
+            expression.args = [self.hoist(arg) for arg in expression.args]
+
+        return expression
+
+    def is_invariant(self, expression: Expression) -> bool:
+        names = read_variables(expression)
+
+        if "top" in names and self.uses_stack:
+            return False
+
+        return not (names & self.clobbered - {"top"})
+
+    def is_safe(self, expression: Expression) -> bool:
+        if isinstance(expression, NumericLiteral):
+            return True
+
+        if isinstance(expression, Identifier):
+            return expression.name not in self.strings
+
+        if isinstance(expression, BinaryExpression):
+            if expression.operator == "/" and not (
+                    isinstance(expression.right, NumericLiteral) and
+                    expression.right.value != 0):
+                return False
+
+            return expression.operator in ("+", "-", "*", "/") and \
+                self.is_safe(expression.left) and \
+                self.is_safe(expression.right)
+
+        if isinstance(expression, UnaryExpression):
+            return expression.operator == "-" and \
+                self.is_safe(expression.expression)
+
+        if isinstance(expression, CallFn):
+            function = self.enviroment.functions.get(expression.name.name)
+            return function is not None and function.pure and \
+                function.argc in (None, len(expression.args)) and \
+                all(map(self.is_safe, expression.args))
+
+        return False
@@ -0,0 +1,32 @@
+from runtime.enviroment import Enviroment
+from frontend.tpv_ast import Program
+from optimizer.constant_folding import ConstantFolding
+from optimizer.dead_code import DeadCodeElimination
+from optimizer.inlining import DEFAULT_INLINE_SIZE, ProcedureInlining
+from optimizer.loop_invariants import LoopInvariantHoisting
+
+
+class Optimizer():
+    """
+    Runs the optimization passes over a parsed program. Every pass takes and
+    returns a `Program` and may modify it in place.
+
+    Procedures of at most `inline_size` statements are inlined first, so
+    the other passes see their bodies at the call sites, 0 disables it.
+    """
+
+    def __init__(self, enviroment: Enviroment,
+                 inline_size: int = DEFAULT_INLINE_SIZE):
+        self.inlining = ProcedureInlining(inline_size)
+        self.passes = [
+            self.inlining,
+            ConstantFolding(enviroment),
+            DeadCodeElimination(),
+            LoopInvariantHoisting(enviroment),
+        ]
+
+    def optimize(self, program: Program) -> Program:
+        for optimization in self.passes:
+            program = optimization.run(program)
+
+        return program
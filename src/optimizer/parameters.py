@@ -0,0 +1,107 @@
+from typing import Optional
+from frontend.tpv_ast import Assignment, IntDeclaration, NoOp, \
+    ProcedureDeclaration, Program, Statement
+from runtime.enviroment import COLORS
+from optimizer.analysis import ProcedureSummary, read_variables, \
+    summarize_procedures, summarize_statements
+
+
+def parameterize(program: Program, names: list[str]) -> Program:
+    """
+    Turns variables of the program into parameters, whose values are given
+    before it runs instead of being set by the program: they are dropped
+    from the top level INT declarations, so they are read from the
+    enviroment like the colors, and so is a top level assignment of a
+    constant expression to them that comes before anything uses them,
+    `kx = 15` being how a TPV program sets its constants. Later assignments
+    are kept and change the parameter like they would the variable.
+    """
+    names = set(names)
+    declared = set()
+    # parameters read or written by a statement that has been seen
+    used = set()
+    summaries = summarize_procedures(program)
+    statements = []
+
+    for statement in program.statements:
+        if isinstance(statement, IntDeclaration):
+            vars = [var for var in statement.vars if var.name not in names]
+            declared.update(var.name for var in statement.vars
+                            if var.name in names)
+            if not vars:
+                statement = position(NoOp(), statement)
+            elif len(vars) != len(statement.vars):
+                statement = position(IntDeclaration(vars), statement)
+
+        elif isinstance(statement, Assignment) and \
+                statement.identifier.name in names - used and \
+                not read_variables(statement.expression):
+            used.add(statement.identifier.name)
+            statement = position(NoOp(), statement)
+
+        elif not isinstance(statement, ProcedureDeclaration):
+            variables = used_variables(statement, summaries)
+            used.update(names if variables is None else names & variables)
+
+        statements.append(statement)
+
+    for name in sorted(names - declared):
+        raise Exception(f"Parameter '{name}' is not declared by an INT "
+                        f"statement outside of procedures")
+
+    for statement in program.statements:
+        if isinstance(statement, ProcedureDeclaration):
+            for inner in statement.body:
+                if isinstance(inner, IntDeclaration) and \
+                        names & {var.name for var in inner.vars}:
+                    raise Exception(f"Parameters cannot be declared by "
+                                    f"procedure {statement.name.name}")
+
+    program.statements = statements
+    return program
+
+
+def used_variables(statement: Statement,
+                   summaries: dict[str, ProcedureSummary]) -> Optional[set]:
+    """
+    Variables the statement or the procedures it calls read or write, None
+    when it calls an unknown procedure.
+    """
+    summary = summarize_statements("", [statement])
+    variables = summary.reads | summary.writes
+
+    for name in summary.calls:
+        callee = summaries.get(name)
+        if callee is None or callee.unknown_call:
+            return None
+        variables |= callee.reads | callee.writes
+
+    return variables
+
+
+def position(statement, original):
+    """`statement` at the source position of `original`."""
+    statement.line = original.line
+    statement.column = original.column
+    return statement
+
+
+def parameter_values(parameters: dict) -> dict:
+    """
+    Checks the values of parameters, returns them by their names in lower
+    case like the lexer gives identifiers.
+    """
+    values = {}
+
+    for name, value in parameters.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise Exception(f"Parameter '{name}' must be a number, got "
+                            f"{value!r}")
+
+        name = name.lower()
+        if name == "top" or name in COLORS or not name.isalnum():
+            raise Exception(f"'{name}' cannot be a parameter")
+
+        values[name] = value
+
+    return values
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Optional
+import PIL
+from runtime.program_cache import package_version
+
+MANIFEST_NAME = ".tpv-manifest.json"
+
+# packages whose code decides what a rendered image looks like
+RENDER_PACKAGES = ("frontend", "optimizer", "runtime", "output")
+
+
+def render_version() -> str:
+    return package_version(RENDER_PACKAGES, f"Pillow {PIL.__version__}")
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class RenderManifest():
+    """
+    Record of the renders of a directory, stored next to the outputs. Every
+    source has the hash of its text, the interpreter version and the options
+    it was rendered with, and the hash and size of its output. A source is up
+    to date while all of them still match, so a batch run only renders the
+    stale ones.
+
+    Outputs are checked by their size unless `verify` is given, which hashes
+    them instead.
+    """
+
+    def __init__(self, directory: str, options: dict):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.version = render_version()
+        # round trip through JSON, so the options compare equal to the
+        # ones read back
+        self.options = json.loads(json.dumps(options))
+        self.entries = self.read()
+        self.sources = {}
+
+    def read(self) -> dict:
+        try:
+            with open(self.path, "r") as file:
+                manifest = json.load(file)
+            entries = manifest["entries"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+        return entries if isinstance(entries, dict) else {}
+
+    def check(self, source: str, output: str,
+              verify: bool = False) -> Optional[str]:
+        """
+        Returns why `source` has to be rendered to `output`, or None when
+        it is up to date.
+        """
+        with open(source, "rb") as file:
+            self.sources[source] = hashlib.sha256(file.read()).hexdigest()
+
+        entry = self.entries.get(os.path.basename(source))
+        if not isinstance(entry, dict):
+            return "not rendered yet"
+
+        if entry.get("source") != self.sources[source]:
+            return "source changed"
+
+        if entry.get("version") != self.version:
+            return "interpreter changed"
+
+        if entry.get("options") != self.options:
+            return "options changed"
+
+        if entry.get("output") != os.path.basename(output):
+            return "output changed"
+
+        try:
+            if os.path.getsize(output) != entry.get("size"):
+                return "output changed"
+
+            if verify and file_hash(output) != entry.get("hash"):
+                return "output does not match the manifest"
+        except OSError:
+            return "output missing"
+
+        return None
+
+    def record(self, source: str, output: str):
+        """Records that `source` was just rendered to `output`."""
+        if source not in self.sources:
+            with open(source, "rb") as file:
+                self.sources[source] = hashlib.sha256(file.read()).hexdigest()
+
+        self.entries[os.path.basename(source)] = {
+            "source": self.sources[source],
+            "version": self.version,
+            "options": self.options,
+            "output": os.path.basename(output),
+            "size": os.path.getsize(output),
+            "hash": file_hash(output),
+        }
+
+    def forget(self, source: str):
+        self.entries.pop(os.path.basename(source), None)
+
+    def save(self):
+        """
+        Writes the manifest atomically, dropping the entries of sources that
+        no longer exist.
+        """
+        entries = {name: entry for name, entry in sorted(self.entries.items())
+                   if os.path.isfile(os.path.join(self.directory, name))}
+
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory,
+                                                 suffix=".tmp")
+        with os.fdopen(descriptor, "w") as file:
+            json.dump({"entries": entries}, file, indent=1)
+        os.replace(temporary, self.path)
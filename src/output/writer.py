@@ -0,0 +1,116 @@
+import io
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from PIL import Image, features
+
+# format name: file extension, Pillow format, range of compression levels
+FORMATS = {
+    "png": (".png", "PNG", (0, 9)),
+    "ppm": (".ppm", "PPM", None),
+    "bmp": (".bmp", "BMP", None),
+    "webp": (".webp", "WEBP", (0, 6)),
+}
+
+# formats that cannot store a palette image
+RGB_ONLY_FORMATS = {"ppm", "webp"}
+
+
+class ImageWriter():
+    """
+    Encodes and saves finished images on a pool of background threads, so
+    the next program can run while the previous image is being encoded.
+    Pillow releases the GIL while encoding, the threads run in parallel.
+
+    PNG takes a zlib level from 0 to 9, where 1 is the fast one, WebP is
+    always lossless and takes an effort from 0 to 6. PPM and BMP are stored
+    raw.
+    """
+
+    def __init__(self, format: str = "png", compression: Optional[int] = None,
+                 workers: int = 1):
+        if format not in FORMATS:
+            raise Exception(f"Unknown image format '{format}', "
+                            f"expected one of {', '.join(FORMATS)}")
+
+        extension, pillow_format, levels = FORMATS[format]
+
+        if compression is not None:
+            if levels is None:
+                raise Exception(f"Image format '{format}' does not support "
+                                f"compression levels")
+
+            if not levels[0] <= compression <= levels[1]:
+                raise Exception(f"Compression level of '{format}' must be "
+                                f"between {levels[0]} and {levels[1]}")
+
+        if format == "webp" and not features.check("webp"):
+            raise Exception("Pillow was built without WebP support")
+
+        self.format = format
+        self.extension = extension
+        self.pillow_format = pillow_format
+        self.options = self.save_options(compression)
+        self.executor = ThreadPoolExecutor(max(workers, 1))
+        # queued images stay in memory, so submit blocks once this many
+        # are waiting
+        self.max_pending = 2 * max(workers, 1)
+        self.pending = []
+        self.failures = []
+
+    def save_options(self, compression: Optional[int]) -> dict:
+        if self.format == "png":
+            return {} if compression is None \
+                else {"compress_level": compression}
+
+        if self.format == "webp":
+            options = {"lossless": True}
+            if compression is not None:
+                options["method"] = compression
+            return options
+
+        return {}
+
+    def path(self, source: str) -> str:
+        """The output path of a program, next to its source."""
+        return os.path.splitext(source)[0] + self.extension
+
+    def save(self, image: Image.Image, path: str):
+        """Encodes and saves the image right away."""
+        if image.mode == "P" and self.format in RGB_ONLY_FORMATS:
+            image = image.convert("RGB")
+
+        image.save(path, self.pillow_format, **self.options)
+
+    def encode(self, image: Image.Image) -> bytes:
+        """The encoded image, in memory."""
+        buffer = io.BytesIO()
+        self.save(image, buffer)
+        return buffer.getvalue()
+
+    def submit(self, image: Image.Image, path: str) -> Future:
+        """
+        Queues the image to be saved in the background. The image must not
+        be drawn on afterwards.
+        """
+        while len(self.pending) >= self.max_pending:
+            self.collect(*self.pending.pop(0))
+
+        future = self.executor.submit(self.save, image, path)
+        self.pending.append((path, future))
+        return future
+
+    def collect(self, path: str, future: Future):
+        try:
+            future.result()
+        except Exception as e:
+            self.failures.append((path, e))
+
+    def close(self) -> list[tuple[str, Exception]]:
+        """Waits for the queued images, returns the ones that failed."""
+        for path, future in self.pending:
+            self.collect(path, future)
+
+        self.pending = []
+        self.executor.shutdown()
+        return self.failures
@@ -0,0 +1,591 @@
+from array import array
+from enum import IntEnum
+from typing import Iterable, Optional
+from runtime.enviroment import COLORS, Enviroment
+from runtime.exceptions import LimitExceeded, ReturnException
+from runtime.limits import Limits, PRIMITIVE_COMMANDS, weight
+from runtime.resolver import Resolver, SlotTable
+from frontend.tpv_ast import Assignment, BinaryExpression, CallFn, \
+    CallProcedure, Expression, Identifier, IfBlock, NoOp, \
+    NumericLiteral, PopStack, ProcedureDeclaration, Program, PushStack, \
+    Return, IntDeclaration, Statement, Command, UnaryExpression, WhileBlock
+import json
+import struct
+
+
+class Opcode(IntEnum):
+    """
+    Every instruction is two integers wide: the opcode and its operand.
+    Instructions without an operand carry a zero.
+    """
+    HALT = 0
+    LOAD_CONST = 1      # push constants[arg]
+    LOAD_VAR = 2        # push the variable in slot arg
+    LOAD_TOP = 3        # push the length of the TPV stack
+    STORE_VAR = 4       # pop into the variable in slot arg
+    DECLARE_VAR = 5     # declare the variable in slot arg
+    ADD = 6
+    SUBTRACT = 7
+    MULTIPLY = 8
+    DIVIDE = 9
+    NEGATE = 10
+    CALL_FUNCTION = 11  # call functions[arg], pushing its result
+    COMMAND = 12        # call commands[arg]
+    PUSH_STACK = 13     # move arg operands to the TPV stack
+    POP_STACK = 14      # pop the TPV stack into the variable in slot arg
+    JUMP = 15           # jump to the instruction at arg
+    JUMP_IF_FALSE = 16  # pop a condition, jump to arg unless it is > 0
+    CALL = 17           # call the procedure procedures[arg]
+    RETURN = 18
+    POP = 19            # discard the operand on top
+    LIMIT = 20          # run the execution limit check checks[arg]
+    CHECK_DECLARED = 21  # fail unless the variable in slot arg is declared
+
+
+BINARY_OPCODES = {
+    "+": Opcode.ADD,
+    "-": Opcode.SUBTRACT,
+    "*": Opcode.MULTIPLY,
+    "/": Opcode.DIVIDE,
+}
+
+# kinds of execution limit checks, (kind, amount, line) in the checks table
+LIMIT_CHARGE = 0        # charge amount statements
+LIMIT_STACK = 1         # check the depth of the TPV stack
+LIMIT_PRIMITIVE = 2     # count a primitive
+LIMIT_CALL = 3          # check the call depth before a CALL
+
+MAGIC = b"TPVB"
+VERSION = 3
+
+
+class Bytecode():
+    """
+    A compiled program: a flat instruction buffer plus the tables its
+    operands index into. Instruction addresses count instructions, not
+    array items.
+    """
+
+    def __init__(self, code: array, constants: list, names: list[str],
+                 commands: list[tuple[str, int]],
+                 functions: list[tuple[str, int]],
+                 procedures: list[tuple[str, int]],
+                 checks: Optional[list[tuple[int, int, int]]] = None):
+        self.code = code
+        self.constants = constants
+        # variable names by slot
+        self.names = names
+        # (name, argc) of called commands and functions
+        self.commands = commands
+        self.functions = functions
+        # (name, address) of called procedures, address -1 when missing
+        self.procedures = procedures
+        # (kind, amount, line) of the execution limit checks
+        self.checks = checks or []
+
+    def to_bytes(self) -> bytes:
+        header = json.dumps({
+            "constants": self.constants,
+            "names": self.names,
+            "commands": self.commands,
+            "functions": self.functions,
+            "procedures": self.procedures,
+            "checks": self.checks,
+        }).encode()
+
+        return MAGIC + struct.pack("<II", VERSION, len(header)) + header + \
+            self.code.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Bytecode":
+        if data[:4] != MAGIC:
+            raise Exception("Not a TPV bytecode buffer")
+
+        version, header_length = struct.unpack_from("<II", data, 4)
+        if version != VERSION:
+            raise Exception(f"Unsupported bytecode version {version}")
+
+        start = 12 + header_length
+        header = json.loads(data[12:start])
+        code = array("i")
+        code.frombytes(data[start:])
+
+        return cls(code, header["constants"], header["names"],
+                   [tuple(c) for c in header["commands"]],
+                   [tuple(f) for f in header["functions"]],
+                   [tuple(p) for p in header["procedures"]],
+                   [tuple(c) for c in header["checks"]])
+
+    def disassemble(self) -> str:
+        lines = []
+
+        for address in range(len(self.code) // 2):
+            opcode = Opcode(self.code[2 * address])
+            arg = self.code[2 * address + 1]
+            line = f"{address:6} {opcode.name:<14}"
+
+            if opcode == Opcode.LOAD_CONST:
+                line += f"{arg} ({self.constants[arg]})"
+            elif opcode in (Opcode.LOAD_VAR, Opcode.STORE_VAR,
+                            Opcode.DECLARE_VAR, Opcode.POP_STACK,
+                            Opcode.CHECK_DECLARED):
+                line += f"{arg} ({self.names[arg]})"
+            elif opcode == Opcode.COMMAND:
+                name, argc = self.commands[arg]
+                line += f"{arg} ({name}/{argc})"
+            elif opcode == Opcode.CALL_FUNCTION:
+                name, argc = self.functions[arg]
+                line += f"{arg} ({name}/{argc})"
+            elif opcode == Opcode.CALL:
+                line += f"{arg} ({self.procedures[arg][0]})"
+            elif opcode == Opcode.LIMIT:
+                kind, amount, source_line = self.checks[arg]
+                name = ("charge", "stack", "primitive", "call")[kind]
+                line += f"{arg} ({name} {amount}, line {source_line})"
+            elif opcode in (Opcode.JUMP, Opcode.JUMP_IF_FALSE,
+                            Opcode.PUSH_STACK):
+                line += str(arg)
+
+            lines.append(line.rstrip())
+
+        return "\n".join(lines)
+
+
+class BytecodeCompiler():
+    """
+    Compiles a parsed program into Bytecode. With `limits`, LIMIT
+    instructions check them at loop iterations, procedure entries and calls,
+    pushes and primitives.
+    """
+
+    def __init__(self, predeclared: Iterable[str] = COLORS,
+                 limits: Optional[Limits] = None):
+        self.predeclared = predeclared
+        self.limits = limits
+        self.checks = {}
+        self.code = array("i")
+        # tables map values to their index, in insertion order
+        self.constants = {}
+        self.names = {}
+        self.commands = {}
+        self.functions = {}
+        self.called_procedures = {}
+
+    def compile(self, program: Program) -> Bytecode:
+        self.table = Resolver(self.predeclared).resolve(program)
+        self.names = self.table.slots
+
+        declarations = {}
+        for statement in program.statements:
+            if isinstance(statement, ProcedureDeclaration):
+                declarations[statement.name.name] = statement
+
+        self.compile_block(program.statements)
+        self.emit(Opcode.HALT)
+
+        addresses = {}
+        for name, declaration in declarations.items():
+            addresses[name] = self.address()
+            self.emit_charge(declaration.body, declaration.line)
+            self.compile_block(declaration.body)
+            self.emit(Opcode.RETURN)
+
+        procedures = [(name, addresses.get(name, -1))
+                      for name in self.called_procedures]
+
+        constants = [value for _, value in self.constants]
+
+        return Bytecode(self.code, constants, list(self.names),
+                        list(self.commands), list(self.functions), procedures,
+                        list(self.checks))
+
+    def address(self) -> int:
+        return len(self.code) // 2
+
+    def emit(self, opcode: Opcode, arg: int = 0) -> int:
+        self.code.append(opcode)
+        self.code.append(arg)
+        return self.address() - 1
+
+    def emit_limit(self, kind: int, amount: int, line: int):
+        self.emit(Opcode.LIMIT, self.index(self.checks, (kind, amount, line)))
+
+    def emit_charge(self, statements: list[Statement], line: int):
+        if self.limits is not None and self.limits.counts:
+            self.emit_limit(LIMIT_CHARGE, weight(statements), line)
+
+    def patch(self, address: int, target: int):
+        self.code[2 * address + 1] = target
+
+    def emit_check_declared(self, name: str):
+        """Checks the variable's INT ran, unless it always runs first."""
+        if self.table.checked(name):
+            self.emit(Opcode.CHECK_DECLARED, self.names[name])
+
+    def index(self, table: dict, value) -> int:
+        return table.setdefault(value, len(table))
+
+    def compile_block(self, statements: list[Statement]):
+        for statement in statements:
+            self.compile_statement(statement)
+
+    def compile_statement(self, statement: Statement):
+        if isinstance(statement, Expression):
+            self.compile_expression(statement)
+            self.emit(Opcode.POP)
+            return
+
+        limits = self.limits
+
+        if isinstance(statement, Command):
+            if limits is not None and limits.max_primitives is not None and \
+                    statement.command.name in PRIMITIVE_COMMANDS:
+                self.emit_limit(LIMIT_PRIMITIVE, 0, statement.line)
+
+            self.compile_call(Opcode.COMMAND, self.commands,
+                              statement.command, statement.args)
+            return
+
+        if isinstance(statement, IntDeclaration):
+            for var in statement.vars:
+                self.emit(Opcode.DECLARE_VAR, self.names[var.name])
+            return
+
+        if isinstance(statement, IfBlock):
+            self.compile_if_block(statement)
+            return
+
+        if isinstance(statement, WhileBlock):
+            self.compile_while_block(statement)
+            return
+
+        if isinstance(statement, Assignment):
+            self.compile_expression(statement.expression)
+            self.emit_check_declared(statement.identifier.name)
+            self.emit(Opcode.STORE_VAR,
+                      self.names[statement.identifier.name])
+            return
+
+        if isinstance(statement, CallProcedure):
+            if limits is not None and limits.max_call_depth is not None:
+                self.emit_limit(LIMIT_CALL, 0, statement.line)
+
+            self.emit(Opcode.CALL, self.index(self.called_procedures,
+                                              statement.name.name))
+            return
+
+        if isinstance(statement, PushStack):
+            for arg in statement.args:
+                self.compile_expression(arg)
+            self.emit(Opcode.PUSH_STACK, len(statement.args))
+
+            if limits is not None and limits.max_stack is not None:
+                self.emit_limit(LIMIT_STACK, 0, statement.line)
+            return
+
+        if isinstance(statement, PopStack):
+            for var in statement.vars:
+                self.emit_check_declared(var.name)
+                self.emit(Opcode.POP_STACK, self.names[var.name])
+            return
+
+        if isinstance(statement, Return):
+            self.emit(Opcode.RETURN)
+            return
+
+        # skip as procedures are compiled separately
+        if isinstance(statement, (ProcedureDeclaration, NoOp)):
+            return
+
+        raise Exception(f"Unimplemented statement type: {type(statement)}")
+
+    def compile_if_block(self, ifblock: IfBlock):
+        self.compile_expression(ifblock.condition)
+        jump_to_else = self.emit(Opcode.JUMP_IF_FALSE)
+        self.compile_block(ifblock.body)
+
+        if ifblock.else_body:
+            jump_to_end = self.emit(Opcode.JUMP)
+            self.patch(jump_to_else, self.address())
+            self.compile_block(ifblock.else_body)
+            self.patch(jump_to_end, self.address())
+        else:
+            self.patch(jump_to_else, self.address())
+
+    def compile_while_block(self, whileblock: WhileBlock):
+        start = self.address()
+        self.compile_expression(whileblock.condition)
+        jump_to_end = self.emit(Opcode.JUMP_IF_FALSE)
+        self.emit_charge(whileblock.body, whileblock.line)
+        self.compile_block(whileblock.body)
+        self.emit(Opcode.JUMP, start)
+        self.patch(jump_to_end, self.address())
+
+    def compile_expression(self, expression: Expression):
+        if isinstance(expression, NumericLiteral):
+            # keyed by type too, so 1 and 1.0 stay distinct constants
+            value = expression.value
+            self.emit(Opcode.LOAD_CONST,
+                      self.index(self.constants, (value.__class__, value)))
+            return
+
+        if isinstance(expression, Identifier):
+            if expression.name == "top":
+                self.emit(Opcode.LOAD_TOP)
+            else:
+                self.emit_check_declared(expression.name)
+                self.emit(Opcode.LOAD_VAR,
+                          self.names[expression.name])
+            return
+
+        if isinstance(expression, BinaryExpression):
+            if expression.operator not in BINARY_OPCODES:
+                raise Exception(
+                    "Unimplemented binary expression operator: "
+                    f"{expression.operator}")
+
+            self.compile_expression(expression.left)
+            self.compile_expression(expression.right)
+            self.emit(BINARY_OPCODES[expression.operator])
+            return
+
+        if isinstance(expression, UnaryExpression):
+            if expression.operator != "-":
+                raise Exception(
+                    "Unimplemented unary expression operator: "
+                    f"{expression.operator}")
+
+            self.compile_expression(expression.expression)
+            self.emit(Opcode.NEGATE)
+            return
+
+        if isinstance(expression, CallFn):
+            self.compile_call(Opcode.CALL_FUNCTION, self.functions,
+                              expression.name, expression.args)
+            return
+
+        raise Exception(f"Unimplemented expression type: {type(expression)}")
+
+    def compile_call(self, opcode: Opcode, table: dict, name: Identifier,
+                     args: list[Expression]):
+        for arg in args:
+            self.compile_expression(arg)
+
+        self.emit(opcode, self.index(table, (name.name, len(args))))
+
+
+class VirtualMachine():
+    """
+    Executes bytecode in a single dispatch loop with an operand stack and an
+    explicit call stack of return addresses.
+    """
+
+    def __init__(self, bytecode: Bytecode, enviroment: Enviroment,
+                 max_call_depth: Optional[int] = None,
+                 limits: Optional[Limits] = None, typed: bool = False):
+        """
+        With `typed`, the program was validated to do arithmetic only on
+        numbers, see Validator, and operands are not checked.
+        """
+        if bytecode.checks and limits is None:
+            raise Exception("Bytecode compiled with execution limits needs "
+                            "limits to run")
+
+        self.bytecode = bytecode
+        self.enviroment = enviroment
+        self.max_call_depth = max_call_depth
+        self.limits = limits
+        self.typed = typed
+
+    def resolve(self, calls: list[tuple[str, int]], registry: dict,
+                fallback) -> list:
+        """
+        Binds every (name, argc) pair to the enviroment's method. Unknown
+        names and wrong arities go through the enviroment's checked call,
+        so they fail with its own error once executed.
+        """
+        resolved = []
+
+        for name, argc in calls:
+            method = registry.get(name)
+
+            if method is not None and method.argc in (None, argc):
+                resolved.append(method.method)
+            else:
+                resolved.append(
+                    lambda *args, name=name: fallback(name, list(args)))
+
+        return resolved
+
+    def run(self):
+        vars = self.enviroment.vars
+        table = SlotTable(self.bytecode.names, set(vars))
+        values = table.initial_values(vars)
+        declared = table.initial_declared()
+
+        try:
+            self.execute(values, declared)
+        finally:
+            table.store(values, declared, vars)
+
+    def execute(self, values: list, declared: list[bool]):
+        code = self.bytecode.code.tolist()
+        constants = self.bytecode.constants
+        names = self.bytecode.names
+        procedures = [2 * address for _, address in
+                      self.bytecode.procedures]
+        commands = self.resolve(self.bytecode.commands,
+                                self.enviroment.commands,
+                                self.enviroment.call_command)
+        command_argcs = [argc for _, argc in self.bytecode.commands]
+        command_stops = [name in self.enviroment.commands and
+                         self.enviroment.commands[name].stops
+                         for name, _ in self.bytecode.commands]
+        functions = self.resolve(self.bytecode.functions,
+                                 self.enviroment.functions,
+                                 self.enviroment.call_function)
+        function_argcs = [argc for _, argc in self.bytecode.functions]
+
+        tpv_stack = self.enviroment.stack
+        limits = self.limits
+        checks = self.bytecode.checks
+        typed = self.typed
+
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        frames = []
+        max_call_depth = self.max_call_depth or float("inf")
+        pc = 0
+
+        while True:
+            op = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+
+            if op == 2:  # LOAD_VAR
+                push(values[arg])
+
+            elif op == 1:  # LOAD_CONST
+                push(constants[arg])
+
+            elif op <= 9 and op >= 6:  # ADD, SUBTRACT, MULTIPLY, DIVIDE
+                rhs = pop()
+                lhs = pop()
+
+                # colors are the only non-numeric values
+                if not typed and (lhs.__class__ is str or
+                                  rhs.__class__ is str):
+                    raise Exception("Cannot perform binary operation"
+                                    " on non-numeric values")
+
+                if op == 6:
+                    push(lhs + rhs)
+                elif op == 7:
+                    push(lhs - rhs)
+                elif op == 8:
+                    push(lhs * rhs)
+                else:
+                    push(lhs / rhs)
+
+            elif op == 4:  # STORE_VAR
+                values[arg] = pop()
+
+            elif op == 16:  # JUMP_IF_FALSE
+                if not pop() > 0:
+                    pc = 2 * arg
+
+            elif op == 15:  # JUMP
+                pc = 2 * arg
+
+            elif op == 12:  # COMMAND
+                argc = command_argcs[arg]
+                if argc:
+                    args = stack[-argc:]
+                    del stack[-argc:]
+                    commands[arg](*args)
+                else:
+                    commands[arg]()
+
+                if command_stops[arg]:
+                    return
+
+            elif op == 11:  # CALL_FUNCTION
+                argc = function_argcs[arg]
+                if argc:
+                    args = stack[-argc:]
+                    del stack[-argc:]
+                    push(functions[arg](*args))
+                else:
+                    push(functions[arg]())
+
+            elif op == 3:  # LOAD_TOP
+                push(len(tpv_stack))
+
+            elif op == 10:  # NEGATE
+                push(-pop())
+
+            elif op == 13:  # PUSH_STACK
+                if arg:
+                    tpv_stack.extend(stack[-arg:])
+                    del stack[-arg:]
+
+            elif op == 14:  # POP_STACK
+                if not tpv_stack:
+                    raise Exception("Pop from empty stack")
+
+                values[arg] = tpv_stack.pop()
+
+            elif op == 17:  # CALL
+                address = procedures[arg]
+                if address < 0:
+                    raise Exception(f"Procedure "
+                                    f"{self.bytecode.procedures[arg][0]} "
+                                    f"not found")
+
+                if len(frames) >= max_call_depth:
+                    raise LimitExceeded("call depth", max_call_depth)
+
+                frames.append(pc)
+                pc = address
+
+            elif op == 18:  # RETURN
+                if not frames:
+                    raise ReturnException()
+
+                pc = frames.pop()
+
+            elif op == 5:  # DECLARE_VAR
+                if declared[arg]:
+                    raise Exception(
+                        f"Variable '{names[arg]}' already declared")
+
+                declared[arg] = True
+                values[arg] = 0
+
+            elif op == 19:  # POP
+                pop()
+
+            elif op == 21:  # CHECK_DECLARED
+                if not declared[arg]:
+                    raise Exception(f"Variable '{names[arg]}' not found")
+
+            elif op == 0:  # HALT
+                return
+
+            elif op == 20:  # LIMIT
+                kind, amount, line = checks[arg]
+
+                if kind == LIMIT_CHARGE:
+                    limits.remaining -= amount
+                    if limits.remaining <= 0:
+                        limits.exhausted(line)
+                elif kind == LIMIT_STACK:
+                    limits.check_stack(len(tpv_stack), line)
+                elif kind == LIMIT_PRIMITIVE:
+                    limits.primitive(line)
+                else:
+                    limits.check_call_depth(len(frames) + 1, line)
+
+            else:
+                raise Exception(f"Unknown opcode {op}")
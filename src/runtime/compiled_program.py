@@ -0,0 +1,107 @@
+from typing import Optional, Union
+from PIL import Image
+from output.writer import ImageWriter
+from runtime.interpreter import Interpreter
+from runtime.limits import Limits
+from runtime.program_cache import ProgramCache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class CompiledProgram():
+    """
+    A program parsed and compiled once, to be rendered any number of times
+    in memory:
+
+        program = CompiledProgram(source, engine="closure")
+        png = program.to_bytes()
+        pixels = program.to_numpy()
+
+    Every render resets the enviroment in place, the variables go back to
+    the colors and the stack is emptied, and runs the compiled program
+    again, nothing is parsed, compiled or registered twice. Renders of one
+    instance must not overlap, threads need an instance each.
+
+    `parameters` are variables of the program set from the outside, by
+    name with their default values, see `parameterize`. Every render can
+    give other values for some of them:
+
+        program = CompiledProgram(source, parameters={"kx": 15, "ky": 17})
+        frame = program.to_bytes({"kx": 16})
+
+    With `reuse_canvas`, a render draws over the canvas of the previous
+    one when their sizes match, so images and arrays of earlier renders
+    must not be used anymore.
+
+    With `fast`, the program is validated once here and its renders skip
+    the checks validation made unnecessary, see Interpreter.
+
+    The images are drawn by the pillow or the numpy rasterizer, the tiled
+    one only writes files.
+    """
+
+    def __init__(self, source: str, engine: str = "tree",
+                 optimize: bool = False, rasterizer: str = "pillow",
+                 palette: bool = False,
+                 cache: Union[bool, ProgramCache] = True,
+                 limits: Optional[Limits] = None,
+                 parameters: Optional[dict] = None,
+                 reuse_canvas: bool = False, fast: bool = False):
+        if rasterizer == "tiled":
+            raise Exception("CompiledProgram renders in memory, the tiled "
+                            "rasterizer writes files")
+
+        self.interpreter = Interpreter(source, engine, optimize,
+                                       rasterizer=rasterizer,
+                                       palette=palette, cache=cache,
+                                       limits=limits, parameters=parameters,
+                                       fast=fast)
+        self.interpreter.compile()
+        self.reuse_canvas = reuse_canvas
+        self.runs = 0
+        # (format, compression): ImageWriter
+        self.writers = {}
+
+    def run(self, parameters: Optional[dict] = None) -> Image.Image:
+        """Renders the program into an image."""
+        if self.runs or parameters:
+            self.interpreter.reset(parameters, self.reuse_canvas)
+
+        self.runs += 1
+        return self.interpreter.run()
+
+    def to_bytes(self, parameters: Optional[dict] = None,
+                 format: str = "png",
+                 compression: Optional[int] = None) -> bytes:
+        """Renders the program into an encoded image."""
+        key = (format, compression)
+        if key not in self.writers:
+            self.writers[key] = ImageWriter(format, compression)
+
+        return self.writers[key].encode(self.run(parameters))
+
+    def to_numpy(self, parameters: Optional[dict] = None):
+        """
+        Renders the program into an array of height by width pixels, of
+        three bytes each or of one palette index with `palette`. The numpy
+        rasterizer hands over its canvas without copying.
+        """
+        if np is None:
+            raise Exception("to_numpy requires NumPy to be installed")
+
+        image = self.run(parameters)
+        rasterizer = self.interpreter.enviroment.numpy_rasterizer
+        if rasterizer is not None:
+            return rasterizer.canvas
+
+        return np.asarray(image)
+
+    def to_memoryview(self, parameters: Optional[dict] = None) -> memoryview:
+        """The raw pixels of `to_numpy`, row by row from the top."""
+        if np is not None:
+            return memoryview(self.to_numpy(parameters)).cast("B")
+
+        return memoryview(self.run(parameters).tobytes())
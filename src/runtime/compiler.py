@@ -0,0 +1,453 @@
+from typing import Callable, Optional
+from runtime.enviroment import Enviroment
+from runtime.exceptions import ReturnException, StopException
+from runtime.limits import Limits, PRIMITIVE_COMMANDS, weight
+from runtime.resolver import Resolver
+from frontend.tpv_ast import Assignment, BinaryExpression, CallFn, \
+    CallProcedure, Expression, Identifier, IfBlock, NoOp, \
+    NumericLiteral, PopStack, ProcedureDeclaration, Program, PushStack, \
+    Return, IntDeclaration, Statement, Command, UnaryExpression, WhileBlock
+import operator
+
+
+BINARY_OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+
+# Returned by a compiled statement to unwind up to the enclosing procedure
+RETURN = True
+
+
+class ClosureCompiler():
+    """
+    Compiles a parsed program once into nested Python closures, so the
+    dispatch on node types and operators happens at compile time instead of
+    on every execution of a node.
+
+    Compiled statements return a truthy value when a RETURN has been
+    executed, compiled expressions return their value. Variables are resolved
+    to slots of a flat list of values, which is written back to the
+    enviroment once the program finishes. Every run of the compiled program
+    starts again from the variables of the enviroment.
+
+    With `limits`, loop bodies, procedure calls, pushes and primitives are
+    compiled with their checks. With `typed`, the program was validated to
+    do arithmetic only on numbers, see Validator, and operands are not
+    checked.
+    """
+
+    def __init__(self, enviroment: Enviroment,
+                 limits: Optional[Limits] = None, typed: bool = False):
+        self.enviroment = enviroment
+        self.procedures = {}
+        self.limits = limits
+        self.typed = typed
+
+    def compile(self, program: Program) -> Callable[[], None]:
+        vars = self.enviroment.vars
+        self.table = table = Resolver(vars).resolve(program)
+        self.values = values = table.initial_values(vars)
+        self.declared = declared = table.initial_declared()
+
+        for statement in program.statements:
+            if isinstance(statement, ProcedureDeclaration):
+                self.procedures[statement.name.name] = self.charged(
+                    self.compile_block(statement.body), statement.body,
+                    statement.line)
+
+        body = self.compile_block(program.statements)
+
+        def run_program():
+            # the slots are filled in place, the closures hold the lists
+            values[:] = table.initial_values(vars)
+            declared[:] = table.initial_declared()
+
+            try:
+                if body():
+                    raise ReturnException()
+            finally:
+                table.store(values, declared, vars)
+
+        return run_program
+
+    def compile_block(self, statements: list[Statement]) -> Callable:
+        compiled = tuple(map(self.compile_statement, statements))
+
+        if not any(map(self.can_return, statements)):
+            def run_block():
+                for statement in compiled:
+                    statement()
+
+            return run_block
+
+        def run_returning_block():
+            for statement in compiled:
+                if statement():
+                    return RETURN
+
+        return run_returning_block
+
+    def charged(self, block: Callable, statements: list[Statement],
+                line: int) -> Callable:
+        """Charges every run of the block to the statement limit."""
+        limits = self.limits
+        if limits is None or not limits.counts:
+            return block
+
+        amount = weight(statements)
+
+        def run_charged_block():
+            limits.remaining -= amount
+            if limits.remaining <= 0:
+                limits.exhausted(line)
+
+            return block()
+
+        return run_charged_block
+
+    def can_return(self, statement: Statement) -> bool:
+        if isinstance(statement, Return):
+            return True
+
+        if isinstance(statement, IfBlock):
+            return any(map(self.can_return, statement.body)) or \
+                any(map(self.can_return, statement.else_body))
+
+        if isinstance(statement, WhileBlock):
+            return any(map(self.can_return, statement.body))
+
+        return False
+
+    def compile_statement(self, statement: Statement) -> Callable:
+        if isinstance(statement, Expression):
+            expression = self.compile_expression(statement)
+
+            def run_expression():
+                expression()
+
+            return run_expression
+
+        if isinstance(statement, Command):
+            return self.compile_command(statement)
+
+        if isinstance(statement, IntDeclaration):
+            return self.compile_int_declaration(statement)
+
+        if isinstance(statement, IfBlock):
+            return self.compile_if_block(statement)
+
+        if isinstance(statement, WhileBlock):
+            return self.compile_while_block(statement)
+
+        if isinstance(statement, Assignment):
+            return self.compile_assignment(statement)
+
+        if isinstance(statement, CallProcedure):
+            return self.compile_call_procedure(statement)
+
+        if isinstance(statement, PushStack):
+            return self.compile_push_stack(statement)
+
+        if isinstance(statement, PopStack):
+            return self.compile_pop_stack(statement)
+
+        if isinstance(statement, Return):
+            return lambda: RETURN
+
+        # skip as procedures are loaded in advance
+        if isinstance(statement, (ProcedureDeclaration, NoOp)):
+            return lambda: None
+
+        raise Exception(f"Unimplemented statement type: {type(statement)}")
+
+    def compile_expression(self, expression: Expression) -> Callable:
+        if isinstance(expression, NumericLiteral):
+            value = expression.value
+            return lambda: value
+
+        if isinstance(expression, Identifier):
+            return self.compile_identifier(expression)
+
+        if isinstance(expression, BinaryExpression):
+            return self.compile_binary_expression(expression)
+
+        if isinstance(expression, UnaryExpression):
+            return self.compile_unary_expression(expression)
+
+        if isinstance(expression, CallFn):
+            return self.compile_call_function(expression)
+
+        raise Exception(f"Unimplemented expression type: {type(expression)}")
+
+    def compile_identifier(self, identifier: Identifier) -> Callable:
+        if identifier.name == "top":
+            stack = self.enviroment.stack
+            return lambda: len(stack)
+
+        values = self.values
+        slot = self.table.slot(identifier.name)
+
+        if not self.table.checked(identifier.name):
+            return lambda: values[slot]
+
+        declared = self.declared
+        name = identifier.name
+
+        def evaluate_checked_identifier():
+            if not declared[slot]:
+                raise Exception(f"Variable '{name}' not found")
+
+            return values[slot]
+
+        return evaluate_checked_identifier
+
+    def compile_binary_expression(self,
+                                  expression: BinaryExpression) -> Callable:
+        if expression.operator not in BINARY_OPERATORS:
+            raise Exception(
+                "Unimplemented binary expression operator: "
+                f"{expression.operator}")
+
+        op = BINARY_OPERATORS[expression.operator]
+        left = self.compile_expression(expression.left)
+        right = self.compile_expression(expression.right)
+
+        if self.typed:
+            return lambda: op(left(), right())
+
+        def evaluate_binary_expression():
+            lhs = left()
+            rhs = right()
+
+            # colors are the only non-numeric values
+            if lhs.__class__ is str or rhs.__class__ is str:
+                raise Exception("Cannot perform binary operation"
+                                " on non-numeric values")
+
+            return op(lhs, rhs)
+
+        return evaluate_binary_expression
+
+    def compile_unary_expression(self,
+                                 expression: UnaryExpression) -> Callable:
+        if expression.operator != "-":
+            raise Exception(
+                "Unimplemented unary expression operator: "
+                f"{expression.operator}")
+
+        operand = self.compile_expression(expression.expression)
+
+        return lambda: -operand()
+
+    def compile_call_function(self, expression: CallFn) -> Callable:
+        name = expression.name.name
+        args = self.compile_args(expression.args)
+        functions = self.enviroment.functions
+
+        if name not in functions or (
+                functions[name].argc is not None and
+                len(args) != functions[name].argc):
+            call_function = self.enviroment.call_function
+            return lambda: call_function(name, [arg() for arg in args])
+
+        return self.compile_call(functions[name].method, args)
+
+    def compile_command(self, command: Command) -> Callable:
+        name = command.command.name
+        args = self.compile_args(command.args)
+        commands = self.enviroment.commands
+
+        # unknown commands and wrong arity only fail once executed
+        if name not in commands or (
+                commands[name].argc is not None and
+                len(args) != commands[name].argc):
+            call_command = self.enviroment.call_command
+            return lambda: call_command(name, [arg() for arg in args])
+
+        call = self.compile_call(commands[name].method, args)
+
+        limits = self.limits
+        if limits is not None and limits.max_primitives is not None and \
+                name in PRIMITIVE_COMMANDS:
+            line = command.line
+            draw = call
+
+            def call():
+                limits.primitive(line)
+                draw()
+
+        if not commands[name].stops:
+            return call
+
+        # unwinding through the closures happens once per program, so an
+        # exception is cheaper than checking a signal after every statement
+        def evaluate_stop():
+            call()
+            raise StopException()
+
+        return evaluate_stop
+
+    def compile_call(self, method: Callable, args: tuple) -> Callable:
+        if len(args) == 0:
+            return lambda: method()
+
+        if len(args) == 1:
+            a, = args
+            return lambda: method(a())
+
+        if len(args) == 2:
+            a, b = args
+            return lambda: method(a(), b())
+
+        if len(args) == 6:
+            a, b, c, d, e, f = args
+            return lambda: method(a(), b(), c(), d(), e(), f())
+
+        return lambda: method(*[arg() for arg in args])
+
+    def compile_args(self, args: list[Expression]) -> tuple:
+        return tuple(map(self.compile_expression, args))
+
+    def compile_int_declaration(self, declaration: IntDeclaration) -> Callable:
+        slots = [self.table.slot(var.name) for var in declaration.vars]
+        values = self.values
+        declared = self.declared
+        names = self.table.names
+
+        def evaluate_int_declaration():
+            for slot in slots:
+                if declared[slot]:
+                    raise Exception(
+                        f"Variable '{names[slot]}' already declared")
+
+                declared[slot] = True
+                values[slot] = 0
+
+        return evaluate_int_declaration
+
+    def compile_if_block(self, ifblock: IfBlock) -> Callable:
+        condition = self.compile_expression(ifblock.condition)
+        body = self.compile_block(ifblock.body)
+        else_body = self.compile_block(ifblock.else_body)
+
+        def evaluate_if_block():
+            if condition() > 0:
+                return body()
+            else:
+                return else_body()
+
+        return evaluate_if_block
+
+    def compile_while_block(self, whileblock: WhileBlock) -> Callable:
+        condition = self.compile_expression(whileblock.condition)
+        body = self.charged(self.compile_block(whileblock.body),
+                            whileblock.body, whileblock.line)
+
+        if not self.can_return(whileblock):
+            def evaluate_while_block():
+                while condition() > 0:
+                    body()
+
+            return evaluate_while_block
+
+        def evaluate_returning_while_block():
+            while condition() > 0:
+                if body():
+                    return RETURN
+
+        return evaluate_returning_while_block
+
+    def compile_call_procedure(self, call: CallProcedure) -> Callable:
+        name = call.name.name
+        procedures = self.procedures
+
+        def evaluate_call_procedure():
+            if name not in procedures:
+                raise Exception(f"Procedure {name} not found")
+
+            procedures[name]()
+
+        limits = self.limits
+        if limits is None or limits.max_call_depth is None:
+            return evaluate_call_procedure
+
+        line = call.line
+
+        def evaluate_limited_call_procedure():
+            limits.depth += 1
+            try:
+                if limits.depth > limits.max_call_depth:
+                    limits.check_call_depth(limits.depth, line)
+
+                evaluate_call_procedure()
+            finally:
+                limits.depth -= 1
+
+        return evaluate_limited_call_procedure
+
+    def compile_assignment(self, assignment: Assignment) -> Callable:
+        name = assignment.identifier.name
+        slot = self.table.slot(name)
+        expression = self.compile_expression(assignment.expression)
+        values = self.values
+
+        if not self.table.checked(name):
+            def evaluate_assignment():
+                values[slot] = expression()
+
+            return evaluate_assignment
+
+        declared = self.declared
+
+        def evaluate_checked_assignment():
+            value = expression()
+            if not declared[slot]:
+                raise Exception(f"Variable '{name}' not found")
+
+            values[slot] = value
+
+        return evaluate_checked_assignment
+
+    def compile_push_stack(self, push: PushStack) -> Callable:
+        args = self.compile_args(push.args)
+        stack = self.enviroment.stack
+
+        def evaluate_push_stack():
+            stack.extend([arg() for arg in args])
+
+        limits = self.limits
+        if limits is None or limits.max_stack is None:
+            return evaluate_push_stack
+
+        line = push.line
+
+        def evaluate_limited_push_stack():
+            stack.extend([arg() for arg in args])
+            limits.check_stack(len(stack), line)
+
+        return evaluate_limited_push_stack
+
+    def compile_pop_stack(self, pop: PopStack) -> Callable:
+        slots = [self.table.slot(var.name) for var in pop.vars]
+        # slots whose declaration may not have run, by their name
+        checked = {self.table.slot(var.name): var.name for var in pop.vars
+                   if self.table.checked(var.name)}
+        stack = self.enviroment.stack
+        values = self.values
+        declared = self.declared
+
+        def evaluate_pop_stack():
+            for slot in slots:
+                if not stack:
+                    raise Exception("Pop from empty stack")
+
+                value = stack.pop()
+                if slot in checked and not declared[slot]:
+                    raise Exception(f"Variable '{checked[slot]}' not found")
+
+                values[slot] = value
+
+        return evaluate_pop_stack
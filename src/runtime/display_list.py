@@ -0,0 +1,183 @@
+from array import array
+from typing import Iterable, Optional
+
+LINE = 0
+RECT = 1
+OVAL = 2
+
+# kind, ink, x1, y1, x2, y2, width
+FIELDS = 7
+
+KIND_NAMES = ("line", "rect", "oval")
+
+# filled rectangles remembered as potential occluders while culling
+MAX_OCCLUDERS = 64
+
+
+class DisplayList():
+    """
+    Records drawing primitives into a flat array of integers, so they can be
+    culled before they are rasterized. Rects and ovals are stored by their
+    corners, with width 0 meaning filled, exactly as they are passed to
+    the draw.
+    """
+
+    def __init__(self):
+        self.items = array("q")
+        self.inks = []
+        self.ink_indices = {}
+        self.culled = 0
+
+    def __len__(self):
+        return len(self.items) // FIELDS
+
+    def clear(self):
+        del self.items[:]
+
+    def append(self, kind: int, ink, x1: int, y1: int, x2: int, y2: int,
+               width: int):
+        key = (ink.__class__, ink)
+        if key not in self.ink_indices:
+            self.ink_indices[key] = len(self.inks)
+            self.inks.append(ink)
+
+        self.items.extend((kind, self.ink_indices[key], x1, y1, x2, y2,
+                           width))
+
+    def primitives(self):
+        items = self.items
+        for i in range(0, len(items), FIELDS):
+            yield items[i:i + FIELDS]
+
+    def export(self) -> list[dict]:
+        """The primitives as plain values, their inks resolved."""
+        return [{"kind": KIND_NAMES[kind], "ink": self.inks[ink],
+                 "x1": x1, "y1": y1, "x2": x2, "y2": y2, "width": width}
+                for kind, ink, x1, y1, x2, y2, width in self.primitives()]
+
+    def bounds(self, kind: int, x1: int, y1: int, x2: int, y2: int,
+               width: int) -> tuple[int, int, int, int]:
+        """
+        A box containing every pixel the primitive can touch. Lines and
+        outlines may reach past their corners by up to their width.
+        """
+        margin = 1 if kind != LINE and width == 0 else abs(width) + 1
+
+        return (min(x1, x2) - margin, min(y1, y2) - margin,
+                max(x1, x2) + margin, max(y1, y2) + margin)
+
+    def cull(self, width: int, height: int):
+        """
+        Drops primitives that draw nothing, lie entirely outside the canvas,
+        are covered by a later filled rect or repeat a later primitive. Thin
+        horizontal and vertical lines are clipped to the canvas; other lines
+        are left alone as clipping them would move their pixels.
+        """
+        kept = []
+        occluders = []
+        seen = set()
+
+        for item in reversed(list(self.primitives())):
+            kind, ink, x1, y1, x2, y2, line_width = item
+
+            if kind == LINE and line_width == 0:
+                continue
+
+            left, top, right, bottom = self.bounds(kind, x1, y1, x2, y2,
+                                                   line_width)
+            if right < 0 or bottom < 0 or left >= width or top >= height:
+                continue
+
+            left, top = max(left, 0), max(top, 0)
+            right, bottom = min(right, width - 1), min(bottom, height - 1)
+
+            if any(ox1 <= left and oy1 <= top and
+                   ox2 >= right and oy2 >= bottom
+                   for ox1, oy1, ox2, oy2 in occluders):
+                continue
+
+            key = tuple(item)
+            if key in seen:
+                continue
+            seen.add(key)
+
+            if kind == LINE and line_width == 1:
+                # the margin of the bounds may keep a thin line the canvas
+                # misses entirely
+                if y1 == y2:
+                    clipped = self.clip(x1, x2, width)
+                    if clipped is None:
+                        continue
+                    x1, x2 = clipped
+                elif x1 == x2:
+                    clipped = self.clip(y1, y2, height)
+                    if clipped is None:
+                        continue
+                    y1, y2 = clipped
+
+            if kind == RECT and line_width == 0:
+                self.add_occluder(occluders, (x1, y1, x2, y2))
+
+            kept.append((kind, ink, x1, y1, x2, y2, line_width))
+
+        self.culled += len(self) - len(kept)
+        self.items = array("q")
+        for item in reversed(kept):
+            self.items.extend(item)
+
+    def clip(self, a: int, b: int,
+             size: int) -> Optional[tuple[int, int]]:
+        """The interval from a to b within [0, size - 1], None if it misses."""
+        if max(a, b) < 0 or min(a, b) > size - 1:
+            return None
+
+        if a <= b:
+            return max(a, 0), min(b, size - 1)
+
+        return min(a, size - 1), max(b, 0)
+
+    def add_occluder(self, occluders: list, box: tuple[int, int, int, int]):
+        x1, y1, x2, y2 = box
+
+        # drop occluders the new one contains, they can cover nothing more
+        occluders[:] = [(ox1, oy1, ox2, oy2)
+                        for ox1, oy1, ox2, oy2 in occluders
+                        if not (x1 <= ox1 and y1 <= oy1 and
+                                x2 >= ox2 and y2 >= oy2)]
+        occluders.append(box)
+
+        if len(occluders) > MAX_OCCLUDERS:
+            occluders.sort(key=lambda o: (o[2] - o[0]) * (o[3] - o[1]))
+            del occluders[0]
+
+    def rasterize(self, draw, indices: Optional[Iterable[int]] = None):
+        """
+        Replays the primitives through a `FlippedDraw`. With `indices` only
+        those primitives are drawn and the list is kept, so it can be
+        replayed again for another tile.
+        """
+        inks = self.inks
+        items = self.items
+        primitives = self.primitives() if indices is None else \
+            (items[i * FIELDS:(i + 1) * FIELDS] for i in indices)
+
+        for kind, ink, x1, y1, x2, y2, width in primitives:
+            color = inks[ink]
+
+            if kind == LINE:
+                draw.line((x1, y1, x2, y2), fill=color, width=width)
+            elif kind == RECT:
+                if width == 0:
+                    draw.rectangle((x1, y1, x2, y2), fill=color)
+                else:
+                    draw.rectangle((x1, y1, x2, y2), outline=color,
+                                   width=width)
+            else:
+                if width == 0:
+                    draw.ellipse((x1, y1, x2, y2), fill=color)
+                else:
+                    draw.ellipse((x1, y1, x2, y2), outline=color,
+                                 width=width)
+
+        if indices is None:
+            self.clear()
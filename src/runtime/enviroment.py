@@ -1,15 +1,34 @@
 from abc import ABC, abstractmethod
-from PIL import Image, ImageDraw
+from PIL import Image, ImageColor
 import math
 from typing import Optional, Callable, Any
 from dataclasses import dataclass
-from runtime.exceptions import StopException, ReturnException
+from runtime.display_list import DisplayList, LINE, RECT, OVAL
+from runtime.flipped_draw import FlippedDraw
+from runtime.numpy_rasterizer import NumpyRasterizer
+from runtime.tiled_canvas import TiledCanvas
+
+
+RASTERIZERS = ("pillow", "numpy", "tiled")
+
+COLORS = ("white", "green", "brown", "lime", "black", "blue", "gray", "grey",
+          "magenta", "red", "orange", "yellow", "gold", "lightgray")
+
+BACKGROUND = "lightgray"
+
+# a P mode image holds at most this many colors
+MAX_PALETTE_SIZE = 256
 
 
 @dataclass
 class Method:
     method: Callable
     argc: Optional[int] = None
+    # pure functions depend only on their arguments and may be evaluated
+    # ahead of time
+    pure: bool = False
+    # commands that end the program, by setting Enviroment.stopped
+    stops: bool = False
 
 
 class Enviroment(ABC):
@@ -20,6 +39,7 @@ class Enviroment(ABC):
         self.image = None
         self.draw = None
         self.stack = []
+        self.stopped = False
 
         self.register_commands()
         self.register_functions()
@@ -86,27 +106,79 @@ class Enviroment(ABC):
 
 
 class TPVEnviroment(Enviroment):
-    def __init__(self):
+    def __init__(self, record: bool = False, rasterizer: str = "pillow",
+                 palette: bool = False):
+        """
+        With `record`, drawing commands are collected into a display list,
+        which is culled and rasterized by `flush`. The numpy and the tiled
+        rasterizer always record, the tiled one leaves rasterization to
+        `TiledCanvas.write`.
+
+        With `palette`, the canvas is a P mode image with one byte per pixel
+        and the named colors as its palette. Colors are drawn by their
+        palette index, colors given as numbers are added to the palette.
+        """
+        if rasterizer not in RASTERIZERS:
+            raise Exception(f"Unknown rasterizer '{rasterizer}', "
+                            f"expected one of {', '.join(RASTERIZERS)}")
+
         super().__init__()
         self.stack = []
-
-        COLORS = {"white", "green", "brown", "lime", "black", "blue", "gray",
-                  "grey", "magenta", "red", "orange", "yellow", "gold",
-                  "lightgray"}
+        self.rasterizer = rasterizer
+        self.record = record or rasterizer != "pillow"
+        self.indexed = palette
+        # canvas of the previous run that the next one may draw over
+        self.spare = None
+        self.reset()
+
+    def reset(self, parameters: Optional[dict] = None,
+              reuse_canvas: bool = False):
+        """
+        Returns to the state before the program ran, for running it again,
+        with `parameters` declared next to the colors. The commands and
+        functions stay registered, and the variables and the stack are
+        cleared in place, compiled programs hold on to them.
+
+        With `reuse_canvas`, a SIZE of the same size clears the previous
+        canvas instead of allocating one, drawing over the image returned
+        before.
+        """
+        self.spare = None
+        if reuse_canvas:
+            self.spare = self.numpy_rasterizer \
+                if self.numpy_rasterizer is not None else self.image
+
+        self.vars.clear()
+        self.stack.clear()
+        self.stopped = False
+        self.image = None
+        self.draw = None
+        self.display_list = None
+        self.numpy_rasterizer = None
+        self.tiled_canvas = None
+        self.palette = None
+        self.inks = None
 
         for color in COLORS:
             self.declare_variable(color, color)
 
+        for name, value in (parameters or {}).items():
+            self.declare_variable(name, value)
+
+        if self.indexed:
+            self.palette = [ImageColor.getrgb(color)[:3] for color in COLORS]
+            self.inks = {color: index for index, color in enumerate(COLORS)}
+
     def register_commands(self):
         self.commands["size"] = Method(self.command_size, 2)
         self.commands["line"] = Method(self.command_line, 6)
         self.commands["rect"] = Method(self.command_rect, 6)
         self.commands["oval"] = Method(self.command_oval, 6)
-        self.commands["stop"] = Method(self.command_stop, 0)
+        self.commands["stop"] = Method(self.command_stop, 0, stops=True)
 
     def register_functions(self):
-        self.functions["sin"] = Method(self.function_sin, 1)
-        self.functions["cos"] = Method(self.function_cos, 1)
+        self.functions["sin"] = Method(self.function_sin, 1, pure=True)
+        self.functions["cos"] = Method(self.function_cos, 1, pure=True)
 
     def get_variable(self, name: str):
         if name == "top":
@@ -115,12 +187,60 @@ class TPVEnviroment(Enviroment):
         return super().get_variable(name)
 
     def command_size(self, width: float, height: float):
-        self.image = Image.new("RGB", (int(width), int(height)), "lightgray")
-        self.draw = ImageDraw.Draw(self.image)
+        background = BACKGROUND
+        if self.palette is not None:
+            background = self.inks[BACKGROUND]
+
+        if self.rasterizer == "tiled":
+            # nothing is allocated, the canvas is written tile by tile
+            self.tiled_canvas = TiledCanvas(int(width), int(height),
+                                            background, self.palette)
+            self.display_list = self.tiled_canvas.display_list
+            return
+
+        if self.rasterizer == "numpy":
+            if int(width) < 0 or int(height) < 0:
+                raise ValueError("Width and height must be >= 0")
+
+            # the image is only created from the canvas by flush
+            spare = self.spare
+            if isinstance(spare, NumpyRasterizer) and \
+                    spare.width == int(width) and \
+                    spare.height == int(height):
+                spare.clear(background)
+                self.numpy_rasterizer = spare
+            else:
+                self.numpy_rasterizer = NumpyRasterizer(
+                    int(width), int(height), background,
+                    indexed=self.palette is not None)
+            self.display_list = DisplayList()
+            return
+
+        mode = "RGB" if self.palette is None else "P"
+        size = (int(width), int(height))
+        spare = self.spare
+        if isinstance(spare, Image.Image) and spare.mode == mode and \
+                spare.size == size:
+            spare.paste(background, (0, 0) + size)
+            self.image = spare
+        else:
+            self.image = Image.new(mode, size, background)
+        self.draw = FlippedDraw(self.image)
+
+        if self.record:
+            self.display_list = DisplayList()
 
     def command_line(self, color: str, x1: float, y1: float, x2: float,
                      y2: float, thickness: float):
         shape = (int(x1), int(y1), int(x2), int(y2))
+
+        if self.palette is not None:
+            color = self.palette_ink(color)
+
+        if self.record:
+            self.record_primitive(LINE, color, shape, int(thickness))
+            return
+
         self.draw.line(shape, fill=color, width=int(thickness))
 
     def command_rect(self, color: str, x1: float, y1: float, width: float,
@@ -128,7 +248,12 @@ class TPVEnviroment(Enviroment):
         shape = (int(x1), int(y1), int(x1 + width), int(y1 + height))
         thickness = int(thickness)
 
-        if thickness == 0:
+        if self.palette is not None:
+            color = self.palette_ink(color)
+
+        if self.record:
+            self.record_primitive(RECT, color, shape, thickness)
+        elif thickness == 0:
             self.draw.rectangle(shape, fill=color)
         else:
             self.draw.rectangle(shape, outline=color, width=thickness)
@@ -138,13 +263,75 @@ class TPVEnviroment(Enviroment):
         shape = (int(x1), int(y1), int(x1 + width), int(y1 + height))
         thickness = int(thickness)
 
-        if thickness == 0:
+        if self.palette is not None:
+            color = self.palette_ink(color)
+
+        if self.record:
+            self.record_primitive(OVAL, color, shape, thickness)
+        elif thickness == 0:
             self.draw.ellipse(shape, fill=color)
         else:
             self.draw.ellipse(shape, outline=color, width=thickness)
 
+    def record_primitive(self, kind: int, color: str, shape: tuple,
+                         thickness: int):
+        # fail on the same input as ImageDraw would, but right away
+        x1, y1, x2, y2 = shape
+        if kind != LINE:
+            if x2 < x1:
+                raise ValueError("x1 must be greater than or equal to x0")
+            if y2 < y1:
+                raise ValueError("y1 must be greater than or equal to y0")
+
+        if isinstance(color, str):
+            ImageColor.getcolor(color, "RGB")
+
+        self.display_list.append(kind, color, x1, y1, x2, y2, thickness)
+
+    def palette_ink(self, color) -> int:
+        """The palette index of a color, adding it when it is missing."""
+        if isinstance(color, (str, int)) and color in self.inks:
+            return self.inks[color]
+
+        if isinstance(color, str):
+            rgb = ImageColor.getrgb(color)[:3]
+        elif isinstance(color, int):
+            # numbers are packed colors, unpacked the way Pillow does
+            rgb = color & 0xFF, (color >> 8) & 0xFF, (color >> 16) & 0xFF
+        else:
+            raise TypeError("color must be int or tuple")
+
+        if rgb not in self.palette:
+            if len(self.palette) == MAX_PALETTE_SIZE:
+                raise Exception(f"Palette canvas cannot hold more than "
+                                f"{MAX_PALETTE_SIZE} colors")
+
+            self.palette.append(rgb)
+
+        self.inks[color] = self.palette.index(rgb)
+        return self.inks[color]
+
+    def flush(self):
+        """Culls and rasterizes the recorded primitives."""
+        if self.tiled_canvas is not None:
+            return
+
+        if self.numpy_rasterizer is not None:
+            rasterizer = self.numpy_rasterizer
+            self.display_list.cull(rasterizer.width, rasterizer.height)
+            rasterizer.rasterize(self.display_list)
+            self.image = rasterizer.image()
+            self.draw = FlippedDraw(self.image)
+        elif self.display_list is not None and len(self.display_list):
+            self.display_list.cull(*self.image.size)
+            self.display_list.rasterize(self.draw)
+
+        if self.palette is not None and self.image is not None:
+            self.image.putpalette([channel for rgb in self.palette
+                                   for channel in rgb])
+
     def command_stop(self):
-        raise StopException()
+        self.stopped = True
 
     def function_sin(self, value: float) -> float:
         return math.sin(math.radians(value))
@@ -4,3 +4,40 @@ class ReturnException(Exception):
 
 class StopException(Exception):
     pass
+
+
+class LimitExceeded(Exception):
+    """
+    A run hit one of its execution limits. `limit` names it, `value` is its
+    configured maximum and `line` the source line it was hit at, 0 when
+    unknown.
+    """
+
+    DESCRIPTIONS = {
+        "statements": "statement count",
+        "deadline": "run time in seconds",
+        "stack": "stack depth",
+        "call depth": "call depth",
+        "primitives": "primitive count",
+    }
+
+    def __init__(self, limit: str, value, line: int = 0):
+        self.limit = limit
+        self.value = value
+        self.line = line
+
+        message = f"Maximum {self.DESCRIPTIONS[limit]} of {value} exceeded"
+        if line:
+            message += f" (line {line})"
+        super().__init__(message)
+
+
+class ValidationError(Exception):
+    """
+    A program failed validation before running, `problems` holds every
+    Problem found, see Validator.
+    """
+
+    def __init__(self, problems: list):
+        self.problems = problems
+        super().__init__("\n".join(map(str, problems)))
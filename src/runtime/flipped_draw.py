@@ -0,0 +1,74 @@
+from typing import Optional
+from PIL import Image, ImageDraw
+from runtime.numpy_rasterizer import wide_line_corners
+
+
+class FlippedDraw():
+    """
+    Draws with the y axis pointing up, so the finished canvas does not have
+    to be flipped. Every primitive sets exactly the pixels ImageDraw would
+    set on an image that is flipped afterwards.
+
+    Mirroring the coordinates is enough for most shapes. Wide lines are not
+    symmetric, Pillow puts the extra pixel of even widths below the line,
+    so their polygon is mirrored instead. Outline rects lower than twice
+    their width draw a few pixels around their box and are drawn
+    on a scratch image.
+
+    The image may be a tile of a larger canvas of the given `height`, whose
+    top left corner is at `left` and `top` of the (already flipped) canvas.
+    """
+
+    def __init__(self, image: Image.Image, left: int = 0, top: int = 0,
+                 height: Optional[int] = None):
+        if height is None:
+            height = image.height
+
+        self.image = image
+        self.draw = ImageDraw.Draw(image)
+        self.left = left
+        self.bottom = height - 1 - top
+
+    def line(self, xy: tuple, fill=None, width: int = 0):
+        x1, y1, x2, y2 = xy
+        left, bottom = self.left, self.bottom
+
+        if width == 1 or width == 0 or (x1 == x2 and y1 == y2):
+            self.draw.line((x1 - left, bottom - y1, x2 - left, bottom - y2),
+                           fill=fill, width=width)
+            return
+
+        corners = wide_line_corners(x1, y1, x2, y2, width)
+        self.draw.polygon([(x - left, bottom - y) for x, y in corners],
+                          fill=fill)
+
+    def rectangle(self, xy: tuple, fill=None, outline=None, width: int = 1):
+        x1, y1, x2, y2 = xy
+
+        if outline is not None and x1 <= x2 and y1 <= y2 < y1 + 2 * width - 1:
+            self.flipped_rectangle(xy, outline, width)
+            return
+
+        self.draw.rectangle(self.mirror(xy), fill=fill, outline=outline,
+                            width=width)
+
+    def ellipse(self, xy: tuple, fill=None, outline=None, width: int = 1):
+        self.draw.ellipse(self.mirror(xy), fill=fill, outline=outline,
+                          width=width)
+
+    def mirror(self, xy: tuple) -> tuple:
+        x1, y1, x2, y2 = xy
+        return (x1 - self.left, self.bottom - y2, x2 - self.left,
+                self.bottom - y1)
+
+    def flipped_rectangle(self, xy: tuple, outline, width: int):
+        x1, y1, x2, y2 = xy
+        mask = Image.new("1", (x2 - x1 + 1 + 2 * width,
+                               y2 - y1 + 1 + 2 * width))
+        ImageDraw.Draw(mask).rectangle(
+            (width, width, x2 - x1 + width, y2 - y1 + width), outline=1,
+            width=width)
+
+        self.image.paste(outline, (x1 - self.left - width,
+                                   self.bottom - y2 - width),
+                         mask.transpose(Image.FLIP_TOP_BOTTOM))
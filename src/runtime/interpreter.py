@@ -1,41 +1,451 @@
 from frontend.parser import Parser
 from PIL import Image
 from runtime.enviroment import TPVEnviroment
-from runtime.exceptions import StopException, ReturnException
+from runtime.exceptions import LimitExceeded, StopException, \
+    ReturnException, ValidationError
+from runtime.compiler import BINARY_OPERATORS, ClosureCompiler
+from runtime.bytecode import BytecodeCompiler, VirtualMachine
+from runtime.transpiler import compile_python, execute_python
+from runtime.tiled_canvas import DEFAULT_TILE_SIZE
+from runtime.display_list import DisplayList
+from runtime.program_cache import ProgramCache, default_cache
+from runtime.profiler import Profiler
+from runtime.limits import Limits, PRIMITIVE_COMMANDS, weight
+from optimizer.inlining import DEFAULT_INLINE_SIZE
+from optimizer.optimizer import Optimizer
+from optimizer.analysis import summarize_procedures
+from runtime.memo import DEFAULT_MAX_ENTRIES, ProcedureMemo
+from runtime.validator import Problem, Validator
+from optimizer.parameters import parameter_values, parameterize
 from frontend.tpv_ast import Assignment, BinaryExpression, CallFn, \
     CallProcedure, Expression, Identifier, IfBlock, NoOp, \
-    NumericLiteral, PopStack, ProcedureDeclaration, PushStack, Return, \
-    IntDeclaration, Statement, Command, UnaryExpression, WhileBlock
+    NumericLiteral, PopStack, ProcedureDeclaration, Program, PushStack, \
+    Return, IntDeclaration, Statement, Command, UnaryExpression, \
+    WhileBlock
 import numbers
+from contextlib import nullcontext
+from typing import Optional, Union
+
+ENGINES = ("tree", "closure", "bytecode", "python")
+DEFAULT_MAX_CALL_DEPTH = 100000
 
 
 class Interpreter():
-    def __init__(self, source: str):
-        self.ast = Parser(source).parse()
-        self.enviroment = TPVEnviroment()
+    def __init__(self, source: str, engine: str = "tree",
+                 optimize: bool = False,
+                 max_call_depth: int = DEFAULT_MAX_CALL_DEPTH,
+                 record: bool = False, rasterizer: str = "pillow",
+                 palette: bool = False,
+                 cache: Union[bool, ProgramCache] = True,
+                 profiler: Optional[Profiler] = None,
+                 limits: Optional[Limits] = None,
+                 parameters: Optional[dict] = None,
+                 memoize: Union[bool, int] = False,
+                 inline_size: int = DEFAULT_INLINE_SIZE,
+                 fast: bool = False):
+        """
+        The parsed program is looked up in `cache`, the shared on-disk
+        cache when it is True, and parsed only on a miss. False bypasses
+        caching.
+
+        A `profiler` collects the time of the phases and commands, and with
+        the tree engine of every line and procedure. `limits` bound the
+        execution, their call depth replaces `max_call_depth`.
+
+        `parameters` are numeric variables of the program given from the
+        outside, see `parameterize`, with their values for the first run.
+
+        With `memoize`, the tree engine remembers the effects of procedure
+        calls, see ProcedureMemo, up to `memoize` of them when it is a
+        number.
+
+        `optimize` inlines procedures of at most `inline_size` statements,
+        see ProcedureInlining, 0 inlines none.
+
+        With `fast`, the program is validated before it runs, see
+        Validator, failing with a ValidationError holding every problem.
+        Runs then call commands and functions without checking their names
+        and arities and, when arithmetic was shown to only see numbers,
+        compute without checking the operand types.
+        """
+        if engine not in ENGINES:
+            raise Exception(f"Unknown engine '{engine}', "
+                            f"expected one of {', '.join(ENGINES)}")
+
+        self.profiler = profiler
+        # the profiler of the commands, lines and procedures
+        self.tracer = profiler if profiler is not None and \
+            profiler.detailed else None
+        self.parameters = parameter_values(parameters or {})
+        self.inline_size = inline_size
+        # the optimizer that shaped the program, None when it was cached
+        self.optimizer = None
+        self.enviroment = TPVEnviroment(record, rasterizer, palette)
+        self.enviroment.reset(self.parameters)
+        if self.tracer is not None:
+            self.tracer.instrument(self.enviroment)
+
+        self.ast = self.load_program(source, optimize,
+                                     default_cache() if cache is True
+                                     else cache)
+
         self.procedures = {}
+        self.engine = engine
+        self.max_call_depth = max_call_depth
+        self.limits = limits
+        # statements charged per run of a block, by the id of its list
+        self.weights = {}
+        # the program compiled for the engine, made on the first run
+        self.compiled = None
+
+        if limits is not None and limits.max_call_depth is not None:
+            self.max_call_depth = limits.max_call_depth
+
+        self.memo = None
+        if memoize:
+            if engine != "tree":
+                raise Exception("Procedure memoization needs the tree engine")
+            if limits is not None or self.tracer is not None:
+                raise Exception("Procedure memoization cannot be combined "
+                                "with execution limits or profiling")
+
+            pure = {name for name, function
+                    in self.enviroment.functions.items() if function.pure}
+            self.memo = ProcedureMemo(
+                summarize_procedures(self.ast), pure,
+                DEFAULT_MAX_ENTRIES if memoize is True else memoize)
+
+        # arithmetic was validated to only see numbers
+        self.typed = False
+        if fast:
+            problems = self.validate()
+            if problems:
+                raise ValidationError(problems)
+
+            self.typed = self.validator.typed
+            self.command_methods = {name: command.method for name, command
+                                    in self.enviroment.commands.items()}
+            self.function_methods = {name: function.method
+                                     for name, function
+                                     in self.enviroment.functions.items()}
+            self.execute_command = self.execute_command_unchecked
+            self.call_function = self.call_function_unchecked
+            if self.typed:
+                self.evaluate_binary_expression = \
+                    self.evaluate_binary_unchecked
+
+    def validate(self) -> list[Problem]:
+        """Checks the program before it runs, see Validator."""
+        self.validator = Validator(self.enviroment)
+        return self.validator.validate(self.ast)
+
+    def load_program(self, source: str, optimize: bool,
+                     cache: Union[bool, ProgramCache]) -> Program:
+        if cache:
+            with self.phase("load"):
+                key = cache.key(source, optimize, self.parameters,
+                                self.inline_size)
+                program = cache.load(key)
+            if program is not None:
+                return program
+
+        with self.phase("lex"):
+            parser = Parser(source)
+        with self.phase("parse"):
+            program = parser.parse()
+        if self.parameters:
+            program = parameterize(program, self.parameters)
+        if optimize:
+            with self.phase("optimize"):
+                self.optimizer = Optimizer(self.enviroment,
+                                           self.inline_size)
+                program = self.optimizer.optimize(program)
+
+        if cache:
+            cache.store(key, program)
+
+        return program
 
     def run(self) -> Image.Image:
-        self.load_procedures()
+        if self.enviroment.rasterizer == "tiled":
+            raise Exception("The tiled rasterizer writes its image with "
+                            "render_tiled")
 
-        try:
-            for statement in self.ast.statements:
-                self.evaluate(statement)
-        except StopException:
-            pass
+        self.run_program()
 
         if self.enviroment.image is None:
             raise Exception(
                 "Missing or unreachable SIZE command, cannot create image")
 
-        return self.enviroment.image.transpose(Image.FLIP_TOP_BOTTOM)
+        # drawing already mirrored the y axis, the canvas is the image
+        return self.enviroment.image
+
+    def render_tiled(self, path: str, format: str = "png",
+                     tile_size: int = DEFAULT_TILE_SIZE, jobs: int = 1,
+                     compression: Optional[int] = None):
+        """
+        Runs the program on the tiled rasterizer and writes the image into
+        `path` tile by tile, never holding the whole canvas in memory.
+        """
+        if self.enviroment.rasterizer != "tiled":
+            raise Exception("render_tiled needs the tiled rasterizer")
+
+        self.run_program()
+
+        if self.enviroment.tiled_canvas is None:
+            raise Exception(
+                "Missing or unreachable SIZE command, cannot create image")
+
+        with self.phase("rasterize"):
+            self.enviroment.tiled_canvas.write(path, format, tile_size, jobs,
+                                               compression)
+
+    def record_display_list(self) -> tuple[int, int, DisplayList]:
+        """
+        Runs the program on the tiled rasterizer and returns the width and
+        height of its canvas and its culled display list, without
+        rasterizing anything.
+        """
+        if self.enviroment.rasterizer != "tiled":
+            raise Exception("record_display_list needs the tiled rasterizer")
+
+        with self.phase("execute"):
+            self.execute_program()
+
+        canvas = self.enviroment.tiled_canvas
+        if canvas is None:
+            raise Exception(
+                "Missing or unreachable SIZE command, cannot create image")
+
+        canvas.display_list.cull(canvas.width, canvas.height)
+        return canvas.width, canvas.height, canvas.display_list
+
+    def phase(self, name: str):
+        """Times a phase of the run when profiling."""
+        if self.profiler is None:
+            return nullcontext()
+
+        return self.profiler.phase(name)
+
+    def run_program(self):
+        with self.phase("execute"):
+            self.execute_program()
+
+        with self.phase("rasterize"):
+            self.enviroment.flush()
+
+    def execute_program(self):
+        limits = self.limits
+        if limits is not None:
+            limits.start()
+
+        try:
+            if self.compiled is None:
+                self.compile()
+
+            if self.engine == "closure":
+                self.compiled()
+            elif self.engine == "bytecode":
+                VirtualMachine(self.compiled, self.enviroment,
+                               self.max_call_depth, limits,
+                               self.typed).run()
+            elif self.engine == "python":
+                execute_python(self.compiled, self.enviroment, limits)
+            else:
+                # only the tree engine reports lines and procedures
+                if self.tracer is not None:
+                    self.tracer.start()
+
+                if self.memo is not None:
+                    # a failed run may have left calls unfinished
+                    self.memo.recordings.clear()
+
+                self.load_procedures()
+                self.execute(self.ast.statements)
+        except StopException:
+            pass
+        finally:
+            if self.tracer is not None:
+                self.tracer.stop()
+
+    def compile(self):
+        """
+        Compiles the program for the engine once, every later run reuses
+        it. The tree engine runs the AST itself.
+        """
+        if self.engine == "closure":
+            self.compiled = ClosureCompiler(
+                self.enviroment, self.limits, self.typed).compile(self.ast)
+        elif self.engine == "bytecode":
+            self.compiled = BytecodeCompiler(
+                self.enviroment.vars, self.limits).compile(self.ast)
+        elif self.engine == "python":
+            self.compiled = compile_python(self.ast, self.enviroment,
+                                           self.limits, self.typed)
+        else:
+            self.compiled = self.ast
+
+    def reset(self, parameters: Optional[dict] = None,
+              reuse_canvas: bool = False):
+        """
+        Prepares the enviroment for running the program again, with new
+        values of some of its parameters.
+        """
+        values = dict(self.parameters)
+        for name, value in parameter_values(parameters or {}).items():
+            if name not in values:
+                raise Exception(f"'{name}' is not a parameter of the "
+                                f"program")
+            values[name] = value
+
+        self.enviroment.reset(values, reuse_canvas)
 
     def load_procedures(self):
         for statement in self.ast.statements:
             if isinstance(statement, ProcedureDeclaration):
                 self.procedures[statement.name.name] = statement
 
+    def execute(self, statements: list[Statement]):
+        """
+        Runs the statements on an explicit stack of blocks instead of
+        recursing in Python. Every block is a [statements, index, loop] list,
+        where loop is the WhileBlock whose body the block is. Procedure
+        frames are the positions of their body blocks on the block stack.
+        """
+        enviroment = self.enviroment
+        profiler = self.tracer
+        memo = self.memo
+        limits = self.limits
+        counts = limits is not None and limits.counts
+        primitives = limits is not None and \
+            limits.max_primitives is not None
+        blocks = [[statements, 0, None]]
+        frames = []
+
+        while blocks:
+            block = blocks[-1]
+            body, index, loop = block
+
+            if index == len(body):
+                if loop is not None:
+                    if profiler is not None:
+                        profiler.mark(loop.line)
+
+                    if self.evaluate_expression(loop.condition) > 0:
+                        block[1] = 0
+                        if counts:
+                            self.charge(body, loop.line)
+                        continue
+
+                blocks.pop()
+                if frames and frames[-1] == len(blocks):
+                    frames.pop()
+                    if profiler is not None:
+                        profiler.leave()
+                    if memo is not None and memo.recordings and \
+                            memo.recordings[-1].depth > len(frames):
+                        memo.finish(enviroment.vars, enviroment.stack)
+                continue
+
+            block[1] = index + 1
+            statement = body[index]
+
+            if profiler is not None:
+                profiler.mark(statement.line)
+
+            if isinstance(statement, Command):
+                if primitives and \
+                        statement.command.name in PRIMITIVE_COMMANDS:
+                    limits.primitive(statement.line)
+
+                args = self.execute_command(statement)
+                if memo is not None and memo.recordings:
+                    memo.command(statement.command.name, args)
+
+                if enviroment.stopped:
+                    return
+
+            elif isinstance(statement, IfBlock):
+                if self.evaluate_expression(statement.condition) > 0:
+                    blocks.append([statement.body, 0, None])
+                else:
+                    blocks.append([statement.else_body, 0, None])
+
+            elif isinstance(statement, WhileBlock):
+                if self.evaluate_expression(statement.condition) > 0:
+                    blocks.append([statement.body, 0, statement])
+                    if counts:
+                        self.charge(statement.body, statement.line)
+
+            elif isinstance(statement, CallProcedure):
+                name = statement.name.name
+
+                if name not in self.procedures:
+                    raise Exception(f"Procedure {name} not found")
+
+                key = None
+                if memo is not None:
+                    key = memo.key(name, enviroment.vars)
+                    effect = None if key is None else memo.lookup(key)
+                    if effect is not None:
+                        self.replay(effect)
+                        continue
+
+                if len(frames) >= self.max_call_depth:
+                    raise LimitExceeded("call depth", self.max_call_depth,
+                                        statement.line)
+
+                frames.append(len(blocks))
+                if key is not None:
+                    memo.start(key, len(frames), len(enviroment.stack))
+                blocks.append([self.procedures[name].body, 0, None])
+                if counts:
+                    self.charge(self.procedures[name].body, statement.line)
+                if profiler is not None:
+                    profiler.enter(name)
+
+            elif isinstance(statement, Return):
+                if not frames:
+                    raise ReturnException()
+
+                del blocks[frames.pop():]
+                if profiler is not None:
+                    profiler.leave()
+                if memo is not None and memo.recordings and \
+                        memo.recordings[-1].depth > len(frames):
+                    memo.finish(enviroment.vars, enviroment.stack)
+
+            else:
+                self.evaluate(statement)
+
+    def replay(self, effect: tuple):
+        """Applies the remembered effect of a procedure call."""
+        writes, commands, pushed = effect
+        vars = self.enviroment.vars
+
+        for name, value in writes:
+            vars[name] = value
+
+        for name, args in commands:
+            self.enviroment.call_command(name, args)
+            if self.memo.recordings:
+                self.memo.command(name, args)
+
+        self.enviroment.extend_stack(pushed)
+
+    def charge(self, body: list[Statement], line: int):
+        """Charges one run of `body` to the statement limit."""
+        amount = self.weights.get(id(body))
+        if amount is None:
+            amount = self.weights[id(body)] = weight(body)
+
+        limits = self.limits
+        limits.remaining -= amount
+        if limits.remaining <= 0:
+            limits.exhausted(line)
+
     def evaluate(self, statement: Statement):
+        """Evaluates a statement that does not transfer control."""
         if isinstance(statement, Expression):
             self.evaluate_expression(statement)
             return
@@ -48,22 +458,10 @@ class Interpreter():
             self.evaluate_int_declaration(statement)
             return
 
-        if isinstance(statement, IfBlock):
-            self.evaluate_if_block(statement)
-            return
-
-        if isinstance(statement, WhileBlock):
-            self.evaluate_while_block(statement)
-            return
-
         if isinstance(statement, Assignment):
             self.evaluate_assignment(statement)
             return
 
-        if isinstance(statement, CallProcedure):
-            self.evaluate_call_procedure(statement)
-            return
-
         if isinstance(statement, PushStack):
             self.evaluate_push_stack(statement)
             return
@@ -72,9 +470,6 @@ class Interpreter():
             self.evaluate_pop_stack(statement)
             return
 
-        if isinstance(statement, Return):
-            raise ReturnException()
-
         # skip as procedures are loaded in advance
         if isinstance(statement, ProcedureDeclaration):
             return
@@ -127,6 +522,13 @@ class Interpreter():
         raise Exception(
             f"Unimplemented binary expression operator: {expression.operator}")
 
+    def evaluate_binary_unchecked(self,
+                                  expression: BinaryExpression) -> float:
+        """evaluate_binary_expression of a validated, typed program."""
+        return BINARY_OPERATORS[expression.operator](
+            self.evaluate_expression(expression.left),
+            self.evaluate_expression(expression.right))
+
     def evaluate_unary_expression(self, expression: UnaryExpression) -> float:
         value = self.evaluate_expression(expression.expression)
 
@@ -142,45 +544,31 @@ class Interpreter():
 
         return self.enviroment.call_function(name, args)
 
+    def call_function_unchecked(self, expression: CallFn) -> float:
+        """call_function of a validated program."""
+        return self.function_methods[expression.name.name](
+            *self.evaluate_args(expression.args))
+
     def evaluate_int_declaration(self, declaration: IntDeclaration):
         for var in declaration.vars:
             self.enviroment.declare_variable(var.name)
 
-    def execute_command(self, command: Command):
+    def execute_command(self, command: Command) -> list:
         name = command.command.name
         args = self.evaluate_args(command.args)
 
         self.enviroment.call_command(name, args)
+        return args
 
-    def evaluate_args(self, args: list[Expression]) -> list:
-        return list(map(self.evaluate_expression, args))
-
-    def evaluate_if_block(self, ifblock: IfBlock):
-        condition = self.evaluate_expression(ifblock.condition)
-
-        if condition > 0:
-            for statement in ifblock.body:
-                self.evaluate(statement)
-        else:
-            for statement in ifblock.else_body:
-                self.evaluate(statement)
-
-    def evaluate_while_block(self, whileblock: WhileBlock):
-        while self.evaluate_expression(whileblock.condition) > 0:
-            for statement in whileblock.body:
-                self.evaluate(statement)
+    def execute_command_unchecked(self, command: Command) -> list:
+        """execute_command of a validated program."""
+        args = self.evaluate_args(command.args)
 
-    def evaluate_call_procedure(self, call: CallProcedure):
-        name = call.name.name
+        self.command_methods[command.command.name](*args)
+        return args
 
-        if name in self.procedures:
-            try:
-                for statement in self.procedures[name].body:
-                    self.evaluate(statement)
-            except ReturnException:
-                pass
-        else:
-            raise Exception(f"Procedure {name} not found")
+    def evaluate_args(self, args: list[Expression]) -> list:
+        return list(map(self.evaluate_expression, args))
 
     def evaluate_assignment(self, assignment: Assignment):
         value = self.evaluate_expression(assignment.expression)
@@ -190,6 +578,9 @@ class Interpreter():
         args = self.evaluate_args(push.args)
         self.enviroment.extend_stack(args)
 
+        if self.limits is not None and self.limits.max_stack is not None:
+            self.limits.check_stack(len(self.enviroment.stack), push.line)
+
     def evaluate_pop_stack(self, pop: PopStack):
         for var in pop.vars:
             self.enviroment.assign_variable(
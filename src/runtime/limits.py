@@ -0,0 +1,105 @@
+import time
+from typing import Optional
+from frontend.tpv_ast import IfBlock, Statement
+from runtime.exceptions import LimitExceeded
+
+# commands that draw a primitive
+PRIMITIVE_COMMANDS = ("line", "rect", "oval")
+
+# statements charged between two looks at the clock
+CHECK_INTERVAL = 4096
+
+
+def weight(statements: list[Statement]) -> int:
+    """
+    Statements charged for one run of a block: every statement counts once,
+    an IF its longer branch too. A nested WHILE counts once, its iterations
+    are charged by the loop itself.
+    """
+    total = 0
+
+    for statement in statements:
+        total += 1
+        if isinstance(statement, IfBlock):
+            total += max(weight(statement.body), weight(statement.else_body))
+
+    return max(total, 1)
+
+
+class Limits():
+    """
+    Execution limits of a run, all optional: the number of statements, a
+    deadline in seconds, the depth of the TPV stack and of procedure calls
+    and the number of drawn primitives. A limit that is hit raises
+    LimitExceeded with the limit and the line it was hit at.
+
+    Statements are charged where code can repeat, by every loop iteration
+    and procedure call with the weight of its body, so all engines count
+    the same and straight line code is never interrupted. The engines
+    subtract from `remaining` and call `exhausted` once it runs out, which
+    is also when the clock is read.
+
+    Engines only compile the checks in when the Interpreter is given limits.
+    A Limits instance holds the state of one run at a time.
+    """
+
+    def __init__(self, max_statements: Optional[int] = None,
+                 deadline: Optional[float] = None,
+                 max_stack: Optional[int] = None,
+                 max_call_depth: Optional[int] = None,
+                 max_primitives: Optional[int] = None):
+        self.max_statements = max_statements
+        self.deadline = deadline
+        self.max_stack = max_stack
+        self.max_call_depth = max_call_depth
+        self.max_primitives = max_primitives
+        self.start()
+
+    def start(self):
+        """Resets the counters and starts the clock of a run."""
+        self.expires = None if self.deadline is None \
+            else time.monotonic() + self.deadline
+        self.executed = 0
+        self.primitives = 0
+        self.depth = 0
+        self.chunk = self.next_chunk()
+        self.remaining = self.chunk
+
+    @property
+    def counts(self) -> bool:
+        """Whether statements have to be charged at all."""
+        return self.max_statements is not None or self.deadline is not None
+
+    def next_chunk(self) -> int:
+        if self.max_statements is None:
+            return CHECK_INTERVAL
+
+        return max(min(CHECK_INTERVAL, self.max_statements - self.executed),
+                   0)
+
+    def exhausted(self, line: int = 0):
+        """Called once `remaining` is used up, raises if a limit is hit."""
+        self.executed += self.chunk - self.remaining
+
+        if self.max_statements is not None and \
+                self.executed > self.max_statements:
+            raise LimitExceeded("statements", self.max_statements, line)
+
+        if self.expires is not None and time.monotonic() > self.expires:
+            raise LimitExceeded("deadline", self.deadline, line)
+
+        self.chunk = self.next_chunk()
+        self.remaining = self.chunk
+
+    def check_stack(self, size: int, line: int = 0):
+        if size > self.max_stack:
+            raise LimitExceeded("stack", self.max_stack, line)
+
+    def check_call_depth(self, depth: int, line: int = 0):
+        if depth > self.max_call_depth:
+            raise LimitExceeded("call depth", self.max_call_depth, line)
+
+    def primitive(self, line: int = 0):
+        self.primitives += 1
+        if self.primitives > self.max_primitives:
+            raise LimitExceeded("primitives", self.max_primitives, line)
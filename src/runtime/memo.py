@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from typing import Optional
+from optimizer.analysis import ProcedureSummary
+
+DEFAULT_MAX_ENTRIES = 4096
+
+# calls drawing more primitives than this are not remembered, one entry
+# could hold most of the image
+MAX_FRAGMENT = 10000
+
+
+class Recording():
+    """A call being executed whose effect is remembered once it returns."""
+
+    def __init__(self, key: tuple, depth: int, stack_size: int):
+        self.key = key
+        self.depth = depth
+        self.stack_size = stack_size
+        self.commands = []
+
+
+class ProcedureMemo():
+    """
+    Remembers the effect of procedure calls: the values they leave in the
+    variables they write, the values they push and the primitives they
+    draw, by the procedure and the values of the variables it reads or may
+    leave as they were. A later call seeing the same values replays the
+    effect instead of running.
+
+    Only procedures whose summary shows no other dependency are remembered,
+    those not declaring variables, not reading the stack and running no
+    commands but primitives and no functions but pure ones. At most
+    `max_entries` effects are kept, the least recently used are evicted.
+    """
+
+    def __init__(self, summaries: dict[str, ProcedureSummary],
+                 pure_functions: set[str],
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.summaries = {}
+        self.skipped = {}
+        for name, summary in summaries.items():
+            reason = summary.impurity(pure_functions)
+            if reason is None:
+                # a variable written on some paths only keeps its value on
+                # the others, which the key must hold too
+                kept = summary.writes - summary.definite_writes
+                self.summaries[name] = (
+                    tuple(sorted(summary.reads | kept)),
+                    tuple(sorted(summary.writes)))
+            else:
+                self.skipped[name] = reason
+
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.recordings = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, name: str, vars: dict) -> Optional[tuple]:
+        """The key of a call, None when it cannot be remembered."""
+        summary = self.summaries.get(name)
+        if summary is None:
+            return None
+
+        try:
+            # 1 and 1.0 compare equal but may not compute the same
+            return (name,) + tuple((vars[read].__class__, vars[read])
+                                   for read in summary[0])
+        except KeyError:
+            # reads a variable that is not declared, which fails normally
+            return None
+
+    def lookup(self, key: tuple) -> Optional[tuple]:
+        """The remembered (writes, commands, pushed) of a call."""
+        effect = self.entries.get(key)
+        if effect is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return effect
+
+    def start(self, key: tuple, depth: int, stack_size: int):
+        """Records the call that runs at frame `depth`."""
+        self.recordings.append(Recording(key, depth, stack_size))
+
+    def command(self, name: str, args: list):
+        for recording in self.recordings:
+            # one past the limit marks the recording as too large
+            if len(recording.commands) <= MAX_FRAGMENT:
+                recording.commands.append((name, args))
+
+    def finish(self, vars: dict, stack: list):
+        """Stores the effect of the innermost recorded call, which returned."""
+        recording = self.recordings.pop()
+        if len(recording.commands) > MAX_FRAGMENT:
+            return
+
+        try:
+            writes = tuple((name, vars[name])
+                           for name in self.summaries[recording.key[0]][1])
+        except KeyError:
+            # a write on a path not taken to a variable not declared
+            return
+        self.entries[recording.key] = (
+            writes, tuple(recording.commands),
+            tuple(stack[recording.stack_size:]))
+
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        calls = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / calls if calls else None,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "memoized": sorted(self.summaries),
+            "skipped": self.skipped,
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        hit_rate = "-" if stats["hit_rate"] is None \
+            else f"{100 * stats['hit_rate']:.1f}%"
+        lines = [f"Memoized calls: {stats['hits']} hit(s), "
+                 f"{stats['misses']} miss(es), {hit_rate} hit rate, "
+                 f"{stats['evictions']} eviction(s)"]
+
+        for name, reason in sorted(self.skipped.items()):
+            lines.append(f"  {name} not memoized, it {reason}")
+
+        return "\n".join(lines)
@@ -0,0 +1,320 @@
+import math
+from PIL import Image, ImageColor, ImageDraw
+from runtime.display_list import DisplayList, LINE, RECT
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class NumpyRasterizer():
+    """
+    Rasterizes a display list into a NumPy array instead of going through
+    ImageDraw. Consecutive primitives of the same color are merged into one
+    boolean mask and painted with a single assignment; rects are drawn by
+    slicing, lines and ovals by evaluating their shape on pixel grids.
+
+    Rects and lines match Pillow exactly, ovals are a close approximation of
+    its scan conversion. Outline rects narrower or lower than twice their
+    width draw a few pixels around their box and are drawn with Pillow on a
+    scratch mask, as `FlippedDraw` does.
+
+    An `indexed` canvas holds one palette index per pixel, its inks and
+    background are indices already.
+
+    Like `FlippedDraw`, primitives are given with the y axis pointing up and
+    are mirrored while they are painted.
+    """
+
+    def __init__(self, width: int, height: int, background,
+                 indexed: bool = False):
+        if np is None:
+            raise Exception("The numpy rasterizer requires NumPy to be "
+                            "installed")
+
+        self.width = width
+        self.height = height
+        self.bottom = height - 1
+        self.indexed = indexed
+
+        if indexed:
+            self.canvas = np.empty((height, width), dtype=np.uint8)
+        else:
+            self.canvas = np.empty((height, width, 3), dtype=np.uint8)
+        self.clear(background)
+
+    def clear(self, background):
+        """Fills the whole canvas with the background."""
+        self.canvas[:] = background if self.indexed \
+            else self.rgb(background)
+
+    def rgb(self, color) -> tuple[int, int, int]:
+        if isinstance(color, str):
+            return ImageColor.getrgb(color)[:3]
+
+        # integer inks are packed the way Pillow unpacks them for RGB
+        color = int(color)
+        return color & 0xFF, (color >> 8) & 0xFF, (color >> 16) & 0xFF
+
+    def rasterize(self, display_list: DisplayList):
+        batch = []
+        batch_ink = None
+
+        for item in display_list.primitives():
+            if item[1] != batch_ink and batch:
+                self.paint(batch, display_list.inks[batch_ink])
+                batch = []
+
+            batch_ink = item[1]
+            batch.append(item)
+
+        if batch:
+            self.paint(batch, display_list.inks[batch_ink])
+
+        display_list.clear()
+
+    def image(self) -> Image.Image:
+        return Image.fromarray(self.canvas, "P" if self.indexed else "RGB")
+
+    def paint(self, batch: list, color):
+        """Paints the union of the same colored primitives at once."""
+        boxes = [self.bounds(item) for item in batch]
+        boxes = [box for box in boxes if box is not None]
+        if not boxes:
+            return
+
+        left = min(box[0] for box in boxes)
+        top = min(box[1] for box in boxes)
+        right = max(box[2] for box in boxes)
+        bottom = max(box[3] for box in boxes)
+        mask = np.zeros((bottom - top, right - left), dtype=bool)
+
+        last = self.bottom
+        for kind, _, x1, y1, x2, y2, width in batch:
+            if kind == RECT:
+                self.rect_mask(mask, left, top, x1, last - y2, x2, last - y1,
+                               width)
+            elif kind == LINE:
+                self.line_mask(mask, left, top, x1, y1, x2, y2, width)
+            else:
+                self.oval_mask(mask, left, top, x1, last - y2, x2, last - y1,
+                               width)
+
+        ink = color if self.indexed else self.rgb(color)
+        self.canvas[top:bottom, left:right][mask] = ink
+
+    def bounds(self, item) -> tuple[int, int, int, int]:
+        """Clipped half-open pixel box the primitive may touch, or None."""
+        kind, _, x1, y1, x2, y2, width = item
+        if kind == LINE:
+            margin = abs(width) + 1
+        elif kind == RECT:
+            margin = max(width, 0)
+        else:
+            margin = 0
+
+        left = max(min(x1, x2) - margin, 0)
+        top = max(self.bottom - max(y1, y2) - margin, 0)
+        right = min(max(x1, x2) + margin + 1, self.width)
+        bottom = min(self.bottom - min(y1, y2) + margin + 1, self.height)
+
+        if left >= right or top >= bottom:
+            return None
+
+        return left, top, right, bottom
+
+    def fill(self, mask, left: int, top: int, x1: int, y1: int, x2: int,
+             y2: int):
+        """Sets the inclusive canvas box, clipped to the mask."""
+        height, width = mask.shape
+        x1, x2 = max(x1 - left, 0), min(x2 - left + 1, width)
+        y1, y2 = max(y1 - top, 0), min(y2 - top + 1, height)
+
+        if x1 < x2 and y1 < y2:
+            mask[y1:y2, x1:x2] = True
+
+    def rect_mask(self, mask, left: int, top: int, x1: int, y1: int,
+                  x2: int, y2: int, width: int):
+        if width == 0:
+            self.fill(mask, left, top, x1, y1, x2, y2)
+            return
+
+        # Pillow draws no outline of a negative width
+        if width < 0:
+            return
+
+        if x1 <= x2 and y1 <= y2 and (x2 < x1 + 2 * width - 1 or
+                                      y2 < y1 + 2 * width - 1):
+            self.short_rect_mask(mask, left, top, x1, y1, x2, y2, width)
+            return
+
+        self.fill(mask, left, top, x1, y1, x2, y1 + width - 1)
+        self.fill(mask, left, top, x1, y2 - width + 1, x2, y2)
+        self.fill(mask, left, top, x1, y1, x1 + width - 1, y2)
+        self.fill(mask, left, top, x2 - width + 1, y1, x2, y2)
+
+    def short_rect_mask(self, mask, left: int, top: int, x1: int, y1: int,
+                        x2: int, y2: int, width: int):
+        """
+        Pillow's outline of a box with overlapping sides, drawn on a scratch
+        image around the box and mirrored like the rest of the canvas.
+        """
+        scratch = Image.new("1", (x2 - x1 + 1 + 2 * width,
+                                  y2 - y1 + 1 + 2 * width))
+        ImageDraw.Draw(scratch).rectangle(
+            (width, width, x2 - x1 + width, y2 - y1 + width), outline=1,
+            width=width)
+        outline = np.asarray(scratch.transpose(Image.FLIP_TOP_BOTTOM))
+
+        height, mask_width = mask.shape
+        x, y = x1 - width - left, y1 - width - top
+        sx1, sx2 = max(x, 0), min(x + outline.shape[1], mask_width)
+        sy1, sy2 = max(y, 0), min(y + outline.shape[0], height)
+
+        if sx1 < sx2 and sy1 < sy2:
+            mask[sy1:sy2, sx1:sx2] |= outline[sy1 - y:sy2 - y, sx1 - x:sx2 - x]
+
+    def grid(self, mask, left: int, top: int, x1: int, y1: int, x2: int,
+             y2: int):
+        """Pixel coordinates of the part of the mask inside the box."""
+        height, width = mask.shape
+        sx1, sx2 = max(x1 - left, 0), min(x2 - left + 1, width)
+        sy1, sy2 = max(y1 - top, 0), min(y2 - top + 1, height)
+
+        if sx1 >= sx2 or sy1 >= sy2:
+            return None
+
+        ys, xs = np.ogrid[sy1 + top:sy2 + top, sx1 + left:sx2 + left]
+        return (slice(sy1, sy2), slice(sx1, sx2)), xs, ys
+
+    def oval_mask(self, mask, left: int, top: int, x1: int, y1: int,
+                  x2: int, y2: int, width: int):
+        # Pillow draws no outline of a negative width
+        if width < 0:
+            return
+
+        region = self.grid(mask, left, top, x1, y1, x2, y2)
+        if region is None:
+            return
+
+        window, xs, ys = region
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        rx, ry = (x2 - x1 + 1) / 2, (y2 - y1 + 1) / 2
+        inside = ((xs - cx) / rx) ** 2 + ((ys - cy) / ry) ** 2 <= 1
+
+        if width != 0:
+            irx, iry = rx - width, ry - width
+
+            if irx > 0 and iry > 0:
+                inside &= ((xs - cx) / irx) ** 2 + \
+                    ((ys - cy) / iry) ** 2 > 1
+
+        mask[window] |= inside
+
+    def line_mask(self, mask, left: int, top: int, x1: int, y1: int,
+                  x2: int, y2: int, width: int):
+        if width == 0:
+            return
+
+        last = self.bottom
+        if width == 1 or (x1 == x2 and y1 == y2):
+            self.thin_line_mask(mask, left, top, x1, last - y1, x2,
+                                last - y2)
+        else:
+            corners = wide_line_corners(x1, y1, x2, y2, width)
+            self.polygon_mask(mask, left, top,
+                              [(x, last - y) for x, y in corners])
+
+    def thin_line_mask(self, mask, left: int, top: int, x1: int, y1: int,
+                       x2: int, y2: int):
+        """Pillow's Bresenham line, with every step computed at once."""
+        dx, dy = abs(x2 - x1), abs(y2 - y1)
+        sx = 1 if x2 >= x1 else -1
+        sy = 1 if y2 >= y1 else -1
+
+        if dx >= dy:
+            steps = np.arange(dx + 1)
+            xs = x1 + sx * steps
+            ys = y1 + sy * ((2 * dy * steps + dx) // max(2 * dx, 1))
+        else:
+            steps = np.arange(dy + 1)
+            xs = x1 + sx * ((2 * dx * steps + dy) // (2 * dy))
+            ys = y1 + sy * steps
+
+        xs, ys = xs - left, ys - top
+        height, mask_width = mask.shape
+        visible = (xs >= 0) & (xs < mask_width) & (ys >= 0) & (ys < height)
+        mask[ys[visible], xs[visible]] = True
+
+    def polygon_mask(self, mask, left: int, top: int,
+                     corners: list[tuple[int, int]]):
+        """
+        Pillow draws wide lines as a quadrilateral around the segment and
+        scan converts it row by row, rounding each span to the nearest
+        pixels.
+        """
+        corner_xs = [x for x, _ in corners]
+        corner_ys = [y for _, y in corners]
+        region = self.grid(mask, left, top, min(corner_xs) - 1,
+                           min(corner_ys), max(corner_xs) + 1,
+                           max(corner_ys))
+        if region is None:
+            return
+
+        window, xs, ys = region
+        area = sum(ax * by - bx * ay for (ax, ay), (bx, by)
+                   in zip(corners, corners[1:] + corners[:1]))
+        sign = 1 if area >= 0 else -1
+        inside = np.ones((ys.shape[0], xs.shape[1]), dtype=bool)
+
+        for (ax, ay), (bx, by) in zip(corners, corners[1:] + corners[:1]):
+            if (ax, ay) == (bx, by):
+                continue
+
+            if ay == by:
+                inside &= sign * (bx - ax) * (ys - ay) >= 0
+                continue
+
+            # the crossing is computed in single precision exactly like
+            # Pillow does, so spans ending near half a pixel round the same
+            slope = np.float32(bx - ax) / np.float32(by - ay)
+            crossing = (ys - ay).astype(np.float32) * slope + \
+                np.float32(ax)
+            magnitude = np.abs(crossing)
+            if sign * (by - ay) < 0:
+                edge = xs >= np.copysign(np.floor(magnitude + 0.5), crossing)
+            else:
+                edge = xs <= np.copysign(np.ceil(magnitude - 0.5), crossing)
+
+            inside &= edge | (ys < min(ay, by)) | (ys > max(ay, by))
+
+        mask[window] |= inside
+
+
+def round_up(value: float) -> int:
+    """Rounds halves away from zero, as Pillow's ROUND_UP."""
+    rounded = math.floor(abs(value) + 0.5)
+    return rounded if value >= 0 else -rounded
+
+
+def round_down(value: float) -> int:
+    """Rounds halves towards zero, as Pillow's ROUND_DOWN."""
+    rounded = math.ceil(abs(value) - 0.5)
+    return rounded if value >= 0 else -rounded
+
+
+def wide_line_corners(x1: int, y1: int, x2: int, y2: int,
+                      width: int) -> list[tuple[int, int]]:
+    """The corners of the polygon Pillow fills for a wide line."""
+    dx, dy = x2 - x1, y2 - y1
+    length = math.hypot(dx, dy)
+    half = (width - 1) / 2
+    ratio_max = round_up(half) / length
+    ratio_min = round_down(half) / length
+
+    dx_min, dx_max = round_down(ratio_min * dy), round_down(ratio_max * dy)
+    dy_min, dy_max = round_down(ratio_min * dx), round_down(ratio_max * dx)
+
+    return [(x1 - dx_min, y1 + dy_max), (x2 - dx_min, y2 + dy_max),
+            (x2 + dx_max, y2 - dy_min), (x1 + dx_max, y1 - dy_min)]
@@ -0,0 +1,239 @@
+import time
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import Optional
+from runtime.enviroment import Enviroment
+
+# frame of the code outside of any procedure
+MAIN = "main"
+
+REPORT_LIMIT = 20
+
+# deeper stacks are merged into their ancestor at this depth in the
+# collapsed output, deep recursion would make it quadratic in size
+MAX_COLLAPSED_DEPTH = 256
+
+
+class Profiler():
+    """
+    Collects where a program spends its time: wall time per phase (lex,
+    parse, optimize, execute, rasterize, encode), calls and time per
+    command, and with the tree engine executions and time per source line
+    and per procedure.
+
+    Lines and procedures are measured by `mark`, which the tree engine calls
+    before every statement. The time since the previous mark is charged to
+    the previous statement and to the procedure stack it ran in, so every
+    statement gets its self time and the stacks add up to the execute phase.
+    Nothing is measured unless a profiler is given to the Interpreter, and
+    only the phases when it is not `detailed`.
+    """
+
+    def __init__(self, detailed: bool = True):
+        self.detailed = detailed
+        self.phases = {}
+        # name: [calls, seconds]
+        self.commands = {}
+        # line: [executions, seconds]
+        self.lines = {}
+        # procedure: [calls, self seconds, total seconds]
+        self.procedures = {MAIN: [1, 0.0, 0.0]}
+        # (stack, line): seconds, stacks are indices into `frames`
+        self.stacks = {}
+
+        # (parent stack, procedure) of every stack seen, the tree of calls
+        self.frames = [(None, MAIN)]
+        self.children = {}
+        self.path = [0]
+        # procedure: [frames on the stack, time the outermost was entered]
+        self.active = {}
+
+        self.stack = 0
+        self.line = 0
+        self.last = None
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + \
+                time.perf_counter() - start
+
+    def instrument(self, enviroment: Enviroment):
+        """
+        Times the commands of the enviroment. Must be called before the
+        program is compiled, the engines bind the command methods then.
+        """
+        for name, command in enviroment.commands.items():
+            enviroment.commands[name] = replace(
+                command, method=self.timed(name, command.method))
+
+    def timed(self, name: str, method):
+        totals = self.commands.setdefault(name, [0, 0.0])
+
+        def call(*args):
+            start = time.perf_counter()
+            try:
+                return method(*args)
+            finally:
+                totals[0] += 1
+                totals[1] += time.perf_counter() - start
+
+        return call
+
+    def start(self):
+        self.last = time.perf_counter()
+        self.active[MAIN] = [1, self.last]
+
+    def charge(self):
+        """Charges the time since the last mark to the running statement."""
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+
+        totals = self.lines.get(self.line)
+        if totals is None:
+            totals = self.lines[self.line] = [0, 0.0]
+        totals[1] += elapsed
+
+        key = (self.stack, self.line)
+        self.stacks[key] = self.stacks.get(key, 0) + elapsed
+        self.procedures[self.frames[self.stack][1]][1] += elapsed
+
+        # calls and returns take effect once their statement is charged
+        self.stack = self.path[-1]
+
+    def mark(self, line: int):
+        """`line` runs next."""
+        self.charge()
+        self.line = line
+
+        totals = self.lines.get(line)
+        if totals is None:
+            self.lines[line] = [1, 0.0]
+        else:
+            totals[0] += 1
+
+    def enter(self, procedure: str):
+        totals = self.procedures.get(procedure)
+        if totals is None:
+            totals = self.procedures[procedure] = [0, 0.0, 0.0]
+        totals[0] += 1
+
+        key = (self.path[-1], procedure)
+        stack = self.children.get(key)
+        if stack is None:
+            stack = self.children[key] = len(self.frames)
+            self.frames.append(key)
+        self.path.append(stack)
+
+        # recursive calls count once towards the total time
+        active = self.active.get(procedure)
+        if active is None:
+            self.active[procedure] = [1, time.perf_counter()]
+        else:
+            active[0] += 1
+
+    def leave(self):
+        procedure = self.frames[self.path.pop()][1]
+        active = self.active[procedure]
+        active[0] -= 1
+
+        if active[0] == 0:
+            del self.active[procedure]
+            self.procedures[procedure][2] += time.perf_counter() - active[1]
+
+    def stop(self):
+        if self.last is None:
+            return
+
+        self.charge()
+        for procedure, (_, entered) in self.active.items():
+            self.procedures[procedure][2] += self.last - entered
+
+        self.active = {}
+        self.path = [0]
+        self.stack = 0
+        self.line = 0
+        self.last = None
+
+    def stack_names(self) -> list[str]:
+        """The collapsed name of every stack, `main;caller;callee`."""
+        names = []
+        depths = []
+
+        for parent, procedure in self.frames:
+            if parent is None:
+                names.append(procedure)
+                depths.append(1)
+            elif depths[parent] >= MAX_COLLAPSED_DEPTH:
+                names.append(names[parent])
+                depths.append(depths[parent])
+            else:
+                names.append(f"{names[parent]};{procedure}")
+                depths.append(depths[parent] + 1)
+
+        return names
+
+    def collapsed(self) -> str:
+        """
+        The procedure stacks with their source lines as leaves, in the
+        collapsed format of flamegraph.pl and speedscope, in microseconds.
+        """
+        names = self.stack_names()
+        totals = {}
+
+        for (stack, line), seconds in self.stacks.items():
+            key = f"{names[stack]};line {line}" if line else names[stack]
+            totals[key] = totals.get(key, 0) + seconds
+
+        return "".join(f"{key} {round(seconds * 1e6)}\n"
+                       for key, seconds in sorted(totals.items())
+                       if round(seconds * 1e6) > 0)
+
+    def report(self, source: Optional[str] = None,
+               limit: int = REPORT_LIMIT) -> str:
+        """
+        The text report, with the `limit` slowest lines quoted from `source`
+        when it is given.
+        """
+        total = sum(self.phases.values()) or 1
+        text = source.splitlines() if source is not None else []
+        lines = ["Phases", f"  {'phase':<12}{'seconds':>10}{'%':>8}"]
+
+        for name, seconds in self.phases.items():
+            lines.append(f"  {name:<12}{seconds:>10.4f}"
+                         f"{100 * seconds / total:>8.1f}")
+
+        if self.commands:
+            lines += ["", "Commands",
+                      f"  {'command':<12}{'calls':>10}{'seconds':>10}"]
+            for name, (calls, seconds) in sorted(
+                    self.commands.items(), key=lambda item: -item[1][1]):
+                if calls:
+                    lines.append(f"  {name:<12}{calls:>10}{seconds:>10.4f}")
+
+        if self.stacks:
+            lines += ["", "Procedures",
+                      f"  {'procedure':<20}{'calls':>10}{'self':>10}"
+                      f"{'total':>10}"]
+            for name, (calls, own, inclusive) in sorted(
+                    self.procedures.items(), key=lambda item: -item[1][2]):
+                lines.append(f"  {name:<20}{calls:>10}{own:>10.4f}"
+                             f"{inclusive:>10.4f}")
+
+        executed = [(line, count, seconds)
+                    for line, (count, seconds) in self.lines.items()
+                    if line > 0 and count > 0]
+        if executed:
+            lines += ["", f"Lines (slowest {min(limit, len(executed))})",
+                      f"  {'line':>6}{'runs':>10}{'seconds':>10}  source"]
+            for line, count, seconds in sorted(
+                    executed, key=lambda item: -item[2])[:limit]:
+                quoted = text[line - 1].strip() if line <= len(text) else ""
+                lines.append(f"  {line:>6}{count:>10}{seconds:>10.4f}  "
+                             f"{quoted}")
+
+        return "\n".join(lines)
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from functools import lru_cache
+from typing import Iterable, Optional
+from frontend.tpv_ast import Program
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# packages whose code decides what a cached program looks like
+FRONTEND_PACKAGES = ("frontend", "optimizer")
+
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def default_directory() -> str:
+    if "TPV_CACHE_DIR" in os.environ:
+        return os.environ["TPV_CACHE_DIR"]
+
+    base = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "tpv-interpreter")
+
+
+@lru_cache(maxsize=None)
+def package_version(packages: tuple[str, ...], extra: str = "") -> str:
+    """
+    Hash of the sources of `packages`, the Python version and `extra`, which
+    changes whenever any of them does.
+    """
+    digest = hashlib.sha256(sys.version.encode())
+    digest.update(extra.encode())
+
+    for package in packages:
+        directory = os.path.join(SOURCE_ROOT, package)
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".py"):
+                digest.update(filename.encode())
+                with open(os.path.join(directory, filename), "rb") as file:
+                    digest.update(file.read())
+
+    return digest.hexdigest()
+
+
+def interpreter_version() -> str:
+    """
+    Version of the parser and optimizer, any change to them invalidates the
+    cached programs.
+    """
+    return package_version(FRONTEND_PACKAGES)
+
+
+class ProgramCache():
+    """
+    Content addressed cache of parsed (and optimized) programs. Entries are
+    pickled ASTs named by the hash of the interpreter version, the options
+    that shaped the AST and the source, so a changed source or interpreter
+    never hits a stale entry.
+
+    The directory is kept under `max_size` bytes by evicting the least
+    recently used entries, a hit refreshes the entry's modification time.
+    The cache never fails a run: unreadable entries are misses and entries
+    that cannot be written are skipped.
+    """
+
+    def __init__(self, directory: Optional[str] = None,
+                 max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = directory or default_directory()
+        self.max_size = max_size
+        self.version = interpreter_version()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, source: str, optimize: bool,
+            parameters: Iterable[str] = (), inline_size: int = 0) -> str:
+        digest = hashlib.sha256(self.version.encode())
+        digest.update(f"O{inline_size}".encode() if optimize else b"-")
+        for name in sorted(parameters):
+            digest.update(f"P{name}\0".encode())
+        digest.update(source.encode())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".ast")
+
+    def load(self, key: str) -> Optional[Program]:
+        path = self.path(key)
+
+        try:
+            with open(path, "rb") as file:
+                program = pickle.load(file)
+            os.utime(path)
+        except Exception:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return program
+
+    def store(self, key: str, program: Program):
+        try:
+            data = pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # too deeply nested to pickle, it is parsed every time
+            return
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(dir=self.directory,
+                                                     suffix=".tmp")
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temporary, self.path(key))
+            self.evict()
+        except OSError:
+            pass
+
+    def evict(self):
+        """Removes the least recently used entries over the size limit."""
+        entries = []
+        total = 0
+
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".ast"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".ast"):
+                os.remove(entry.path)
+
+
+# the cache used when an Interpreter is not given one, made on first use
+shared_cache = None
+
+
+def default_cache() -> ProgramCache:
+    global shared_cache
+
+    if shared_cache is None:
+        shared_cache = ProgramCache()
+
+    return shared_cache
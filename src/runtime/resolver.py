@@ -0,0 +1,144 @@
+from typing import Iterable, Optional
+from frontend.tpv_ast import Assignment, BinaryExpression, CallFn, \
+    Expression, Identifier, IfBlock, NoOp, NumericLiteral, PopStack, \
+    ProcedureDeclaration, Program, PushStack, IntDeclaration, Statement, \
+    Command, UnaryExpression, WhileBlock
+
+
+class SlotTable():
+    """
+    Maps every variable of a program to a fixed index into a flat list of
+    values.
+    """
+
+    def __init__(self, names: list[str], predeclared: set[str],
+                 always_declared: Optional[set[str]] = None):
+        """
+        `always_declared` are the names known to be declared before any
+        statement can use them, uses of other names check it at run time.
+        """
+        self.names = names
+        self.slots = {name: slot for slot, name in enumerate(names)}
+        self.predeclared = predeclared
+        self.always_declared = predeclared | (always_declared or set())
+
+    def __len__(self):
+        return len(self.names)
+
+    def slot(self, name: str) -> int:
+        return self.slots[name]
+
+    def checked(self, name: str) -> bool:
+        """Whether uses of the name must check that it is declared."""
+        return name not in self.always_declared
+
+    def initial_values(self, vars: dict) -> list:
+        return [vars.get(name, 0) for name in self.names]
+
+    def initial_declared(self) -> list[bool]:
+        return [name in self.predeclared for name in self.names]
+
+    def store(self, values: list, declared: list[bool], vars: dict):
+        """Writes the values of declared variables back to `vars`."""
+        for name, value, is_declared in zip(self.names, values, declared):
+            if is_declared:
+                vars[name] = value
+
+
+class Resolver():
+    """
+    Assigns a slot to every predeclared variable and every name declared by
+    an INT statement, and fails before execution on any use of a name that is
+    never declared. `top` reads the stack length and only gets a slot when
+    declared.
+    """
+
+    def __init__(self, predeclared: Iterable[str]):
+        self.predeclared = list(predeclared)
+        self.names = {name: None for name in self.predeclared}
+        self.used = {}
+
+    def resolve(self, program: Program) -> SlotTable:
+        for statement in program.statements:
+            if isinstance(statement, ProcedureDeclaration):
+                self.resolve_block(statement.body)
+            else:
+                self.resolve_statement(statement)
+
+        for name in self.used:
+            if name not in self.names:
+                raise Exception(f"Variable '{name}' not found")
+
+        return SlotTable(list(self.names), set(self.predeclared),
+                         self.leading_declarations(program))
+
+    def leading_declarations(self, program: Program) -> set[str]:
+        """
+        Names declared by the INT statements the program starts with, before
+        any statement that can use a variable or call a procedure.
+        """
+        names = set()
+
+        for statement in program.statements:
+            if isinstance(statement, IntDeclaration):
+                names.update(var.name for var in statement.vars)
+            elif isinstance(statement, Command) and all(
+                    isinstance(arg, NumericLiteral)
+                    for arg in statement.args):
+                continue
+            elif not isinstance(statement, (NoOp, ProcedureDeclaration)):
+                break
+
+        return names
+
+    def resolve_block(self, statements: list[Statement]):
+        for statement in statements:
+            self.resolve_statement(statement)
+
+    def use(self, name: str):
+        self.used.setdefault(name, None)
+
+    def resolve_statement(self, statement: Statement):
+        if isinstance(statement, Expression):
+            self.resolve_expression(statement)
+
+        elif isinstance(statement, IntDeclaration):
+            for var in statement.vars:
+                self.names.setdefault(var.name, None)
+
+        elif isinstance(statement, Assignment):
+            self.resolve_expression(statement.expression)
+            self.use(statement.identifier.name)
+
+        elif isinstance(statement, PopStack):
+            for var in statement.vars:
+                self.use(var.name)
+
+        elif isinstance(statement, (Command, PushStack)):
+            for arg in statement.args:
+                self.resolve_expression(arg)
+
+        elif isinstance(statement, IfBlock):
+            self.resolve_expression(statement.condition)
+            self.resolve_block(statement.body)
+            self.resolve_block(statement.else_body)
+
+        elif isinstance(statement, WhileBlock):
+            self.resolve_expression(statement.condition)
+            self.resolve_block(statement.body)
+
+    def resolve_expression(self, expression: Expression):
+        if isinstance(expression, Identifier):
+            if expression.name != "top":
+                self.use(expression.name)
+
+        elif isinstance(expression, BinaryExpression):
+            self.resolve_expression(expression.left)
+            self.resolve_expression(expression.right)
+
+        elif isinstance(expression, UnaryExpression):
+            self.resolve_expression(expression.expression)
+
+        elif isinstance(expression, CallFn):
+            for arg in expression.args:
+                self.resolve_expression(arg)
@@ -0,0 +1,215 @@
+import csv
+import itertools
+import json
+import os
+from multiprocessing import Pool
+from typing import Iterator, Optional
+from PIL import Image
+from output.writer import ImageWriter
+from runtime.compiled_program import CompiledProgram
+from runtime.limits import Limits
+
+# formats of animations, by their file extension
+ANIMATION_FORMATS = {".gif": "GIF", ".apng": "PNG"}
+
+# state of a sweep worker, set once per process by init_worker
+worker = None
+
+
+def parse_number(string: str):
+    try:
+        return int(string)
+    except ValueError:
+        return float(string)
+
+
+def parse_values(spec: str) -> list:
+    """
+    Values of a parameter: `1,2,5` as they are or `start:stop:step`, from
+    start up to but not including stop like range, floats allowed.
+    """
+    if ":" not in spec:
+        return [parse_number(value) for value in spec.split(",")]
+
+    parts = spec.split(":")
+    if len(parts) not in (2, 3):
+        raise Exception(f"Expected start:stop:step, got '{spec}'")
+
+    start, stop = parse_number(parts[0]), parse_number(parts[1])
+    step = parse_number(parts[2]) if len(parts) == 3 else 1
+    if step == 0:
+        raise Exception(f"Step of '{spec}' must not be 0")
+
+    values = []
+    value = start
+    while (value < stop) if step > 0 else (value > stop):
+        values.append(value)
+        # computed from the start, repeated adding would drift with floats
+        value = start + len(values) * step
+
+    return values
+
+
+def vary(specs: list[str]) -> list[dict]:
+    """
+    Bindings of every combination of `name=values` specs, the last one
+    changing fastest.
+    """
+    names = []
+    choices = []
+
+    for spec in specs:
+        name, separator, values = spec.partition("=")
+        if not separator or not name:
+            raise Exception(f"Expected name=values, got '{spec}'")
+
+        names.append(name.strip())
+        choices.append(parse_values(values))
+
+    return [dict(zip(names, combination))
+            for combination in itertools.product(*choices)]
+
+
+def load_bindings(path: str) -> list[dict]:
+    """Bindings from a JSON list of objects or a CSV file with a header."""
+    with open(path, "r", newline="") as file:
+        if path.lower().endswith(".csv"):
+            return [{name: parse_number(value) for name, value in row.items()}
+                    for row in csv.DictReader(file)]
+
+        bindings = json.load(file)
+
+    if not isinstance(bindings, list) or \
+            not all(isinstance(frame, dict) for frame in bindings):
+        raise Exception(f"{path} must hold a list of objects")
+
+    return bindings
+
+
+def init_worker(source: str, options: dict, parameters: dict):
+    global worker
+
+    worker = CompiledProgram(source, parameters=parameters,
+                             reuse_canvas=True, **options)
+
+
+def render_raw(task: tuple) -> tuple:
+    """
+    The mode, size, pixels and palette of one frame, reduced to a palette
+    of its own with `quantize`.
+    """
+    bindings, quantize = task
+    image = worker.run(bindings)
+    if quantize and image.mode != "P":
+        image = image.quantize()
+    return image.mode, image.size, image.tobytes(), image.getpalette()
+
+
+def render_encoded(task: tuple) -> bytes:
+    bindings, format, compression = task
+    return worker.to_bytes(bindings, format, compression)
+
+
+class Sweep():
+    """
+    Renders one program once for every binding of its parameters, see
+    `CompiledProgram`. Every worker process compiles the program once and
+    draws all its frames on the same canvas; frames come out in order as
+    soon as they are done.
+    """
+
+    def __init__(self, source: str, bindings: list[dict], jobs: int = 1,
+                 engine: str = "tree", optimize: bool = False,
+                 rasterizer: str = "pillow", palette: bool = False,
+                 limits: Optional[Limits] = None):
+        if not bindings:
+            raise Exception("A sweep needs at least one frame")
+
+        names = set(bindings[0])
+        for index, frame in enumerate(bindings):
+            if set(frame) != names:
+                raise Exception(f"Frame {index} binds "
+                                f"{', '.join(sorted(frame))} instead of "
+                                f"{', '.join(sorted(names))}")
+
+        self.source = source
+        self.bindings = bindings
+        self.jobs = max(jobs, 1)
+        self.options = {
+            "engine": engine,
+            "optimize": optimize,
+            "rasterizer": rasterizer,
+            "palette": palette,
+            "limits": limits,
+        }
+
+        # fails on the main process for a program that cannot run
+        init_worker(source, self.options, bindings[0])
+
+    def map(self, function, tasks: list) -> Iterator:
+        if self.jobs == 1 or len(tasks) == 1:
+            return map(function, tasks)
+
+        pool = Pool(min(self.jobs, len(tasks)), initializer=init_worker,
+                    initargs=(self.source, self.options, self.bindings[0]))
+        chunksize = max(len(tasks) // (self.jobs * 4), 1)
+
+        def results():
+            with pool:
+                yield from pool.imap(function, tasks, chunksize)
+
+        return results()
+
+    def frames(self, quantize: bool = False) -> Iterator[Image.Image]:
+        """
+        The frames as images, with `quantize` as palette images, which the
+        workers then convert in parallel.
+        """
+        tasks = [(frame, quantize) for frame in self.bindings]
+        for mode, size, pixels, palette in self.map(render_raw, tasks):
+            image = Image.frombytes(mode, size, pixels)
+            if palette is not None:
+                image.putpalette(palette)
+            yield image
+
+    def encoded_frames(self, format: str = "png",
+                       compression: Optional[int] = None) -> Iterator[bytes]:
+        # fail before the workers start
+        ImageWriter(format, compression).close()
+
+        return self.map(render_encoded, [(frame, format, compression)
+                                         for frame in self.bindings])
+
+    def write_frames(self, pattern: str, format: str = "png",
+                     compression: Optional[int] = None) -> list[str]:
+        """
+        Writes every frame as soon as it is done into `pattern` formatted
+        with its index, `frame-{:04d}.png`, returns the paths.
+        """
+        paths = []
+
+        for index, data in enumerate(self.encoded_frames(format,
+                                                         compression)):
+            path = pattern.format(index)
+            with open(path, "wb") as file:
+                file.write(data)
+            paths.append(path)
+
+        return paths
+
+    def write_animation(self, path: str, duration: int = 40, loop: int = 0):
+        """
+        Writes the frames as an animated GIF or PNG, by the extension of
+        `path`, showing each for `duration` milliseconds and repeating
+        `loop` times, 0 forever.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in ANIMATION_FORMATS:
+            raise Exception(f"Animations are written as "
+                            f"{', '.join(ANIMATION_FORMATS)} files")
+
+        # GIF frames hold at most 256 colors
+        frames = list(self.frames(quantize=extension == ".gif"))
+        frames[0].save(path, ANIMATION_FORMATS[extension], save_all=True,
+                       append_images=frames[1:], duration=duration,
+                       loop=loop)
@@ -0,0 +1,213 @@
+import mmap
+import struct
+import zlib
+from array import array
+from multiprocessing import Pool
+from typing import Optional
+from PIL import Image
+from runtime.display_list import DisplayList
+from runtime.flipped_draw import FlippedDraw
+
+DEFAULT_TILE_SIZE = 1024
+
+TILED_FORMATS = ("png", "ppm")
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# state of a tile worker, set once per process by init_worker
+worker = None
+
+
+class TiledCanvas():
+    """
+    A canvas that is never allocated as a whole. The program only records
+    its primitives into a display list, `write` then rasterizes them tile by
+    tile, each tile drawing just the primitives that touch it, and writes
+    the tiles straight into the output file. Peak memory is bounded by the
+    tiles being drawn at once instead of the canvas.
+
+    Tiles span the whole width of the canvas and are about `tile_size`
+    squared pixels large. Pillow computes the edges of wide lines in single
+    precision, moving a line sideways can change how they round while
+    moving it vertically cannot, so only full width tiles are pixel
+    identical to drawing the canvas at once.
+
+    PPM output is a raw file that the tile workers write into through a
+    memory map. PNG output is streamed through zlib by the parent process.
+    """
+
+    def __init__(self, width: int, height: int, background,
+                 palette: Optional[list] = None):
+        if width < 0 or height < 0:
+            raise ValueError("Width and height must be >= 0")
+
+        self.width = width
+        self.height = height
+        self.background = background
+        self.palette = palette
+        self.display_list = DisplayList()
+
+    def tiles(self, tile_size: int) -> list[tuple[int, int, array]]:
+        """
+        (top, height, indices) of the tiles from the top of the image down,
+        `indices` being the primitives whose bounds touch the tile.
+        """
+        rows = max(tile_size * tile_size // max(self.width, 1), 1)
+        count = -(-self.height // rows)
+        buckets = [array("q") for _ in range(count)]
+        display_list = self.display_list
+        last = self.height - 1
+
+        for index, item in enumerate(display_list.primitives()):
+            kind, _, x1, y1, x2, y2, width = item
+            left, low, right, high = display_list.bounds(kind, x1, y1, x2, y2,
+                                                         width)
+            if right < 0 or left >= self.width:
+                continue
+
+            # rows of the flipped canvas
+            top, bottom = max(last - high, 0), min(last - low, last)
+            for tile in range(top // rows, bottom // rows + 1):
+                buckets[tile].append(index)
+
+        return [(tile * rows, min(rows, self.height - tile * rows),
+                 buckets[tile]) for tile in range(count)]
+
+    def write(self, path: str, format: str = "png",
+              tile_size: int = DEFAULT_TILE_SIZE, jobs: int = 1,
+              compression: Optional[int] = None):
+        """Rasterizes the canvas into `path`, using `jobs` processes."""
+        if format not in TILED_FORMATS:
+            raise Exception(f"Tiled canvas cannot write '{format}', "
+                            f"expected one of {', '.join(TILED_FORMATS)}")
+
+        if self.width == 0 or self.height == 0:
+            raise Exception("Cannot write an empty image")
+
+        self.display_list.cull(self.width, self.height)
+        tiles = self.tiles(tile_size)
+
+        if format == "ppm":
+            header = f"P6\n{self.width} {self.height}\n255\n".encode()
+            with open(path, "wb") as file:
+                file.write(header)
+                file.truncate(len(header) + self.width * self.height * 3)
+
+            state = self.worker_state(path, len(header), rgb=True)
+            self.render(tiles, state, jobs, lambda pixels: None)
+            return
+
+        rgb = self.palette is None
+        row = self.width * (3 if rgb else 1)
+        compressor = zlib.compressobj(6 if compression is None
+                                      else compression)
+
+        with open(path, "wb") as file:
+            file.write(PNG_SIGNATURE)
+            file.write(png_chunk(b"IHDR", struct.pack(
+                ">IIBBBBB", self.width, self.height, 8, 2 if rgb else 3, 0,
+                0, 0)))
+            if not rgb:
+                file.write(png_chunk(b"PLTE", bytes(
+                    channel for color in self.palette for channel in color)))
+
+            def write_tile(pixels: bytes):
+                # every row starts with its filter type, none
+                rows = b"".join(b"\0" + pixels[start:start + row]
+                                for start in range(0, len(pixels), row))
+                data = compressor.compress(rows)
+                if data:
+                    file.write(png_chunk(b"IDAT", data))
+
+            self.render(tiles, self.worker_state(None, 0, rgb), jobs,
+                        write_tile)
+            file.write(png_chunk(b"IDAT", compressor.flush()))
+            file.write(png_chunk(b"IEND", b""))
+
+    def worker_state(self, path: Optional[str], offset: int,
+                     rgb: bool) -> dict:
+        return {
+            "display_list": self.display_list,
+            "width": self.width,
+            "height": self.height,
+            "mode": "RGB" if self.palette is None else "P",
+            "background": self.background,
+            "palette": self.palette,
+            "rgb": rgb,
+            "path": path,
+            "offset": offset,
+        }
+
+    def render(self, tiles: list[tuple], state: dict, jobs: int,
+               write_tile):
+        """
+        Renders `jobs` tiles at a time and hands them to `write_tile` in
+        order, so no more than that many tiles are ever held in memory.
+        """
+        if jobs <= 1:
+            init_worker(state)
+            try:
+                for tile in tiles:
+                    write_tile(render_tile(tile))
+            finally:
+                close_worker()
+            return
+
+        with Pool(jobs, init_worker, (state,)) as pool:
+            for start in range(0, len(tiles), jobs):
+                for pixels in pool.map(render_tile,
+                                       tiles[start:start + jobs],
+                                       chunksize=1):
+                    write_tile(pixels)
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + \
+        struct.pack(">I", zlib.crc32(kind + data))
+
+
+def init_worker(state: dict):
+    global worker
+
+    worker = dict(state)
+    worker["map"] = None
+
+    if state["path"] is not None:
+        file = open(state["path"], "r+b")
+        worker["map"] = mmap.mmap(file.fileno(), 0)
+        file.close()
+
+
+def close_worker():
+    global worker
+
+    if worker["map"] is not None:
+        worker["map"].close()
+    worker = None
+
+
+def render_tile(tile: tuple) -> Optional[bytes]:
+    """
+    Draws the primitives of one tile. The tile is written into the memory
+    mapped output if there is one, otherwise its pixels are returned.
+    """
+    top, height, indices = tile
+    width = worker["width"]
+    image = Image.new(worker["mode"], (width, height), worker["background"])
+    draw = FlippedDraw(image, 0, top, worker["height"])
+    worker["display_list"].rasterize(draw, indices)
+
+    if worker["rgb"] and image.mode == "P":
+        image.putpalette([channel for color in worker["palette"]
+                          for channel in color])
+        image = image.convert("RGB")
+
+    pixels = image.tobytes()
+    output = worker["map"]
+    if output is None:
+        return pixels
+
+    # full width tiles are one contiguous run of the file
+    start = worker["offset"] + top * width * 3
+    output[start:start + len(pixels)] = pixels
+    return None
@@ -0,0 +1,403 @@
+from functools import lru_cache
+from types import CodeType
+from typing import Optional
+from runtime.enviroment import Enviroment, TPVEnviroment
+from runtime.exceptions import ReturnException, StopException
+from runtime.limits import Limits, PRIMITIVE_COMMANDS, weight
+from frontend.tpv_ast import Assignment, BinaryExpression, CallFn, \
+    CallProcedure, Expression, Identifier, IfBlock, NoOp, \
+    NumericLiteral, PopStack, ProcedureDeclaration, Program, PushStack, \
+    Return, IntDeclaration, Statement, Command, UnaryExpression, WhileBlock
+import hashlib
+import math
+
+# Python sources whose compiled code is kept, long running workers
+# transpile many programs
+CODE_CACHE_SIZE = 128
+
+# builtins evaluated inline instead of through the enviroment
+INLINE_FUNCTIONS = {
+    TPVEnviroment.function_sin: "_sin(_radians({}))",
+    TPVEnviroment.function_cos: "_cos(_radians({}))",
+}
+
+
+def variable_name(name: str) -> str:
+    """
+    TPV variables live in the module globals under a prefix, so they can
+    never clash with helpers or Python builtins.
+    """
+    if ("v_" + name).isidentifier():
+        return "v_" + name
+
+    return "h_" + name.encode().hex()
+
+
+def procedure_name(name: str) -> str:
+    return "p_" + variable_name(name)
+
+
+class PythonTranspiler():
+    """
+    Translates a parsed program into Python source. Procedures become
+    functions, WHILE becomes `while` and TPV variables become globals of the
+    module the source is executed in.
+
+    With `limits`, the source checks them through the `_limits` global.
+    With `typed`, the program was validated to do arithmetic only on
+    numbers, see Validator, and operands are not checked.
+    """
+
+    def __init__(self, enviroment: Enviroment,
+                 limits: Optional[Limits] = None, typed: bool = False):
+        self.enviroment = enviroment
+        self.limits = limits
+        self.typed = typed
+        self.lines = []
+        self.indent = 0
+        self.procedures = {}
+        self.bindings = {}
+
+    def transpile(self, program: Program) -> str:
+        for statement in program.statements:
+            if isinstance(statement, ProcedureDeclaration):
+                self.procedures[statement.name.name] = statement
+
+        self.emit_function("main", program.statements, in_procedure=False)
+
+        for name, procedure in self.procedures.items():
+            self.emit_function(procedure_name(name), procedure.body,
+                               in_procedure=True, line=procedure.line)
+
+        return "\n".join(self.lines) + "\n"
+
+    def emit(self, line: str):
+        self.lines.append("    " * self.indent + line)
+
+    def emit_function(self, name: str, body: list[Statement],
+                      in_procedure: bool, line: int = 0):
+        self.in_procedure = in_procedure
+        assigned = sorted(self.assigned_variables(body))
+
+        self.emit(f"def {name}():")
+        self.indent += 1
+        if assigned:
+            self.emit(f"global {', '.join(map(variable_name, assigned))}")
+        if in_procedure:
+            self.emit_charge(body, line)
+        self.emit_block(body)
+        self.indent -= 1
+        self.emit("")
+
+    def assigned_variables(self, body: list[Statement]) -> set[str]:
+        names = set()
+
+        for statement in body:
+            if isinstance(statement, Assignment):
+                names.add(statement.identifier.name)
+            elif isinstance(statement, PopStack):
+                names.update(var.name for var in statement.vars)
+            elif isinstance(statement, IfBlock):
+                names |= self.assigned_variables(statement.body)
+                names |= self.assigned_variables(statement.else_body)
+            elif isinstance(statement, WhileBlock):
+                names |= self.assigned_variables(statement.body)
+
+        return names
+
+    def emit_block(self, statements: list[Statement]):
+        start = len(self.lines)
+
+        for statement in statements:
+            self.emit_statement(statement)
+
+        if len(self.lines) == start:
+            self.emit("pass")
+
+    def emit_charge(self, statements: list[Statement], line: int):
+        """Charges a run of the statements to the statement limit."""
+        if self.limits is None or not self.limits.counts:
+            return
+
+        self.emit(f"_limits.remaining -= {weight(statements)}")
+        self.emit(f"if _limits.remaining <= 0: _limits.exhausted({line})")
+
+    def emit_statement(self, statement: Statement):
+        limits = self.limits
+
+        if isinstance(statement, Expression):
+            self.emit(self.expression(statement))
+            return
+
+        if isinstance(statement, Command):
+            name = statement.command.name
+            if limits is not None and limits.max_primitives is not None and \
+                    name in PRIMITIVE_COMMANDS:
+                self.emit(f"_limits.primitive({statement.line})")
+
+            self.emit(self.call(name, statement.args,
+                                self.enviroment.commands, "_call_command"))
+
+            method = self.enviroment.commands.get(name)
+            if method is not None and method.stops:
+                self.emit("raise _StopException()")
+            return
+
+        if isinstance(statement, IntDeclaration):
+            for var in statement.vars:
+                self.emit(f"_declare({var.name!r}, "
+                          f"{variable_name(var.name)!r})")
+            return
+
+        if isinstance(statement, IfBlock):
+            self.emit(f"if {self.expression(statement.condition)} > 0:")
+            self.indent += 1
+            self.emit_block(statement.body)
+            self.indent -= 1
+
+            if statement.else_body:
+                self.emit("else:")
+                self.indent += 1
+                self.emit_block(statement.else_body)
+                self.indent -= 1
+            return
+
+        if isinstance(statement, WhileBlock):
+            self.emit(f"while {self.expression(statement.condition)} > 0:")
+            self.indent += 1
+            self.emit_charge(statement.body, statement.line)
+            self.emit_block(statement.body)
+            self.indent -= 1
+            return
+
+        if isinstance(statement, Assignment):
+            name = statement.identifier.name
+            self.emit(f"_value = {self.expression(statement.expression)}")
+            self.emit_declared_check(name)
+            self.emit(f"{variable_name(name)} = _value")
+            return
+
+        if isinstance(statement, CallProcedure):
+            name = statement.name.name
+            if name not in self.procedures:
+                self.emit(f"_missing_procedure({name!r})")
+            elif limits is None or limits.max_call_depth is None:
+                self.emit(f"{procedure_name(name)}()")
+            else:
+                self.emit("_limits.depth += 1")
+                self.emit("try:")
+                self.indent += 1
+                self.emit(f"if _limits.depth > {limits.max_call_depth}: "
+                          f"_limits.check_call_depth(_limits.depth, "
+                          f"{statement.line})")
+                self.emit(f"{procedure_name(name)}()")
+                self.indent -= 1
+                self.emit("finally:")
+                self.emit("    _limits.depth -= 1")
+            return
+
+        if isinstance(statement, PushStack):
+            args = ", ".join(map(self.expression, statement.args))
+            self.emit(f"_extend(({args},))")
+
+            if limits is not None and limits.max_stack is not None:
+                self.emit(f"if _len(_stack) > {limits.max_stack}: "
+                          f"_limits.check_stack(_len(_stack), "
+                          f"{statement.line})")
+            return
+
+        if isinstance(statement, PopStack):
+            for var in statement.vars:
+                self.emit_declared_check(var.name)
+                self.emit(f"{variable_name(var.name)} = _pop()")
+            return
+
+        if isinstance(statement, Return):
+            if self.in_procedure:
+                self.emit("return")
+            else:
+                self.emit("raise _ReturnException()")
+            return
+
+        # procedures are emitted as top level functions
+        if isinstance(statement, (ProcedureDeclaration, NoOp)):
+            return
+
+        raise Exception(f"Unimplemented statement type: {type(statement)}")
+
+    def emit_declared_check(self, name: str):
+        self.emit(f"if {variable_name(name)!r} not in _globals: "
+                  f"_undeclared({name!r})")
+
+    def expression(self, expression: Expression) -> str:
+        if isinstance(expression, NumericLiteral):
+            return repr(expression.value)
+
+        if isinstance(expression, Identifier):
+            if expression.name == "top":
+                return "_len(_stack)"
+
+            return variable_name(expression.name)
+
+        if isinstance(expression, BinaryExpression):
+            if expression.operator not in ("+", "-", "*", "/"):
+                raise Exception(
+                    "Unimplemented binary expression operator: "
+                    f"{expression.operator}")
+
+            lhs = self.operand(expression.left)
+            rhs = self.operand(expression.right)
+            return f"({lhs} {expression.operator} {rhs})"
+
+        if isinstance(expression, UnaryExpression):
+            if expression.operator != "-":
+                raise Exception(
+                    "Unimplemented unary expression operator: "
+                    f"{expression.operator}")
+
+            return f"(-{self.expression(expression.expression)})"
+
+        if isinstance(expression, CallFn):
+            return self.call(expression.name.name, expression.args,
+                             self.enviroment.functions, "_call_function")
+
+        raise Exception(f"Unimplemented expression type: {type(expression)}")
+
+    def operand(self, expression: Expression) -> str:
+        """
+        Python would happily concatenate or repeat color names, so operands
+        that may hold one, variables and calls, are checked before the
+        operation. Nested operations and literals always give numbers.
+        """
+        code = self.expression(expression)
+
+        if self.typed or (isinstance(expression, Identifier) and
+                          expression.name == "top"):
+            return code
+
+        if isinstance(expression, (Identifier, CallFn)):
+            return f"_numeric({code})"
+
+        return code
+
+    def call(self, name: str, args: list[Expression], registry: dict,
+             fallback: str) -> str:
+        code_args = ", ".join(map(self.expression, args))
+        method = registry.get(name)
+
+        # unknown names and wrong arities only fail once executed
+        if method is None or method.argc not in (None, len(args)):
+            return f"{fallback}({name!r}, [{code_args}])"
+
+        inline = INLINE_FUNCTIONS.get(getattr(method.method, "__func__", None))
+        if inline is not None:
+            return inline.format(code_args)
+
+        binding = "c_" + variable_name(name)
+        self.bindings[binding] = method.method
+        return f"{binding}({code_args})"
+
+
+@lru_cache(maxsize=CODE_CACHE_SIZE)
+def compile_source(source: str) -> CodeType:
+    key = hashlib.sha256(source.encode()).hexdigest()
+    return compile(source, f"<tpv {key[:12]}>", "exec")
+
+
+def compile_python(program: Program, enviroment: Enviroment,
+                   limits: Optional[Limits] = None,
+                   typed: bool = False) -> tuple[CodeType, dict]:
+    """
+    Transpiles and compiles the program, returns its code and the methods
+    of the enviroment the code calls, for `execute_python`.
+    """
+    transpiler = PythonTranspiler(enviroment, limits, typed)
+    return compile_source(transpiler.transpile(program)), transpiler.bindings
+
+
+def run_python(program: Program, enviroment: Enviroment,
+               limits: Optional[Limits] = None):
+    """
+    Transpiles the program, executes it and writes the final values of its
+    variables back to the enviroment.
+    """
+    execute_python(compile_python(program, enviroment, limits), enviroment,
+                   limits)
+
+
+def execute_python(compiled: tuple[CodeType, dict], enviroment: Enviroment,
+                   limits: Optional[Limits] = None):
+    """Executes a program compiled by `compile_python`."""
+    code, bindings = compiled
+    vars = enviroment.vars
+    stack = enviroment.stack
+
+    namespace = {
+        "__builtins__": {},
+        "_len": len,
+        "_stack": stack,
+        "_extend": stack.extend,
+        "_sin": math.sin,
+        "_cos": math.cos,
+        "_radians": math.radians,
+        "_call_command": enviroment.call_command,
+        "_call_function": enviroment.call_function,
+        "_ReturnException": ReturnException,
+        "_StopException": StopException,
+        "_limits": limits,
+    }
+    names = {}
+
+    def declare(name: str, key: str):
+        if key in namespace:
+            raise Exception(f"Variable '{name}' already declared")
+
+        names[key] = name
+        namespace[key] = 0
+
+    def undeclared(name: str):
+        raise Exception(f"Variable '{name}' not found")
+
+    def missing_procedure(name: str):
+        raise Exception(f"Procedure {name} not found")
+
+    def numeric(value):
+        if value.__class__ is str:
+            raise Exception("Cannot perform binary operation"
+                            " on non-numeric values")
+
+        return value
+
+    def pop():
+        if not stack:
+            raise Exception("Pop from empty stack")
+
+        return stack.pop()
+
+    namespace.update({
+        "_globals": namespace,
+        "_declare": declare,
+        "_undeclared": undeclared,
+        "_missing_procedure": missing_procedure,
+        "_numeric": numeric,
+        "_pop": pop,
+        **bindings,
+    })
+
+    for name, value in vars.items():
+        names[variable_name(name)] = name
+        namespace[variable_name(name)] = value
+
+    exec(code, namespace)
+
+    try:
+        namespace["main"]()
+    except NameError as e:
+        if e.name.startswith(("v_", "h_")):
+            name = e.name[2:] if e.name.startswith("v_") \
+                else bytes.fromhex(e.name[2:]).decode()
+            raise Exception(f"Variable '{name}' not found") from None
+        raise
+    finally:
+        for key, name in names.items():
+            vars[name] = namespace[key]
@@ -0,0 +1,160 @@
+import inspect
+from typing import Callable
+from frontend.tpv_ast import Assignment, BinaryExpression, CallFn, \
+    CallProcedure, Command, Expression, Identifier, IfBlock, \
+    IntDeclaration, PopStack, Program, Statement, UnaryExpression, \
+    WhileBlock
+from optimizer.analysis import procedure_declarations, program_statements, \
+    statement_expressions, string_variables, walk_expression
+from runtime.enviroment import Enviroment
+
+
+def numeric_parameters(method: Callable) -> set[int]:
+    """Positions of the parameters of a method annotated as numbers."""
+    return {index for index, parameter
+            in enumerate(inspect.signature(method).parameters.values())
+            if parameter.annotation in (int, float)}
+
+
+class Problem():
+    """Something wrong with a program, at the position of its statement."""
+
+    def __init__(self, message: str, line: int = 0, column: int = 0):
+        self.message = message
+        self.line = line
+        self.column = column
+
+    def __str__(self):
+        if not self.line:
+            return self.message
+
+        return f"{self.message} (line {self.line}, column {self.column})"
+
+    def export(self) -> dict:
+        return {"message": self.message, "line": self.line,
+                "column": self.column}
+
+
+class Validator():
+    """
+    Checks a program against an enviroment before it runs: commands and
+    functions exist and get as many arguments as they take, every CALL
+    names a declared procedure, every variable is declared somewhere and
+    color names are not used where a number is expected. All problems are
+    collected, with the position of their statement, instead of failing on
+    the first one executed. Code that never runs is checked too.
+
+    `typed` tells whether arithmetic only ever sees numbers, which holds
+    when no variable that may hold a color is an operand, see
+    `string_variables`. Running a valid program then needs none of the
+    checks of names, arities and operand types.
+    """
+
+    def __init__(self, enviroment: Enviroment):
+        self.enviroment = enviroment
+        self.problems = []
+        self.typed = True
+
+    def validate(self, program: Program) -> list[Problem]:
+        vars = self.enviroment.vars
+        statements = program_statements(program)
+
+        self.problems = []
+        self.typed = True
+        self.procedures = procedure_declarations(program)
+        self.strings = string_variables(program, vars)
+        self.declared = set(vars) | {"top"}
+        written = set()
+
+        for statement in statements:
+            if isinstance(statement, IntDeclaration):
+                self.declared.update(var.name for var in statement.vars)
+            elif isinstance(statement, Assignment):
+                written.add(statement.identifier.name)
+            elif isinstance(statement, PopStack):
+                written.update(var.name for var in statement.vars)
+
+        # colors that are never assigned stay color names
+        self.colors = {name for name, value in vars.items()
+                       if isinstance(value, str) and name not in written}
+
+        for statement in statements:
+            self.check_statement(statement)
+
+        return self.problems
+
+    def problem(self, message: str, statement: Statement):
+        self.problems.append(Problem(message, statement.line,
+                                     statement.column))
+
+    def check_statement(self, statement: Statement):
+        if isinstance(statement, Command):
+            self.check_call("Command", statement.command.name,
+                            statement.args, self.enviroment.commands,
+                            statement)
+        elif isinstance(statement, CallProcedure):
+            if statement.name.name not in self.procedures:
+                self.problem(f"Procedure {statement.name.name} not found",
+                             statement)
+        elif isinstance(statement, Assignment):
+            self.check_variable(statement.identifier.name, statement)
+        elif isinstance(statement, PopStack):
+            for var in statement.vars:
+                self.check_variable(var.name, statement)
+        elif isinstance(statement, (IfBlock, WhileBlock)):
+            self.check_number(statement.condition, "Condition", statement)
+
+        for expression in statement_expressions(statement):
+            self.check_expression(expression, statement)
+
+    def check_expression(self, expression: Expression,
+                         statement: Statement):
+        for node in walk_expression(expression):
+            if isinstance(node, Identifier):
+                self.check_variable(node.name, statement)
+
+            elif isinstance(node, BinaryExpression):
+                for operand in (node.left, node.right):
+                    self.check_number(operand,
+                                      f"Operand of '{node.operator}'",
+                                      statement)
+                    if isinstance(operand, Identifier) and \
+                            operand.name in self.strings:
+                        self.typed = False
+
+            elif isinstance(node, UnaryExpression):
+                self.check_number(node.expression,
+                                  f"Operand of '{node.operator}'", statement)
+
+            elif isinstance(node, CallFn):
+                self.check_call("Function", node.name.name, node.args,
+                                self.enviroment.functions, statement)
+
+    def check_call(self, kind: str, name: str, args: list[Expression],
+                   registry: dict, statement: Statement):
+        method = registry.get(name)
+        if method is None:
+            self.problem(f"{kind} '{name}' not found", statement)
+            return
+
+        if method.argc is not None and len(args) != method.argc:
+            self.problem(f"{kind} '{name}' takes {method.argc} arguments, "
+                         f"{len(args)} given", statement)
+            return
+
+        for index in sorted(numeric_parameters(method.method)):
+            if index < len(args):
+                self.check_number(args[index],
+                                  f"Argument {index + 1} of '{name}'",
+                                  statement)
+
+    def check_number(self, expression: Expression, what: str,
+                     statement: Statement):
+        if isinstance(expression, Identifier) and \
+                expression.name in self.colors:
+            self.problem(f"{what} is the color {expression.name}, "
+                         f"expected a number", statement)
+
+    def check_variable(self, name: str, statement: Statement):
+        if name not in self.declared:
+            self.problem(f"Variable '{name}' not found", statement)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+"""
+Serves TPV rendering over HTTP, on a TCP port or a Unix socket, from a pool
+of pre-warmed worker processes.
+
+  POST /render    the program as the request body, answered with the PNG;
+                  ?output=display-list answers with the culled display list
+                  as JSON instead, ?engine=, ?optimize=1, ?rasterizer= and
+                  ?palette=1 work as the options of main.py
+  GET  /metrics   queue depth, latency histograms and cache hit rate as
+                  JSON
+  GET  /health    200 once the server accepts requests
+
+Requests beyond the workers and the queue are refused with 503 right away.
+Programs failing to run get 400, programs hitting a limit 422, both with a
+JSON body holding the error. The deadline and statement limits are
+enforced by the workers, so a runaway program frees its worker.
+"""
+
+import json
+import os
+import socket
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+from runtime.interpreter import ENGINES
+from main import positive_int
+from runtime.limits import Limits
+from service.metrics import Metrics
+from service.render_pool import OUTPUTS, POOL_RASTERIZERS, QueueFull, \
+    RenderPool
+
+DEFAULT_PORT = 8080
+
+# bytes of TPV source accepted in one request
+DEFAULT_MAX_SOURCE = 1 << 20
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    server_version = "tpv-serve"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+
+        if path == "/metrics":
+            self.send_json(200, self.server.metrics.export())
+        elif path == "/health":
+            self.send_json(200, {"status": "ok"})
+        else:
+            self.send_json(404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/render":
+            self.send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            self.send_json(411, {"error": "Content-Length is required"})
+            return
+
+        length = int(length)
+        if length > self.server.max_source:
+            self.close_connection = True
+            self.send_json(413, {"error": f"Programs are limited to "
+                                          f"{self.server.max_source} bytes"})
+            return
+
+        try:
+            source = self.rfile.read(length).decode()
+            options = self.render_options(parse_qs(url.query))
+        except Exception as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        self.render(source, options)
+
+    def render_options(self, query: dict) -> dict:
+        def option(name: str, default: str) -> str:
+            return query.get(name, [default])[-1]
+
+        options = {
+            "output": option("output", "png"),
+            "engine": option("engine", self.server.options["engine"]),
+            "rasterizer": option("rasterizer",
+                                 self.server.options["rasterizer"]),
+            "optimize": option("optimize", "") in TRUE_VALUES
+            or self.server.options["optimize"],
+            "palette": option("palette", "") in TRUE_VALUES,
+        }
+
+        for name, choices in (("output", OUTPUTS), ("engine", ENGINES),
+                              ("rasterizer", POOL_RASTERIZERS)):
+            if options[name] not in choices:
+                raise Exception(f"Unknown {name} '{options[name]}', "
+                                f"expected one of {', '.join(choices)}")
+
+        return options
+
+    def render(self, source: str, options: dict):
+        metrics = self.server.metrics
+        limits = self.server.limits
+        start = time.perf_counter()
+
+        metrics.received()
+
+        try:
+            result = self.server.pool.render(source, limits=limits,
+                                             timeout=self.server.render_timeout,
+                                             **options)
+        except QueueFull as e:
+            metrics.reject()
+            self.send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+            return
+        except TimeoutError as e:
+            metrics.finished(504, time.perf_counter() - start)
+            self.send_json(504, {"error": str(e)})
+            return
+
+        if result["status"] == "ok":
+            status = 200
+            self.send_body(status, result["body"], result["content_type"])
+        elif result["status"] == "limit":
+            status = 422
+            self.send_json(status, {"error": result["error"],
+                                    **result["limit"]})
+        else:
+            status = 400
+            self.send_json(status, {"error": result["error"]})
+
+        metrics.finished(status, time.perf_counter() - start,
+                         result["seconds"], result["cache_hit"])
+
+    def send_json(self, status: int, value: dict,
+                  headers: Optional[dict] = None):
+        self.send_body(status, json.dumps(value).encode(),
+                       "application/json", headers)
+
+    def send_body(self, status: int, body: bytes, content_type: str,
+                  headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format: str, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(args, pool: RenderPool, metrics: Metrics):
+    if args.socket is not None:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, RenderHandler)
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), RenderHandler)
+        server.daemon_threads = True
+
+    server.pool = pool
+    server.metrics = metrics
+    server.limits = None if args.deadline is None and \
+        args.max_statements is None else Limits(args.max_statements,
+                                                args.deadline)
+    server.render_timeout = args.timeout
+    server.max_source = args.max_source
+    server.verbose = args.verbose
+    server.options = {
+        "engine": args.engine,
+        "rasterizer": args.rasterizer,
+        "optimize": args.optimize,
+    }
+    return server
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--socket',
+                        help='Listen on this Unix socket instead of a port')
+    parser.add_argument('--workers', type=positive_int,
+                        default=os.cpu_count() or 1,
+                        help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--queue-size', type=int,
+                        help='Requests waiting for a worker before new ones '
+                             'are refused (default: twice the workers)')
+    parser.add_argument('--engine', choices=ENGINES, default='tree',
+                        help='Default execution engine (default: tree)')
+    parser.add_argument('--rasterizer', choices=POOL_RASTERIZERS,
+                        default='pillow',
+                        help='Default drawing backend (default: pillow)')
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help='Always run the optimization passes')
+    parser.add_argument('--compression', type=int,
+                        help='PNG compression level 0-9, 1 is fast')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always parse, bypassing the compiled program '
+                             'cache')
+    parser.add_argument('--cache-dir',
+                        help='Directory of the compiled program cache '
+                             '(default: $TPV_CACHE_DIR or '
+                             '~/.cache/tpv-interpreter)')
+    parser.add_argument('--deadline', type=float, default=10.0,
+                        help='Seconds a program may run (default: 10)')
+    parser.add_argument('--max-statements', type=positive_int,
+                        help='Stop programs after this many statements')
+    parser.add_argument('--timeout', type=float,
+                        help='Seconds a request waits for its result, '
+                             'queueing included, before it gets 504')
+    parser.add_argument('--max-source', type=positive_int,
+                        default=DEFAULT_MAX_SOURCE,
+                        help=f'Largest accepted program in bytes (default: '
+                             f'{DEFAULT_MAX_SOURCE})')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Log every request')
+
+    args = parser.parse_args()
+
+    if args.socket is not None and not hasattr(socket, 'AF_UNIX'):
+        parser.error('Unix sockets are not supported on this platform')
+
+    queue_size = args.queue_size if args.queue_size is not None \
+        else 2 * args.workers
+    cache = False if args.no_cache else args.cache_dir
+
+    try:
+        pool = RenderPool(args.workers, max(queue_size, 0), cache,
+                          args.compression)
+    except Exception as e:
+        print(e)
+        return 2
+
+    metrics = Metrics(args.workers, max(queue_size, 0))
+    server = make_server(args, pool, metrics)
+    where = args.socket if args.socket is not None \
+        else f'http://{args.host}:{server.server_address[1]}'
+    print(f'Serving on {where} with {args.workers} worker(s)')
+    sys.stdout.flush()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
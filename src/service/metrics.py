@@ -0,0 +1,132 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Optional
+
+# upper bounds in seconds of the latency buckets, the last bucket is
+# unbounded
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram():
+    """Counts of observed values per bucket, with their sum."""
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, quantile: float) -> Optional[float]:
+        """
+        Upper bound of the bucket holding the quantile, None when nothing
+        was observed or it lies in the unbounded bucket.
+        """
+        if self.count == 0:
+            return None
+
+        rank = quantile * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return None
+
+    def export(self) -> dict:
+        buckets = {}
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            buckets[f"{bound:g}"] = seen
+        buckets["+Inf"] = self.count
+
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": buckets,
+            "quantiles": {f"{quantile:g}": self.quantile(quantile)
+                          for quantile in QUANTILES},
+        }
+
+
+class Metrics():
+    """
+    Counters of the render service, updated by the request threads. The
+    queue depth is the number of accepted requests waiting for a worker,
+    latency is measured from accepting a request to its response and render
+    time inside the worker.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.workers = workers
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.rejected = 0
+        # status of the response: count
+        self.responses = {}
+        self.latency = Histogram()
+        self.render = Histogram()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def received(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def reject(self):
+        """A received request was refused, the queue being full."""
+        with self.lock:
+            self.in_flight -= 1
+            self.rejected += 1
+            self.responses[503] = self.responses.get(503, 0) + 1
+
+    def finished(self, status: int, latency: float,
+                 render: Optional[float] = None,
+                 cache_hit: Optional[bool] = None):
+        with self.lock:
+            self.in_flight -= 1
+            self.responses[status] = self.responses.get(status, 0) + 1
+            self.latency.observe(latency)
+
+            if render is not None:
+                self.render.observe(render)
+            if cache_hit is True:
+                self.cache_hits += 1
+            elif cache_hit is False:
+                self.cache_misses += 1
+
+    def export(self) -> dict:
+        with self.lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "uptime": time.time() - self.started,
+                "workers": self.workers,
+                "queue": {
+                    "depth": max(self.in_flight - self.workers, 0),
+                    "capacity": self.queue_size,
+                    "in_flight": self.in_flight,
+                    "rejected": self.rejected,
+                },
+                "responses": {str(status): count for status, count
+                              in sorted(self.responses.items())},
+                "latency": self.latency.export(),
+                "render": self.render.export(),
+                "cache": {
+                    "hits": self.cache_hits,
+                    "misses": self.cache_misses,
+                    "hit_rate": self.cache_hits / lookups if lookups
+                    else None,
+                },
+            }
@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+from multiprocessing import Pool, TimeoutError as PoolTimeout
+from typing import Optional, Union
+from output.writer import ImageWriter
+from runtime.exceptions import LimitExceeded
+from runtime.interpreter import ENGINES, Interpreter
+from runtime.limits import Limits
+from runtime.program_cache import ProgramCache
+
+OUTPUTS = ("png", "display-list")
+
+# rasterizers a worker draws PNGs with, the tiled one writes files
+POOL_RASTERIZERS = ("pillow", "numpy")
+
+# rendered once by every worker, so Pillow, its PNG encoder and every
+# engine are loaded before the first request
+WARMUP_PROGRAM = "\n".join([
+    "SIZE 8,8",
+    "INT i",
+    "WHILE 2 - i",
+    "   LINE black, 0, 0, 7, 7, 1",
+    "   RECT red, 1, 1, 3, 3, 0",
+    "   OVAL blue, 2, 2, 4, 4, 1",
+    "   i = i + 1",
+    "LOOP",
+]) + "\n"
+
+# state of a render worker, set once per process by warm_worker
+worker = None
+
+
+class QueueFull(Exception):
+    pass
+
+
+def warm_worker(cache: Union[bool, str, None], compression: Optional[int]):
+    """
+    Initializes a pool process: opens the compiled program cache, which is
+    on disk and so shared by all workers, and renders the warm-up program
+    with every engine.
+    """
+    global worker
+
+    worker = {
+        "cache": ProgramCache(cache) if cache is not False else False,
+        "writer": ImageWriter("png", compression),
+    }
+
+    for engine in ENGINES:
+        image = Interpreter(WARMUP_PROGRAM, engine, cache=False).run()
+        worker["writer"].encode(image)
+
+    Interpreter(WARMUP_PROGRAM, rasterizer="tiled",
+                cache=False).record_display_list()
+
+
+def render_job(job: tuple) -> dict:
+    """
+    Renders one request in a pool process. The result holds the response
+    body and its content type, or the error, with the time spent and
+    whether the program came from the cache.
+    """
+    source, output, engine, optimize, rasterizer, palette, limits = job
+    cache = worker["cache"]
+    hits = cache.hits if cache else 0
+    start = time.perf_counter()
+    result = {"worker": os.getpid()}
+
+    try:
+        if output == "display-list":
+            interpreter = Interpreter(source, engine, optimize,
+                                      rasterizer="tiled", palette=palette,
+                                      cache=cache, limits=limits)
+            width, height, display_list = interpreter.record_display_list()
+            result["body"] = json.dumps({
+                "width": width,
+                "height": height,
+                "primitives": display_list.export(),
+            }).encode()
+            result["content_type"] = "application/json"
+        else:
+            interpreter = Interpreter(source, engine, optimize,
+                                      rasterizer=rasterizer, palette=palette,
+                                      cache=cache, limits=limits)
+            result["body"] = worker["writer"].encode(interpreter.run())
+            result["content_type"] = "image/png"
+        result["status"] = "ok"
+    except LimitExceeded as e:
+        result["status"] = "limit"
+        result["error"] = str(e)
+        result["limit"] = {"limit": e.limit, "value": e.value,
+                           "line": e.line}
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e) or e.__class__.__name__
+
+    result["seconds"] = time.perf_counter() - start
+    result["cache_hit"] = cache.hits > hits if cache else None
+    return result
+
+
+class RenderPool():
+    """
+    Pre-warmed worker processes rendering TPV programs. At most `workers`
+    programs render at once and `queue_size` more wait for a worker, any
+    further request is refused with QueueFull instead of piling up. Jobs
+    whose request timed out count until they finish.
+    """
+
+    def __init__(self, workers: int, queue_size: int,
+                 cache: Union[bool, str, None] = None,
+                 compression: Optional[int] = None):
+        # fail here rather than in every worker
+        ImageWriter("png", compression).close()
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.pool = Pool(workers, initializer=warm_worker,
+                         initargs=(cache, compression))
+
+    def render(self, source: str, output: str = "png", engine: str = "tree",
+               optimize: bool = False, rasterizer: str = "pillow",
+               palette: bool = False, limits: Optional[Limits] = None,
+               timeout: Optional[float] = None) -> dict:
+        """
+        Renders on the next free worker, see `render_job` for the result.
+        Raises QueueFull when the queue is full and TimeoutError when no
+        result came within `timeout` seconds.
+        """
+        if output not in OUTPUTS:
+            raise Exception(f"Unknown output '{output}', "
+                            f"expected one of {', '.join(OUTPUTS)}")
+
+        if rasterizer not in POOL_RASTERIZERS:
+            raise Exception(f"Unknown rasterizer '{rasterizer}', "
+                            f"expected one of {', '.join(POOL_RASTERIZERS)}")
+
+        if not self.slots.acquire(blocking=False):
+            raise QueueFull(f"All {self.workers} worker(s) are busy and "
+                            f"{self.queue_size} request(s) are queued")
+
+        def release(_):
+            self.slots.release()
+
+        # the slot is given back when the job ends, a job that timed out
+        # still holds a worker or a place in the pool's queue
+        try:
+            pending = self.pool.apply_async(render_job, ((
+                source, output, engine, optimize, rasterizer, palette,
+                limits),), callback=release, error_callback=release)
+        except Exception:
+            self.slots.release()
+            raise
+
+        try:
+            return pending.get(timeout)
+        except PoolTimeout:
+            raise TimeoutError(f"No result within {timeout:g}s")
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Renders a TPV program once for every binding of some of its variables,
+for parameter sweeps and animations. The variables are parameters: their
+INT declaration and constant assignments at the top level of the program
+are left out and the values come from the bindings instead.
+
+  sweep.py 09-lissajous.TPV --vary kx=1:30 -o lissajous.gif
+  sweep.py 46-spirala.tpv --vary delta=5,10,20 --vary s1=300:500:100 \\
+      -o frames/
+  sweep.py program.tpv --bindings frames.json -o program.apng
+
+Outputs ending in .gif or .apng are animations, any other output is a
+directory the frames are written into as numbered images.
+"""
+
+import os
+import sys
+import time
+from main import positive_int
+from output.writer import FORMATS
+from runtime.interpreter import ENGINES
+from runtime.enviroment import RASTERIZERS
+from runtime.sweep import ANIMATION_FORMATS, Sweep, load_bindings, vary
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('path', help='Program to render')
+    parser.add_argument('--vary', action='append', default=[],
+                        metavar='NAME=VALUES',
+                        help='Values of a parameter, a list like 1,2,5 or '
+                             'start:stop:step\nwithout stop; every '
+                             'combination of the --vary options is a frame')
+    parser.add_argument('--bindings',
+                        help='JSON list of objects or CSV file, the '
+                             'parameters of one frame each')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Animation (.gif, .apng) or directory of the '
+                             'frames')
+    parser.add_argument('-j', '--jobs', type=positive_int,
+                        default=os.cpu_count() or 1,
+                        help='Processes rendering frames (default: number '
+                             'of CPUs)')
+    parser.add_argument('--engine', choices=ENGINES, default='tree',
+                        help='Execution engine (default: tree)')
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help='Run the optimization passes before execution')
+    parser.add_argument('--rasterizer',
+                        choices=[name for name in RASTERIZERS
+                                 if name != 'tiled'],
+                        default='pillow',
+                        help='Drawing backend (default: pillow)')
+    parser.add_argument('--palette', action='store_true',
+                        help='Draw on a one byte per pixel palette canvas')
+    parser.add_argument('--format', choices=FORMATS, default='png',
+                        help='Format of numbered frames (default: png)')
+    parser.add_argument('--compression', type=int,
+                        help='Compression level of numbered frames')
+    parser.add_argument('--duration', type=positive_int, default=40,
+                        help='Milliseconds per frame of animations '
+                             '(default: 40)')
+    parser.add_argument('--loop', type=int, default=0,
+                        help='Times animations repeat, 0 forever (default: '
+                             '0)')
+
+    args = parser.parse_args()
+
+    if not args.vary and args.bindings is None:
+        parser.error('give the frames with --vary or --bindings')
+
+    start = time.perf_counter()
+
+    try:
+        with open(args.path, 'r') as file:
+            source = file.read()
+
+        bindings = load_bindings(args.bindings) \
+            if args.bindings is not None else vary(args.vary)
+        sweep = Sweep(source, bindings, args.jobs, args.engine,
+                      args.optimize, args.rasterizer, args.palette)
+
+        extension = os.path.splitext(args.output)[1].lower()
+        if extension in ANIMATION_FORMATS:
+            if os.path.dirname(args.output):
+                os.makedirs(os.path.dirname(args.output), exist_ok=True)
+            sweep.write_animation(args.output, args.duration, args.loop)
+        else:
+            os.makedirs(args.output, exist_ok=True)
+            stem = os.path.splitext(os.path.basename(args.path))[0]
+            digits = len(str(len(bindings) - 1))
+            pattern = os.path.join(args.output, f'{stem}-{{:0{digits}d}}'
+                                                f'{FORMATS[args.format][0]}')
+            sweep.write_frames(pattern, args.format, args.compression)
+    except Exception as e:
+        print(f'Could not render {args.path}: {e}')
+        return 1
+
+    print(f'Rendered {len(bindings)} frame(s) into {args.output} in '
+          f'{time.perf_counter() - start:.2f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+"""
+Runs the TPV examples under every engine and rasterizer, checks the images
+pixel by pixel against the reference PNGs next to the programs and records
+the time of every phase and the peak memory into a JSON results file.
+Compared to a baseline results file, runs that got slower or larger than the
+threshold are reported as regressions.
+"""
+
+import io
+import json
+import os
+import platform
+import signal
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PIL import Image, ImageChops  # noqa: E402
+from runtime.enviroment import RASTERIZERS  # noqa: E402
+from runtime.interpreter import ENGINES, Interpreter  # noqa: E402
+from runtime.profiler import Profiler  # noqa: E402
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', '..', 'examples')
+
+# rasterizers whose images may differ slightly from Pillow's, their
+# mismatches are reported but do not fail the run
+APPROXIMATE_RASTERIZERS = {'numpy'}
+
+# differences below this many seconds are noise
+MIN_SECONDS = 0.005
+
+
+def list_programs(path: str) -> list[str]:
+    if os.path.isfile(path):
+        return [path]
+
+    return sorted(os.path.join(path, filename)
+                  for filename in os.listdir(path)
+                  if filename.lower().endswith('.tpv'))
+
+
+def available_rasterizers() -> list[str]:
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return [name for name in RASTERIZERS if name != 'numpy']
+
+    return list(RASTERIZERS)
+
+
+def reference_image(filename: str) -> str:
+    """The PNG next to the program, its extension in any case."""
+    base = os.path.splitext(filename)[0]
+
+    for extension in ('.png', '.PNG'):
+        if os.path.exists(base + extension):
+            return base + extension
+
+    return base + '.png'
+
+
+def render(source: str, engine: str, rasterizer: str,
+           profiler: Profiler) -> Image.Image:
+    """Renders and encodes the program as main.py does, timing the phases."""
+    interpreter = Interpreter(source, engine, rasterizer=rasterizer,
+                              cache=False, profiler=profiler)
+
+    if rasterizer == 'tiled':
+        descriptor, path = tempfile.mkstemp(suffix='.png')
+        os.close(descriptor)
+        try:
+            interpreter.render_tiled(path)
+            image = Image.open(path)
+            image.load()
+        finally:
+            os.remove(path)
+        return image
+
+    image = interpreter.run()
+    with profiler.phase('encode'):
+        image.save(io.BytesIO(), 'PNG')
+
+    return image
+
+
+def differing_pixels(image: Image.Image, reference: Image.Image) -> int:
+    if image.size != reference.size:
+        return max(image.width * image.height,
+                   reference.width * reference.height)
+
+    difference = ImageChops.difference(image.convert('RGB'),
+                                       reference.convert('RGB'))
+    if difference.getbbox() is None:
+        return 0
+
+    red, green, blue = difference.split()
+    mask = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+    return image.width * image.height - mask.histogram()[0]
+
+
+def peak_kb() -> int:
+    """Peak resident memory of this process in kilobytes."""
+    # kilobytes on Linux, bytes on macOS
+    scale = 1024 if sys.platform == 'darwin' else 1
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale
+
+
+def timeout_handler(signum, frame):
+    raise TimeoutError('timed out')
+
+
+def run_case(task: tuple) -> dict:
+    """
+    Runs one program in one configuration, in a fresh process so the peak
+    memory is its own.
+    """
+    filename, engine, rasterizer, repeat, timeout = task
+    result = {
+        'program': os.path.basename(filename),
+        'engine': engine,
+        'rasterizer': rasterizer,
+    }
+
+    if timeout and hasattr(signal, 'setitimer'):
+        signal.signal(signal.SIGALRM, timeout_handler)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        with open(filename, 'r') as file:
+            source = file.read()
+
+        best = None
+        for _ in range(repeat):
+            profiler = Profiler(detailed=False)
+            start = time.perf_counter()
+            image = render(source, engine, rasterizer, profiler)
+            seconds = time.perf_counter() - start
+
+            if best is None or seconds < best[0]:
+                best = (seconds, profiler.phases)
+    except TimeoutError:
+        result['status'] = 'timeout'
+        return result
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e) or e.__class__.__name__
+        return result
+    finally:
+        if timeout and hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    result['seconds'] = best[0]
+    result['phases'] = best[1]
+    if resource is not None:
+        result['peak_kb'] = peak_kb()
+
+    reference = reference_image(filename)
+    if not os.path.exists(reference):
+        result['status'] = 'no reference'
+        return result
+
+    with Image.open(reference) as expected:
+        result['differing_pixels'] = differing_pixels(image, expected)
+
+    if result['differing_pixels'] == 0:
+        result['status'] = 'ok'
+    elif rasterizer in APPROXIMATE_RASTERIZERS:
+        result['status'] = 'approximate'
+    else:
+        result['status'] = 'mismatch'
+
+    return result
+
+
+def compare_baseline(results: list[dict], baseline: list[dict],
+                     threshold: float) -> list[str]:
+    """Describes the runs that regressed since the baseline."""
+    previous = {(run['program'], run['engine'], run['rasterizer']): run
+                for run in baseline}
+    regressions = []
+
+    for run in results:
+        key = (run['program'], run['engine'], run['rasterizer'])
+        old = previous.get(key)
+        if old is None:
+            continue
+
+        name = '/'.join(key)
+        if old.get('status') in ('ok', 'approximate') and \
+                run['status'] != old['status']:
+            regressions.append(f'{name}: {old["status"]} -> '
+                               f'{run["status"]}')
+            continue
+
+        if 'seconds' in run and 'seconds' in old and \
+                run['seconds'] > old['seconds'] * (1 + threshold) and \
+                run['seconds'] - old['seconds'] > MIN_SECONDS:
+            regressions.append(f'{name}: {old["seconds"]:.4f}s -> '
+                               f'{run["seconds"]:.4f}s')
+
+        if 'peak_kb' in run and 'peak_kb' in old and \
+                run['peak_kb'] > old['peak_kb'] * (1 + threshold):
+            regressions.append(f'{name}: {old["peak_kb"]} KB -> '
+                               f'{run["peak_kb"]} KB')
+
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('path', nargs='?', default=EXAMPLES,
+                        help='Program or directory of programs (default: '
+                             'examples)')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES,
+                        default=list(ENGINES),
+                        help='Engines to run (default: all)')
+    parser.add_argument('--rasterizers', nargs='+', choices=RASTERIZERS,
+                        help='Rasterizers to run (default: all available)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Runs of every case, the fastest is kept '
+                             '(default: 1)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Cases run at once, more than one skews the '
+                             'timings (default: 1)')
+    parser.add_argument('--timeout', type=float,
+                        help='Seconds one case may take')
+    parser.add_argument('-o', '--output', default='benchmark.json',
+                        help='Results file (default: benchmark.json)')
+    parser.add_argument('--baseline',
+                        help='Results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown and memory growth over the '
+                             'baseline, 0.25 is 25%% (default: 0.25)')
+
+    args = parser.parse_args()
+
+    rasterizers = args.rasterizers or available_rasterizers()
+    tasks = [(filename, engine, rasterizer, max(args.repeat, 1), args.timeout)
+             for filename in list_programs(args.path)
+             for engine in args.engines
+             for rasterizer in rasterizers]
+
+    results = []
+    failed = 0
+    start = time.perf_counter()
+    print(f'{"program":<32} {"engine":<9}{"rasterizer":<11}{"seconds":>9}'
+          f'{"peak KB":>10}  status')
+
+    # a new process for every case, the peak memory is per process
+    with Pool(max(args.jobs, 1), maxtasksperchild=1) as pool:
+        for result in pool.imap(run_case, tasks, chunksize=1):
+            results.append(result)
+            if result['status'] not in ('ok', 'approximate'):
+                failed += 1
+
+            seconds = f'{result["seconds"]:.4f}' \
+                if 'seconds' in result else '-'
+            status = result['status']
+            if result.get('differing_pixels'):
+                status += f' ({result["differing_pixels"]} pixels)'
+            if 'error' in result:
+                status += f': {result["error"]}'
+
+            print(f'{result["program"]:<32} {result["engine"]:<9}'
+                  f'{result["rasterizer"]:<11}{seconds:>9}'
+                  f'{result.get("peak_kb", "-"):>10}  {status}')
+            sys.stdout.flush()
+
+    with open(args.output, 'w') as file:
+        json.dump({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }, file, indent=1)
+
+    print(f'{len(results) - failed} of {len(results)} run(s) passed in '
+          f'{time.perf_counter() - start:.2f}s, results in {args.output}')
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)['results']
+
+        regressions = compare_baseline(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'regression  {regression}')
+        print(f'{len(regressions)} regression(s) against {args.baseline}')
+
+    return 1 if failed or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
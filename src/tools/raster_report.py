@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""
+Renders TPV programs with the Pillow and the NumPy rasterizer and reports how
+many pixels differ between the two.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from runtime.interpreter import Interpreter  # noqa: E402
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def list_programs(path: str) -> list[str]:
+    if os.path.isfile(path):
+        return [path]
+
+    return sorted(os.path.join(path, filename)
+                  for filename in os.listdir(path)
+                  if filename.lower().endswith('.tpv'))
+
+
+def compare(source: str) -> tuple[float, int]:
+    """Percentage of differing pixels and the largest channel difference."""
+    pillow = np.asarray(Interpreter(source, 'closure').run(), dtype=np.int16)
+    numpy = np.asarray(Interpreter(source, 'closure', rasterizer='numpy')
+                       .run(), dtype=np.int16)
+
+    if pillow.shape != numpy.shape:
+        return 100.0, 255
+
+    difference = np.abs(pillow - numpy)
+    differing = np.count_nonzero(difference.any(axis=2))
+
+    return 100 * differing / max(differing, pillow.shape[0] *
+                                 pillow.shape[1], 1), int(difference.max())
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('path', help='Path to a file or directory')
+    parser.add_argument('--tolerance', type=float, default=1.0,
+                        help='Maximum percentage of differing pixels '
+                             '(default: 1.0)')
+
+    args = parser.parse_args()
+
+    if np is None:
+        print('The rasterizer report requires NumPy to be installed')
+        return 2
+
+    failed = 0
+    print(f'{"program":<36} {"differing":>10} {"max diff":>8}')
+
+    for filename in list_programs(args.path):
+        with open(filename, 'r') as file:
+            source = file.read()
+
+        try:
+            percentage, max_difference = compare(source)
+        except Exception as e:
+            print(f'{os.path.basename(filename):<36} error: {e}')
+            failed += 1
+            continue
+
+        status = 'ok' if percentage <= args.tolerance else 'FAIL'
+        if status == 'FAIL':
+            failed += 1
+
+        print(f'{os.path.basename(filename):<36} {percentage:>9.3f}% '
+              f'{max_difference:>8} {status}')
+
+    print(f'{failed} program(s) over {args.tolerance}% tolerance')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+"""
+Runs the synthetic workloads at growing sizes and measures the time of every
+phase and the peak memory of each run. The exponent of every phase between
+the two largest sizes shows which part stops scaling linearly: about 1 is
+linear, 2 quadratic. With matplotlib installed, time and memory against size
+are plotted for every workload.
+"""
+
+import json
+import math
+import os
+import signal
+import sys
+import time
+from multiprocessing import Pool
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from runtime.enviroment import RASTERIZERS  # noqa: E402
+from runtime.interpreter import ENGINES  # noqa: E402
+from runtime.profiler import Profiler  # noqa: E402
+from tools.benchmark import peak_kb, render, resource, \
+    timeout_handler  # noqa: E402
+from tools.workloads import WORKLOADS, generate  # noqa: E402
+
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot
+except ImportError:
+    pyplot = None
+
+PHASES = ('lex', 'parse', 'execute', 'rasterize', 'encode')
+
+
+def run_size(task: tuple) -> dict:
+    """Runs one workload at one size, in a fresh process."""
+    workload, size, engine, rasterizer, timeout = task
+    result = {'workload': workload, 'size': size}
+
+    if timeout and hasattr(signal, 'setitimer'):
+        signal.signal(signal.SIGALRM, timeout_handler)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        source = generate(workload, size)
+        result['source_bytes'] = len(source)
+
+        profiler = Profiler(detailed=False)
+        start = time.perf_counter()
+        render(source, engine, rasterizer, profiler)
+        result['seconds'] = time.perf_counter() - start
+        result['phases'] = profiler.phases
+        result['status'] = 'ok'
+    except TimeoutError:
+        result['status'] = 'timeout'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e) or e.__class__.__name__
+    finally:
+        if timeout and hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    if resource is not None:
+        result['peak_kb'] = peak_kb()
+
+    return result
+
+
+def exponent(small: dict, large: dict, value) -> Optional[float]:
+    """Slope of `value` against the size on a log-log scale."""
+    low, high = value(small), value(large)
+    if not low or not high or low <= 0 or high <= 0:
+        return None
+
+    return math.log(high / low) / math.log(large['size'] / small['size'])
+
+
+def exponents(runs: list[dict]) -> dict[str, Optional[float]]:
+    """Exponents between the two largest sizes that ran."""
+    finished = [run for run in runs if run['status'] == 'ok']
+    if len(finished) < 2:
+        return {}
+
+    small, large = finished[-2], finished[-1]
+    slopes = {'total': exponent(small, large, lambda run: run['seconds'])}
+
+    for phase in PHASES:
+        slopes[phase] = exponent(small, large,
+                                 lambda run: run['phases'].get(phase))
+
+    if 'peak_kb' in large:
+        slopes['memory'] = exponent(small, large, lambda run: run['peak_kb'])
+
+    return slopes
+
+
+def plot(workload: str, runs: list[dict], path: str):
+    finished = [run for run in runs if run['status'] == 'ok']
+    sizes = [run['size'] for run in finished]
+
+    figure, (times, memory) = pyplot.subplots(1, 2, figsize=(11, 4.5))
+    figure.suptitle(f'{workload} workload')
+
+    for phase in PHASES:
+        seconds = [run['phases'].get(phase, 0) for run in finished]
+        if any(seconds):
+            times.plot(sizes, seconds, marker='o', label=phase)
+    times.plot(sizes, [run['seconds'] for run in finished], marker='o',
+               color='black', label='total')
+    times.set_xscale('log')
+    times.set_yscale('log')
+    times.set_xlabel('size')
+    times.set_ylabel('seconds')
+    times.legend()
+
+    if all('peak_kb' in run for run in finished):
+        memory.plot(sizes, [run['peak_kb'] / 1024 for run in finished],
+                    marker='o')
+    memory.set_xscale('log')
+    memory.set_xlabel('size')
+    memory.set_ylabel('peak memory (MB)')
+
+    figure.tight_layout()
+    figure.savefig(path)
+    pyplot.close(figure)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('workloads', nargs='*',
+                        help=f'Workloads to run, of {", ".join(WORKLOADS)} '
+                             f'(default: all)')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        help='Sizes to run instead of the defaults of each '
+                             'workload')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Factor of the default sizes (default: 1)')
+    parser.add_argument('--engine', choices=ENGINES, default='tree',
+                        help='Execution engine (default: tree)')
+    parser.add_argument('--rasterizer', choices=RASTERIZERS,
+                        default='pillow',
+                        help='Drawing backend (default: pillow)')
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='Seconds one run may take, larger sizes of a '
+                             'workload are skipped after it (default: 60)')
+    parser.add_argument('-o', '--output', default='scaling',
+                        help='Directory of the results and plots (default: '
+                             'scaling)')
+
+    args = parser.parse_args()
+
+    for workload in args.workloads:
+        if workload not in WORKLOADS:
+            parser.error(f'unknown workload {workload}')
+
+    os.makedirs(args.output, exist_ok=True)
+    results = {}
+
+    for workload in args.workloads or WORKLOADS:
+        sizes = args.sizes or [max(int(size * args.scale), 1)
+                               for size in WORKLOADS[workload][1]]
+        runs = []
+
+        print(f'{workload}')
+        print(f'  {"size":>10}{"seconds":>10}{"peak KB":>10}  '
+              + ''.join(f'{phase:>10}' for phase in PHASES))
+
+        # a new process for every size, the peak memory is per process
+        with Pool(1, maxtasksperchild=1) as pool:
+            for size in sizes:
+                run = pool.apply(run_size, ((workload, size, args.engine,
+                                             args.rasterizer,
+                                             args.timeout),))
+                runs.append(run)
+
+                if run['status'] != 'ok':
+                    print(f'  {size:>10}  {run["status"]} '
+                          f'{run.get("error", "")}'.rstrip())
+                    break
+
+                phases = ''.join(f'{run["phases"].get(phase, 0):>10.4f}'
+                                 for phase in PHASES)
+                print(f'  {size:>10}{run["seconds"]:>10.4f}'
+                      f'{run.get("peak_kb", "-"):>10}  {phases}')
+                sys.stdout.flush()
+
+        slopes = exponents(runs)
+        if slopes:
+            print('  exponents ' + ', '.join(
+                f'{name} {slope:.2f}' for name, slope in slopes.items()
+                if slope is not None))
+
+        results[workload] = {'runs': runs, 'exponents': slopes}
+
+        if pyplot is not None and len(runs) > 1:
+            plot(workload, runs, os.path.join(args.output,
+                                              f'{workload}.png'))
+
+    path = os.path.join(args.output, 'scaling.json')
+    with open(path, 'w') as file:
+        json.dump({
+            'engine': args.engine,
+            'rasterizer': args.rasterizer,
+            'results': results,
+        }, file, indent=1)
+
+    print(f'Results in {path}')
+    if pyplot is None:
+        print('Install matplotlib to plot them')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
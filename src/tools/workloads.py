@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+"""
+Generates synthetic TPV programs that stress one part of the interpreter
+each, scaled by a size parameter:
+
+  loop        a WHILE loop of `size` iterations
+  recursion   a procedure recursing `size` calls deep
+  stack       `size` PUSHes followed by as many POPs
+  procedures  `size` procedures, each called once
+  source      a straight line program of `size` statements
+  primitives  `size` lines, rects and ovals over the canvas
+"""
+
+import os
+import sys
+
+SIZE = "SIZE 800,600"
+
+COLORS = ("black", "red", "green", "blue", "orange", "magenta", "gold")
+
+
+def loop(size: int) -> str:
+    return "\n".join([
+        SIZE,
+        "INT i, a, b",
+        f"WHILE {size} - i",
+        "   a = a + i * 2 - b / 4",
+        "   b = (a - b) / 2 + 1",
+        "   i = i + 1",
+        "LOOP",
+        "LINE black, 0, 0, 799, 599, 1",
+    ])
+
+
+def recursion(size: int) -> str:
+    return "\n".join([
+        SIZE,
+        "INT d, x",
+        f"d = {size}",
+        "CALL descend",
+        "LINE black, 0, 0, 799, 599, 1",
+        "STOP",
+        "",
+        "PROCEDURE descend",
+        "d = d - 1",
+        "x = x + 1",
+        "IF d",
+        "   CALL descend",
+        "ENDIF",
+        "RETURN",
+    ])
+
+
+def stack(size: int) -> str:
+    return "\n".join([
+        SIZE,
+        "INT top, i, x1, y1, x2, y2",
+        f"WHILE {size} - i",
+        "   PUSH i, i * 2, i + 1, i * 3",
+        "   i = i + 1",
+        "LOOP",
+        "WHILE top",
+        "   POP y2, x2, y1, x1",
+        "LOOP",
+        "LINE black, 0, 0, 799, 599, 1",
+    ])
+
+
+def procedures(size: int) -> str:
+    lines = [SIZE, "INT x"]
+    lines += [f"CALL p{index}" for index in range(size)]
+    lines += ["LINE black, 0, 0, 799, 599, 1", "STOP", ""]
+
+    for index in range(size):
+        lines += [f"PROCEDURE p{index}", f"x = x + {index} * 2 - 1",
+                  "RETURN"]
+
+    return "\n".join(lines)
+
+
+def source(size: int) -> str:
+    lines = [SIZE, "INT a, b, c"]
+
+    for index in range(size):
+        if index % 50 == 0:
+            lines.append(f"REM statements {index} to {index + 49}")
+
+        if index % 2:
+            lines.append("b = a - b")
+        else:
+            lines.append(f"a = (b + {index}) * 3 - c / {index % 7 + 1} + "
+                         f"sin({index})")
+
+    lines.append("LINE black, 0, 0, 799, 599, 1")
+    return "\n".join(lines)
+
+
+def primitives(size: int) -> str:
+    lines = [SIZE, "INT i, x, y"]
+    count = -(-size // 3)
+
+    lines += [
+        f"WHILE {count} - i",
+        "   x = 380 + sin(i * 7) * 370",
+        "   y = 280 + cos(i * 11) * 270",
+    ]
+    for index, kind in enumerate(("LINE", "RECT", "OVAL")):
+        color = COLORS[index % len(COLORS)]
+        lines.append(f"   {kind} {color}, x, y, 40, {10 + index * 10}, "
+                     f"{index + 1}")
+    lines += ["   i = i + 1", "LOOP"]
+
+    return "\n".join(lines)
+
+
+# name: generator, sizes the scaling runner goes through by default
+WORKLOADS = {
+    "loop": (loop, [10000, 30000, 100000, 300000, 1000000]),
+    "recursion": (recursion, [1000, 3000, 10000, 30000, 100000]),
+    "stack": (stack, [10000, 30000, 100000, 300000, 1000000]),
+    "procedures": (procedures, [100, 300, 1000, 3000, 10000]),
+    "source": (source, [1000, 3000, 10000, 30000, 100000]),
+    "primitives": (primitives, [1000, 3000, 10000, 30000, 100000]),
+}
+
+
+def generate(workload: str, size: int) -> str:
+    if workload not in WORKLOADS:
+        raise Exception(f"Unknown workload '{workload}', "
+                        f"expected one of {', '.join(WORKLOADS)}")
+
+    return WORKLOADS[workload][0](size) + "\n"
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('workload', choices=WORKLOADS,
+                        help='Kind of program')
+    parser.add_argument('size', type=int, help='Size of the program')
+    parser.add_argument('-o', '--output',
+                        help='File to write (default: standard output)')
+
+    args = parser.parse_args()
+
+    program = generate(args.workload, args.size)
+
+    if args.output is None:
+        sys.stdout.write(program)
+        return 0
+
+    with open(args.output, 'w') as file:
+        file.write(program)
+
+    print(f'Wrote {os.path.getsize(args.output)} bytes to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
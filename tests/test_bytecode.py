@@ -0,0 +1,29 @@
+import struct
+import pytest
+from frontend.parser import Parser
+from runtime.bytecode import MAGIC, VERSION, Bytecode, BytecodeCompiler
+
+SOURCE = "size 10,10\nint x\nx = 4\nline red, x, 0, x, 9, 1\n"
+
+
+def compiled() -> Bytecode:
+    return BytecodeCompiler().compile(Parser(SOURCE).parse())
+
+
+def test_round_trip():
+    bytecode = compiled()
+    loaded = Bytecode.from_bytes(bytecode.to_bytes())
+
+    assert loaded.code == bytecode.code
+    assert loaded.names == bytecode.names
+    assert loaded.checks == bytecode.checks
+
+
+@pytest.mark.parametrize("version", [1, 2, VERSION + 1])
+def test_other_versions_are_rejected(version):
+    data = compiled().to_bytes()
+    data = MAGIC + struct.pack("<I", version) + data[8:]
+
+    with pytest.raises(Exception,
+                       match=f"Unsupported bytecode version {version}"):
+        Bytecode.from_bytes(data)
@@ -0,0 +1,55 @@
+import pytest
+from runtime.interpreter import ENGINES, Interpreter
+
+ASSIGNED_BEFORE_DECLARED = """size 10,10
+x = 5
+int x
+"""
+
+READ_BEFORE_DECLARED = """size 10,10
+int y
+y = x
+int x
+"""
+
+POPPED_BEFORE_DECLARED = """size 10,10
+push 1
+pop x
+int x
+"""
+
+DECLARED_IN_UNTAKEN_IF = """size 10,10
+if 0
+  int x
+endif
+x = 5
+"""
+
+DECLARED_IN_PROCEDURE = """size 10,10
+x = 5
+call declare
+stop
+
+procedure declare
+int x
+return
+"""
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("source", [
+    ASSIGNED_BEFORE_DECLARED, READ_BEFORE_DECLARED, POPPED_BEFORE_DECLARED,
+    DECLARED_IN_UNTAKEN_IF, DECLARED_IN_PROCEDURE])
+def test_undeclared_variable_fails(engine, optimize, source):
+    with pytest.raises(Exception, match="Variable 'x' not found"):
+        Interpreter(source, engine, optimize, cache=False).run()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_declared_variable_runs(engine):
+    source = "size 10,10\nint x\nif 1\n  int y\nendif\nx = 2\ny = x\n"
+    interpreter = Interpreter(source, engine, cache=False)
+    interpreter.run()
+
+    assert interpreter.enviroment.vars["y"] == 2
@@ -0,0 +1,62 @@
+import pytest
+from PIL import Image
+from runtime.display_list import DisplayList, LINE
+from runtime.interpreter import Interpreter
+
+# thin axis aligned lines just past every edge of the canvas
+OFF_CANVAS_LINES = """size 10,10
+line gray, 3, -1, 3, -5, 1
+line gray, -1, 4, -6, 4, 1
+line gray, 12, 4, 16, 4, 1
+line gray, 4, 12, 4, 16, 1
+line gray, 2, 10, 2, 14, 1
+line gray, 2, 2, 7, 2, 1
+"""
+
+
+def test_clip_misses_interval_outside_canvas():
+    display_list = DisplayList()
+
+    assert display_list.clip(-1, -5, 10) is None
+    assert display_list.clip(10, 14, 10) is None
+    assert display_list.clip(-3, 4, 10) == (0, 4)
+    assert display_list.clip(12, 5, 10) == (9, 5)
+
+
+def test_cull_drops_thin_lines_off_canvas():
+    display_list = DisplayList()
+    display_list.append(LINE, "gray", 3, -1, 3, -5, 1)
+    display_list.append(LINE, "gray", 3, 2, 3, 14, 1)
+    display_list.cull(10, 10)
+
+    assert [tuple(item) for item in display_list.primitives()] == \
+        [(LINE, 0, 3, 2, 3, 9, 1)]
+
+
+def test_cull_keeps_negative_width_lines_whole():
+    display_list = DisplayList()
+    display_list.append(LINE, "green", 0, 2, -1, 2, -1)
+    display_list.cull(10, 10)
+
+    assert [tuple(item) for item in display_list.primitives()] == \
+        [(LINE, 0, 0, 2, -1, 2, -1)]
+
+
+@pytest.mark.parametrize("options", [{"record": True},
+                                     {"rasterizer": "numpy"}])
+def test_recorded_lines_off_canvas_draw_nothing(options):
+    expected = Interpreter(OFF_CANVAS_LINES, cache=False).run()
+    image = Interpreter(OFF_CANVAS_LINES, cache=False, **options).run()
+
+    assert image.tobytes() == expected.tobytes()
+
+
+def test_tiled_lines_off_canvas_draw_nothing(tmp_path):
+    expected = Interpreter(OFF_CANVAS_LINES, cache=False).run()
+    path = str(tmp_path / "lines.png")
+    Interpreter(OFF_CANVAS_LINES, cache=False,
+                rasterizer="tiled").render_tiled(path, tile_size=4)
+
+    with Image.open(path) as image:
+        assert image.convert("RGB").tobytes() == \
+            expected.convert("RGB").tobytes()
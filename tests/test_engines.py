@@ -0,0 +1,169 @@
+import functools
+import itertools
+import os
+import pytest
+from PIL import Image
+from runtime.interpreter import ENGINES, Interpreter
+
+np = pytest.importorskip("numpy")
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+EXAMPLES = sorted(filename for filename in os.listdir(EXAMPLES_DIR)
+                  if filename.lower().endswith(".tpv"))
+
+# programs that once rendered differently on some engine or rasterizer
+EDGE_CASES = {
+    "off_canvas_lines": """size 10,10
+line gray, 3, -1, 3, -5, 1
+line gray, -1, 4, -6, 4, 1
+line gray, 12, 4, 16, 4, 1
+line gray, 4, 12, 4, 16, 1
+line gray, 2, 10, 2, 14, 1
+line gray, 2, 2, 7, 2, 1
+""",
+    "negative_width_lines": """size 10,10
+line green, 0, 2, -1, 2, -1
+line green, 3, 12, 3, 5, -1
+line red, 2, 2, 7, 2, -2
+line blue, 1, 1, 8, 6, -1
+""",
+    "short_outline_rects": """size 30,30
+rect blue, 5, 22, 22, 0, 1
+rect red, 3, 4, 0, 9, 5
+rect blue, 8, 21, 14, 2, 3
+rect green, 22, 14, 1, 20, 5
+rect blue, 26, -2, 0, 3, 8
+""",
+    "conditional_write": """size 10,10
+int a, x
+a = 0
+x = 5
+call p
+x = 7
+call p
+line red, x, 0, x, 9, 1
+stop
+procedure p
+if a
+  x = 1
+endif
+return
+""",
+    "declared_in_taken_if": """size 10,10
+int x
+if 1
+  int y
+endif
+x = 2
+y = x
+line red, y, 0, y, 9, 1
+""",
+}
+
+# programs that must fail the same way everywhere
+FAILING = {
+    "color_operand": ("""size 10,10
+int c, x
+c = red
+x = c * 1
+line blue, x, 0, x, 9, 1
+""", "non-numeric values"),
+    "popped_color_operand": ("""size 10,10
+int c, x
+push red
+pop c
+x = c + 1
+""", "non-numeric values"),
+    "assigned_before_declared": ("""size 10,10
+x = 5
+int x
+""", "Variable 'x' not found"),
+    "declared_in_untaken_if": ("""size 10,10
+if 0
+  int x
+endif
+x = 5
+""", "Variable 'x' not found"),
+}
+
+OPTIONS = {
+    "plain": {},
+    "optimize": {"optimize": True},
+    "record": {"record": True},
+    "palette": {"palette": True},
+    "numpy": {"rasterizer": "numpy"},
+    "tiled": {"rasterizer": "tiled"},
+    "memoize": {"memoize": True},
+    "fast": {"fast": True},
+}
+
+# procedure memoization only runs on the tree engine
+CONFIGURATIONS = [(engine, option) for engine, option
+                  in itertools.product(ENGINES, OPTIONS)
+                  if option != "memoize" or engine == "tree"]
+
+# the numpy rasterizer approximates ovals, at most this many percent of the
+# pixels may differ, as in tools/raster_report.py
+OVAL_TOLERANCE = 1.0
+
+
+def example_source(name: str) -> str:
+    with open(os.path.join(EXAMPLES_DIR, name), "r") as file:
+        return file.read()
+
+
+def render(source: str, engine: str, options: dict, directory) -> np.ndarray:
+    interpreter = Interpreter(source, engine, cache=False, **options)
+
+    if options.get("rasterizer") == "tiled":
+        path = os.path.join(directory, "tiled.png")
+        interpreter.render_tiled(path)
+        image = Image.open(path)
+    else:
+        image = interpreter.run()
+
+    return np.asarray(image.convert("RGB"))
+
+
+@functools.lru_cache(maxsize=None)
+def baseline(source: str) -> np.ndarray:
+    """The image of the tree engine drawing with Pillow."""
+    return render(source, "tree", {}, None)
+
+
+def assert_matches_baseline(source: str, engine: str, option: str,
+                            directory):
+    options = OPTIONS[option]
+    expected = baseline(source)
+    image = render(source, engine, options, directory)
+
+    assert image.shape == expected.shape
+
+    differing = np.count_nonzero((image != expected).any(axis=2))
+    if options.get("rasterizer") == "numpy" and "oval" in source.lower():
+        pixels = expected.shape[0] * expected.shape[1]
+        assert 100 * differing / pixels <= OVAL_TOLERANCE
+    else:
+        assert differing == 0
+
+
+@pytest.mark.parametrize("engine, option", CONFIGURATIONS)
+@pytest.mark.parametrize("name", EXAMPLES)
+def test_example_matches_baseline(name, engine, option, tmp_path):
+    assert_matches_baseline(example_source(name), engine, option, tmp_path)
+
+
+@pytest.mark.parametrize("engine, option", CONFIGURATIONS)
+@pytest.mark.parametrize("name", list(EDGE_CASES))
+def test_edge_case_matches_baseline(name, engine, option, tmp_path):
+    assert_matches_baseline(EDGE_CASES[name], engine, option, tmp_path)
+
+
+@pytest.mark.parametrize("engine, option", CONFIGURATIONS)
+@pytest.mark.parametrize("name", list(FAILING))
+def test_failing_program_fails_everywhere(name, engine, option, tmp_path):
+    source, message = FAILING[name]
+
+    with pytest.raises(Exception, match=message):
+        render(source, engine, OPTIONS[option], tmp_path)
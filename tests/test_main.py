@@ -0,0 +1,27 @@
+import sys
+from PIL import Image
+import main
+
+
+def run_main(monkeypatch, *args) -> int:
+    monkeypatch.setattr(sys, "argv", ["main.py", *args])
+    monkeypatch.setattr(Image.Image, "show", lambda self: None)
+    return main.main()
+
+
+def test_check_does_not_update_incremental_manifest(monkeypatch, tmp_path):
+    program = tmp_path / "program.tpv"
+    program.write_text("size 80,60\nline red, 0, 0, 79, 59, 1\n")
+    output = tmp_path / "program.png"
+
+    run_main(monkeypatch, str(tmp_path), "--incremental", "--no-cache")
+    with Image.open(output) as image:
+        assert image.size == (80, 60)
+
+    program.write_text("size 40,30\nline red, 0, 0, 39, 29, 1\n")
+    run_main(monkeypatch, str(tmp_path), "--check", "--incremental",
+             "--no-cache")
+    run_main(monkeypatch, str(tmp_path), "--incremental", "--no-cache")
+
+    with Image.open(output) as image:
+        assert image.size == (40, 30)
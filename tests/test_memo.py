@@ -0,0 +1,65 @@
+from runtime.interpreter import Interpreter
+
+CONDITIONAL_WRITE = """size 10,10
+int a, x
+a = 0
+x = 5
+call p
+x = 7
+call p
+line red, x, 0, x, 9, 1
+stop
+procedure p
+if a
+  x = 1
+endif
+return
+"""
+
+REPEATED_CALLS = """size 60,60
+int x,y,k
+k=3
+while k
+  y=0
+  while 60-y
+    x=k*10
+    call tile
+    y=y+20
+  loop
+  k=k-1
+loop
+stop
+procedure tile
+call dot
+call dot
+rect blue,x,y,20,20,1
+return
+procedure dot
+oval red,x+5,y+5,10,10,2
+push x
+return
+"""
+
+
+def render(source: str, **options):
+    interpreter = Interpreter(source, cache=False, **options)
+    return interpreter, interpreter.run()
+
+
+def test_conditional_write_is_not_replayed_stale():
+    baseline, expected = render(CONDITIONAL_WRITE)
+    memoized, image = render(CONDITIONAL_WRITE, memoize=True)
+
+    assert memoized.enviroment.vars["x"] == 7
+    assert memoized.enviroment.vars == baseline.enviroment.vars
+    assert image.tobytes() == expected.tobytes()
+
+
+def test_replayed_calls_match_running_them():
+    baseline, expected = render(REPEATED_CALLS)
+    memoized, image = render(REPEATED_CALLS, memoize=True)
+
+    assert memoized.memo.hits > 0
+    assert image.tobytes() == expected.tobytes()
+    assert memoized.enviroment.vars == baseline.enviroment.vars
+    assert memoized.enviroment.stack == baseline.enviroment.stack
@@ -0,0 +1,46 @@
+import itertools
+import pytest
+from runtime.interpreter import Interpreter
+
+np = pytest.importorskip("numpy")
+
+# x, y, width, height of rects at and around the sizes where the sides of
+# an outline overlap
+BOXES = [(5, 22, 22, 0), (5, 5, 0, 0), (3, 4, 0, 9), (8, 21, 14, 2),
+         (22, 14, 1, 20), (26, -2, 0, 3), (-3, 10, 4, 4), (9, 7, 3, 2),
+         (20, 16, 10, 10)]
+
+THICKNESSES = [-3, -1, 0, 1, 2, 3, 5, 8]
+
+
+def render(source: str, **kwargs):
+    image = Interpreter(source, "closure", cache=False, **kwargs).run()
+    return np.asarray(image.convert("RGB"))
+
+
+@pytest.mark.parametrize("box, thickness",
+                         list(itertools.product(BOXES, THICKNESSES)))
+def test_rect_matches_pillow(box, thickness):
+    x, y, width, height = box
+    source = f"size 30,30\nrect blue, {x}, {y}, {width}, {height}, " \
+        f"{thickness}\n"
+
+    assert np.array_equal(render(source), render(source, rasterizer="numpy"))
+
+
+def test_rect_batch_matches_pillow():
+    source = "size 30,30\n" + "".join(
+        f"rect red, {x}, {y}, {width}, {height}, 3\n"
+        for x, y, width, height in BOXES)
+
+    assert np.array_equal(render(source),
+                          render(source, rasterizer="numpy", palette=True))
+
+
+@pytest.mark.parametrize("shape", ["rect", "oval", "line"])
+@pytest.mark.parametrize("thickness", [-1, -2, -5])
+def test_negative_width_matches_pillow(shape, thickness):
+    source = f"size 20,20\n{shape} blue, 3, 4, 10, 8, {thickness}\n" \
+        f"{shape} red, 0, 2, 6, 0, {thickness}\n"
+
+    assert np.array_equal(render(source), render(source, rasterizer="numpy"))
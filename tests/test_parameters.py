@@ -0,0 +1,40 @@
+from runtime.interpreter import Interpreter
+
+REASSIGNED = """size 10,10
+int x
+x = 5
+line red, x, 0, x, 9, 1
+x = 0
+line blue, x, 0, x, 9, 1
+"""
+
+SET_BY_PROCEDURE = """size 10,10
+int x
+call setup
+x = 5
+line red, x, 0, x, 9, 1
+stop
+procedure setup
+x = 2
+return
+"""
+
+
+def render(source: str, **kwargs) -> bytes:
+    return Interpreter(source, cache=False, **kwargs).run().tobytes()
+
+
+def test_default_parameter_renders_like_program():
+    for source in (REASSIGNED, SET_BY_PROCEDURE):
+        assert render(source, parameters={"x": 5}) == render(source)
+
+
+def test_leading_assignment_is_replaced_by_parameter():
+    expected = render(REASSIGNED.replace("x = 5", "x = 3"))
+
+    assert render(REASSIGNED, parameters={"x": 3}) == expected
+
+
+def test_assignment_after_use_is_kept():
+    assert render(SET_BY_PROCEDURE, parameters={"x": 3}) == \
+        render(SET_BY_PROCEDURE)
@@ -0,0 +1,33 @@
+import time
+import pytest
+from service.render_pool import QueueFull, RenderPool
+
+# takes about a second on the tree engine
+SLOW_PROGRAM = "size 10,10\nint i\nwhile 100000 - i\ni = i + 1\nloop\n"
+
+QUICK_PROGRAM = "size 10,10\nline red, 0, 0, 9, 9, 1\n"
+
+
+def test_timed_out_job_counts_against_queue_size():
+    pool = RenderPool(1, 0, cache=False)
+
+    try:
+        with pytest.raises(TimeoutError):
+            pool.render(SLOW_PROGRAM, timeout=0.1)
+
+        # the slow job still runs on the only worker
+        with pytest.raises(QueueFull):
+            pool.render(QUICK_PROGRAM)
+
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                result = pool.render(QUICK_PROGRAM, timeout=30)
+                break
+            except QueueFull:
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+
+        assert result["status"] == "ok"
+    finally:
+        pool.close()
@@ -0,0 +1,40 @@
+import pytest
+from runtime.interpreter import ENGINES, Interpreter
+from runtime.transpiler import CODE_CACHE_SIZE, compile_source
+
+COLOR_VARIABLE = """size 10,10
+int c, x
+c = red
+x = c * 1
+line blue, x, 0, x, 9, 1
+"""
+
+POPPED_COLOR = """size 10,10
+int c, x
+push red
+pop c
+x = c + 1
+"""
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("source", [COLOR_VARIABLE, POPPED_COLOR])
+def test_arithmetic_on_color_variable_fails(engine, source):
+    with pytest.raises(Exception, match="non-numeric values"):
+        Interpreter(source, engine, cache=False).run()
+
+
+def test_numeric_operands_run():
+    source = "size 10,10\nint x\nx = 2\nx = x * 3 + sin(0) - top\n"
+    interpreter = Interpreter(source, "python", cache=False)
+    interpreter.run()
+
+    assert interpreter.enviroment.vars["x"] == 6
+
+
+def test_code_cache_is_bounded():
+    for index in range(CODE_CACHE_SIZE + 10):
+        Interpreter(f"size 10,10\nint x\nx = {index}\n", "python",
+                    cache=False).run()
+
+    assert compile_source.cache_info().currsize <= CODE_CACHE_SIZE